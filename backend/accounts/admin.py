@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import ApiToken
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'created_at', 'expires_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    search_fields = ['user__username__exact']
+    exclude = ['key_hash']
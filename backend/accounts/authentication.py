@@ -0,0 +1,96 @@
+"""
+Token authentication with an in-process cache.
+
+`Authorization: Token <key>` is checked by hashing the key with SHA-256
+and looking the digest up in a per-process LRU cache, falling back to one
+indexed query. Unlike BasicAuthentication there is no PBKDF2 work per
+request. Cached entries live for API_TOKEN_CACHE_TTL seconds, which bounds
+how long a token revoked by another worker, or a deactivated user, stays
+usable there.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from observability.metrics import record_cache_lookup
+
+from .models import ApiToken, hash_token
+
+KEYWORDS = (b'token', b'bearer')
+
+
+class TokenCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_hash):
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            token, cached_until = entry
+            if cached_until < time.monotonic() or token.expires_at <= timezone.now():
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+            return token
+
+    def set(self, key_hash, token, ttl):
+        with self._lock:
+            self._entries[key_hash] = (token, time.monotonic() + ttl)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key_hash):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.API_TOKEN_CACHE_SIZE)
+
+
+class HashedTokenAuthentication(BaseAuthentication):
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0].lower() not in KEYWORDS:
+            return None
+        if len(parts) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            raw = parts[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        key_hash = hash_token(raw)
+        token = token_cache.get(key_hash)
+        record_cache_lookup('auth_token', token is not None)
+        if token is None:
+            token = (
+                ApiToken.objects
+                .select_related('user')
+                .filter(key_hash=key_hash, expires_at__gt=timezone.now())
+                .first()
+            )
+            if token is None:
+                raise exceptions.AuthenticationFailed('Invalid or expired token.')
+            token_cache.set(key_hash, token, settings.API_TOKEN_CACHE_TTL)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # Cached tokens are shared between threads; hand each request its own user.
+        return copy.copy(token.user), token
+
+    def authenticate_header(self, request):
+        return 'Token'
@@ -0,0 +1,36 @@
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+def hash_token(raw):
+    # Tokens are 256 random bits, so a plain digest is enough; a slow
+    # password hash here would bring back the per-request cost.
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ApiToken(models.Model):
+    """An API token. Only its SHA-256 is stored; the raw value is shown once, at login."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='api_tokens',
+    )
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Token for {self.user_id} until {self.expires_at}"
+
+    @classmethod
+    def issue(cls, user, lifetime):
+        """Create a token for `user`; returns `(token, raw_key)`."""
+        raw = secrets.token_urlsafe(32)
+        token = cls.objects.create(
+            user=user, key_hash=hash_token(raw), expires_at=timezone.now() + lifetime
+        )
+        return token, raw
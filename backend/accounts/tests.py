@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from posts import throttling
+from posts.models import Post, PostLike
+
+from .authentication import token_cache
+from .models import ApiToken, hash_token
+
+User = get_user_model()
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        throttling.get_store().clear()
+        self.user = User.objects.create_user(username='fan', password='pass1234')
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='p')
+
+    def _login(self, password='pass1234'):
+        return self.client.post('/api/auth/token/', {'username': 'fan', 'password': password})
+
+    def _auth(self, token):
+        return {'HTTP_AUTHORIZATION': f'Token {token}'}
+
+    def test_login_issues_hashed_token_that_authenticates(self):
+        response = self._login()
+        self.assertEqual(response.status_code, 201)
+        raw = response.json()['token']
+        stored = ApiToken.objects.get(user=self.user)
+        self.assertEqual(stored.key_hash, hash_token(raw))
+        self.assertNotEqual(stored.key_hash, raw)
+
+        response = self.client.post(f'/api/posts/{self.post.id}/like/', **self._auth(raw))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PostLike.objects.filter(user=self.user, post=self.post).exists())
+
+    def test_cached_token_skips_the_token_query(self):
+        raw = self._login().json()['token']
+        self.client.get('/api/posts/1/', **self._auth(raw))
+        # The token (and its user) come from the cache: only the post query remains.
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/posts/{self.post.id}/', **self._auth(raw))
+
+    def test_bad_password_and_bad_token_are_rejected(self):
+        self.assertEqual(self._login('wrong').status_code, 400)
+        response = self.client.post(f'/api/posts/{self.post.id}/like/', **self._auth('nope'))
+        # Session auth comes first, so DRF answers 403 rather than 401.
+        self.assertEqual(response.status_code, 403)
+
+    def test_expired_and_revoked_tokens_are_rejected(self):
+        raw = self._login().json()['token']
+        self.assertEqual(
+            self.client.delete('/api/auth/token/', **self._auth(raw)).status_code, 204
+        )
+        self.assertFalse(ApiToken.objects.exists())
+        response = self.client.post(f'/api/posts/{self.post.id}/like/', **self._auth(raw))
+        self.assertEqual(response.status_code, 403)
+
+        _, raw = ApiToken.issue(self.user, timedelta(days=1))
+        ApiToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(f'/api/posts/{self.post.id}/like/', **self._auth(raw))
+        self.assertEqual(response.status_code, 403)
+
+    def test_basic_auth_is_no_longer_accepted(self):
+        response = self.client.post(
+            f'/api/posts/{self.post.id}/like/', HTTP_AUTHORIZATION='Basic ZmFuOnBhc3MxMjM0'
+        )
+        self.assertEqual(response.status_code, 403)
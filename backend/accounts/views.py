@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from rest_framework import permissions, serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .authentication import HashedTokenAuthentication, token_cache
+from .models import ApiToken
+
+
+class LoginSerializer(serializers.Serializer):
+    username = serializers.CharField()
+    password = serializers.CharField(trim_whitespace=False)
+
+
+class TokenView(APIView):
+    """
+    POST /api/auth/token/ with {"username", "password"} issues a token for
+    `Authorization: Token <token>`. DELETE with that header revokes it.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = [HashedTokenAuthentication]
+
+    def get_throttle_costs(self, request):
+        # Password checks are the expensive part; cap guesses per client.
+        return {'login': 1} if request.method == 'POST' else {}
+
+    def post(self, request):
+        serializer = LoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = authenticate(request, **serializer.validated_data)
+        if user is None:
+            return Response(
+                {'detail': 'Invalid username or password.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        token, raw = ApiToken.issue(user, timedelta(days=settings.API_TOKEN_LIFETIME_DAYS))
+        return Response({
+            'token': raw,
+            'expires_at': token.expires_at,
+            'user_id': user.id,
+            'username': user.username,
+        }, status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        token = request.auth
+        if not isinstance(token, ApiToken):
+            return Response(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        token_cache.discard(token.key_hash)
+        token.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
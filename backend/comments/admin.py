@@ -1,12 +1,35 @@
 from django.contrib import admin
 
+from moderation.hide import hide_comment
+from posts.admin_pagination import EstimatedCountPaginator
+from search.admin import FullTextSearchMixin
+
 from .models import Comment, CommentLike
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'author', 'post', 'parent', 'content_preview', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['author', 'post__author', 'parent__author']
+    raw_id_fields = ['author', 'post', 'parent']
+    search_fields = ['author__username__exact']
+    search_help_text = 'Words in the content, or an exact username.'
+    search_target = 'comments'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['hide_and_purge']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Its confirmation page loads the whole cascade; hide and purge instead.
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(description='Hide selected comments and their replies, then purge them')
+    def hide_and_purge(self, request, queryset):
+        for comment in queryset.visible():
+            hide_comment(comment)
 
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
@@ -16,3 +39,8 @@ class CommentAdmin(admin.ModelAdmin):
 @admin.register(CommentLike)
 class CommentLikeAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'comment', 'created_at']
+    list_select_related = ['user', 'comment__author']
+    raw_id_fields = ['user', 'comment']
+    search_fields = ['user__username__exact']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -1,7 +1,20 @@
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 
-from posts.models import Post
+from posts.models import Post, related_count
+
+
+class CommentQuerySet(models.QuerySet):
+    def visible(self):
+        return self.filter(hidden_at__isnull=True, post__hidden_at__isnull=True)
+
+    def with_like_count(self):
+        return self.annotate(like_count=related_count(CommentLike.objects.all(), 'comment'))
+
+    def with_reply_count(self):
+        replies = Comment.objects.filter(hidden_at__isnull=True)
+        return self.annotate(reply_count=related_count(replies, 'parent'))
 
 
 class Comment(models.Model):
@@ -25,9 +38,22 @@ class Comment(models.Model):
     )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set on a moderated comment and all its replies until they are purged.
+    hidden_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # The comment tree: one post's comments, oldest first.
+            models.Index(fields=['post', 'created_at'], name='comment_post_created_idx'),
+            models.Index(
+                fields=['hidden_at'],
+                name='comment_hidden_idx',
+                condition=Q(hidden_at__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on post {self.post_id}"
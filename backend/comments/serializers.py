@@ -1,14 +1,33 @@
 from django.db.models import Count
 from rest_framework import serializers
 
+from observability.timing import TimedSerializerMixin
+
+from posts.models import Post
+from posts.sharding import shard_for
+
 from .models import Comment
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class ShardedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Looks the submitted post or comment up on its shard (posts.sharding)."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not str(data).isdigit():
+            return super().to_internal_value(data)
+        queryset = self.get_queryset().using(shard_for(data))
+        try:
+            return queryset.get(pk=data)
+        except queryset.model.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     like_count = serializers.SerializerMethodField()
     reply_count = serializers.SerializerMethodField()
     is_liked_by_me = serializers.SerializerMethodField()
+    serializer_related_field = ShardedPrimaryKeyRelatedField
 
     class Meta:
         model = Comment
@@ -25,6 +44,16 @@ class CommentSerializer(serializers.ModelSerializer):
             'created_at',
         ]
         read_only_fields = ['author', 'created_at']
+        extra_kwargs = {
+            'post': {'queryset': Post.objects.visible()},
+            'parent': {'queryset': Comment.objects.visible()},
+        }
+
+    def create(self, validated_data):
+        # save() lets the database router put the comment on its post's shard.
+        comment = Comment(**validated_data)
+        comment.save(force_insert=True)
+        return comment
 
     def get_like_count(self, obj):
         if hasattr(obj, 'like_count'):
@@ -45,7 +74,7 @@ class CommentSerializer(serializers.ModelSerializer):
         return obj.likes.filter(user=request.user).exists()
 
 
-class CommentTreeSerializer(serializers.ModelSerializer):
+class CommentTreeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     like_count = serializers.SerializerMethodField()
     is_liked_by_me = serializers.SerializerMethodField()
@@ -1,16 +1,21 @@
-from django.db.models import Count, Exists, OuterRef, Value, BooleanField
-from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Value, BooleanField
+from django.db import IntegrityError
 from rest_framework.decorators import action
 from rest_framework import mixins, permissions, viewsets
 from rest_framework.response import Response
 from rest_framework import status
 
-from karma.models import KarmaEvent, SOURCE_COMMENT_LIKE
+from karma.tasks import award_comment_like, revoke_comment_like
+from notifications.tasks import notify_comment_like, notify_reply
+from observability.metrics import LIKE_RACES, LIKE_WRITES
+from posts.hotness import invalidate_post
+from posts.responses import invalidate_responses
+from posts.sharding import atomic, gather, is_sharded, shard_for, with_users
+from posts.state import invalidate_comment_state, invalidate_post_state
+from posts.tasks import bump_post_scores
 from .models import Comment, CommentLike
 from .serializers import CommentSerializer
 
-COMMENT_LIKE_KARMA_POINTS = 1
-
 
 class CommentViewSet(
     mixins.ListModelMixin,
@@ -23,10 +28,10 @@ class CommentViewSet(
 
     def get_queryset(self):
         queryset = (
-            Comment.objects
-            .select_related('author', 'post', 'parent')
-            .annotate(like_count=Count('likes', distinct=True))
-            .annotate(reply_count=Count('replies', distinct=True))
+            with_users(Comment.objects.visible(), 'author')
+            .select_related('post', 'parent')
+            .with_like_count()
+            .with_reply_count()
             .order_by('created_at')
         )
         if self.request.user.is_authenticated:
@@ -37,29 +42,69 @@ class CommentViewSet(
             queryset = queryset.annotate(is_liked_by_me=Exists(user_liked_subquery))
         else:
             queryset = queryset.annotate(is_liked_by_me=Value(False, output_field=BooleanField()))
+        pk = self.kwargs.get(self.lookup_field)
+        if pk is not None and str(pk).isdigit():
+            queryset = queryset.using(shard_for(pk))
         post_id = self.request.query_params.get('post')
         if post_id:
             queryset = queryset.filter(post_id=post_id)
+            if post_id.isdigit():
+                queryset = queryset.using(shard_for(post_id))
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        post_id = request.query_params.get('post')
+        if post_id and post_id.isdigit():
+            return super().list(request, *args, **kwargs)
+        # Without a post the comments are merged from every shard.
+        comments = gather(self.filter_queryset(self.get_queryset()))
+        return Response(self.get_serializer(comments, many=True).data)
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        shard = shard_for(serializer.validated_data['post'].pk)
+        with atomic(shard):
+            comment = serializer.save(author=self.request.user)
+            bump_post_scores.enqueue(
+                post_id=comment.post_id, comments=1, key=f'score:comment:{comment.id}',
+                using=shard,
+            )
+            if comment.parent_id:
+                notify_reply.enqueue(
+                    comment_id=comment.id, key=f'notify:reply:{comment.id}', using=shard
+                )
+        invalidate_post(comment.post_id)
+        invalidate_post_state(comment.post_id)
+        invalidate_responses([comment.post_id])
+        if comment.parent_id:
+            invalidate_comment_state(comment.parent_id)
 
     @action(detail=True, methods=['post', 'delete'], url_path='like')
     def like(self, request, pk=None):
         comment = self.get_object()
+        shard = shard_for(comment.pk)
+        likes = CommentLike.objects.using(shard)
 
         if request.method == 'DELETE':
-            with transaction.atomic():
-                comment_like = CommentLike.objects.filter(
-                    user=request.user, comment=comment
-                ).first()
+            with atomic(shard):
+                comment_like = likes.filter(user=request.user, comment=comment).first()
                 if comment_like:
+                    # Unsharded, the like's cascade takes back its karma; sharded,
+                    # the events are in `default`, which a task on the shard revokes.
+                    if is_sharded():
+                        revoke_comment_like.enqueue(
+                            like_id=comment_like.id, comment_id=comment.id,
+                            key=f'karma:comment_unlike:{comment_like.id}', using=shard,
+                        )
                     comment_like.delete()
                     deleted = True
                 else:
                     deleted = False
-            like_count = CommentLike.objects.filter(comment=comment).count()
+            if deleted:
+                LIKE_WRITES.inc(target='comment', op='unlike')
+                invalidate_post(comment.post_id)
+                invalidate_comment_state(comment.id)
+                invalidate_responses([comment.post_id])
+            like_count = likes.filter(comment=comment).count()
             return Response({
                 'liked': False,
                 'deleted': deleted,
@@ -74,22 +119,27 @@ class CommentViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
         try:
-            with transaction.atomic():
-                comment_like, created = CommentLike.objects.get_or_create(
-                    user=request.user, comment=comment
-                )
+            with atomic(shard):
+                comment_like, created = likes.get_or_create(user=request.user, comment=comment)
                 if created:
-                    KarmaEvent.objects.create(
-                        recipient=comment.author,
-                        actor=request.user,
-                        source_type=SOURCE_COMMENT_LIKE,
-                        points=COMMENT_LIKE_KARMA_POINTS,
-                        source_comment_like=comment_like,
+                    award_comment_like.enqueue(
+                        like_id=comment_like.id, key=f'karma:comment_like:{comment_like.id}',
+                        using=shard,
+                    )
+                    notify_comment_like.enqueue(
+                        like_id=comment_like.id, key=f'notify:comment_like:{comment_like.id}',
+                        using=shard,
                     )
         except IntegrityError:
             created = False
+            LIKE_RACES.inc(target='comment')
+        if created:
+            LIKE_WRITES.inc(target='comment', op='like')
+            invalidate_post(comment.post_id)
+            invalidate_comment_state(comment.id)
+            invalidate_responses([comment.post_id])
 
-        like_count = CommentLike.objects.filter(comment=comment).count()
+        like_count = likes.filter(comment=comment).count()
         return Response({
             'liked': True,
             'created': created,
@@ -25,15 +25,25 @@ INSTALLED_APPS = [
     'posts',
     'comments',
     'karma',
+    'observability',
+    'search',
+    'feed',
+    'accounts',
+    'tasks',
+    'moderation',
+    'notifications',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'observability.middleware.RequestTimingMiddleware',
+    'observability.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'observability.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,6 +75,33 @@ DATABASES = {
     }
 }
 
+# `manage.py boot` copies this SQLite file into place when DB_PATH does not
+# exist yet, for demo and test environments that start from prebuilt data.
+BOOT_SNAPSHOT_PATH = os.environ.get('BOOT_SNAPSHOT_PATH', '')
+
+# Optional sharding of posts, comments and likes (posts.sharding). With
+# SHARD_COUNT > 0 they live in SHARD_COUNT SQLite files in SHARD_DB_DIR,
+# so writes to different posts stop queueing behind one database lock;
+# run it with TASKS_EAGER=False so likes write nothing to `default`.
+# Rows on a shard point at users in `default`, which SQLite cannot enforce,
+# so foreign key checks are off on every database in that mode. The admin
+# reads only `default` and is left out; the sample data seed, the
+# dataset commands and bench_purge refuse to run.
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '0'))
+SHARD_DB_DIR = Path(os.environ.get('SHARD_DB_DIR', BASE_DIR))
+SHARD_DATABASES = [f'shard{index}' for index in range(SHARD_COUNT)]
+DATABASE_ROUTERS = []
+if SHARD_DATABASES:
+    INSTALLED_APPS.remove('django.contrib.admin')
+    for alias in SHARD_DATABASES:
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(SHARD_DB_DIR / f'{alias}.sqlite3'),
+        }
+    for database in DATABASES.values():
+        database['OPTIONS'] = {'init_command': 'PRAGMA foreign_keys = OFF'}
+    DATABASE_ROUTERS = ['posts.sharding.ShardRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -87,8 +124,113 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'accounts.authentication.HashedTokenAuthentication',
+    ],
+    # Token buckets for like, unlike, create and login (posts.throttling),
+    # per user and per client IP; see THROTTLE_STORE_PATH.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'posts.throttling.UserWriteThrottle',
+        'posts.throttling.IPWriteThrottle',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'like_user': os.environ.get('THROTTLE_LIKE_USER', '120/min'),
+        'like_ip': os.environ.get('THROTTLE_LIKE_IP', '600/min'),
+        'unlike_user': os.environ.get('THROTTLE_UNLIKE_USER', '120/min'),
+        'unlike_ip': os.environ.get('THROTTLE_UNLIKE_IP', '600/min'),
+        'create_user': os.environ.get('THROTTLE_CREATE_USER', '20/min'),
+        'create_ip': os.environ.get('THROTTLE_CREATE_IP', '100/min'),
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '20/min'),
+    },
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Per-request SQL and timing instrumentation (observability.middleware).
+# A sample rate of 0 disables it; 1 instruments every request.
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get('REQUEST_TIMING_SAMPLE_RATE', '0'))
+REQUEST_TIMING_SLOW_MS = float(os.environ.get('REQUEST_TIMING_SLOW_MS', '500'))
+REQUEST_TIMING_SLOW_QUERIES = int(os.environ.get('REQUEST_TIMING_SLOW_QUERIES', '50'))
+REQUEST_TIMING_TOP_SQL = 3
+
+# Metrics exposed at /metrics/. Set a shared directory when running several
+# gunicorn workers so a scrape aggregates all of them.
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# Profiling (observability.profiling). Staff can profile a single request
+# with ?profile=1; a sample interval > 0 enables the background sampler.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0'))
+PROFILE_FLUSH_INTERVAL = float(os.environ.get('PROFILE_FLUSH_INTERVAL', '30'))
+
+# Hot-post tier (posts.hotness): posts read or liked more than the threshold
+# within roughly a decay period get short-lived cached payloads.
+HOT_POST_THRESHOLD = float(os.environ.get('HOT_POST_THRESHOLD', '50'))
+HOT_POST_DECAY_SECONDS = float(os.environ.get('HOT_POST_DECAY_SECONDS', '60'))
+HOT_POST_CACHE_TTL = int(os.environ.get('HOT_POST_CACHE_TTL', '5'))
+HOT_LIKE_FLUSH_SECONDS = float(os.environ.get('HOT_LIKE_FLUSH_SECONDS', '5'))
+
+# Per-item count cache behind /api/state/ (posts.state).
+STATE_CACHE_TTL = int(os.environ.get('STATE_CACHE_TTL', '30'))
+
+# Rendered responses of the anonymous-heavy reads (posts.responses): post
+# lists, detail, comment trees and the leaderboard. 0 disables it.
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+
+# The cache behind the hot tier, item state and responses. Per-process
+# memory by default; set CACHE_DIR to share it between gunicorn workers
+# through files.
+CACHE_DIR = os.environ.get('CACHE_DIR', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    } if CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# API tokens (accounts): issued at /api/auth/token/, verified against a
+# per-process cache that re-checks the database every TTL seconds.
+API_TOKEN_LIFETIME_DAYS = int(os.environ.get('API_TOKEN_LIFETIME_DAYS', '30'))
+API_TOKEN_CACHE_SIZE = int(os.environ.get('API_TOKEN_CACHE_SIZE', '10000'))
+API_TOKEN_CACHE_TTL = float(os.environ.get('API_TOKEN_CACHE_TTL', '60'))
+
+# Shared token-bucket file for the write throttles. Every gunicorn worker
+# must see the same path; an empty value keeps buckets per process.
+THROTTLE_STORE_PATH = os.environ.get('THROTTLE_STORE_PATH', str(BASE_DIR / 'throttle.sqlite3'))
+
+# Home timelines (feed.fanout): authors with more followers than this are
+# merged in at read time instead of being fanned out on every post.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.environ.get('FEED_FANOUT_MAX_FOLLOWERS', '1000'))
+
+# Background tasks (tasks.queue). Eager mode runs every task inline at
+# enqueue time; with TASKS_EAGER=False they are stored and `run_tasks` workers
+# execute them, retrying failures up to TASKS_MAX_ATTEMPTS times.
+TASKS_EAGER = os.environ.get('TASKS_EAGER', 'True').lower() == 'true'
+TASKS_MAX_ATTEMPTS = int(os.environ.get('TASKS_MAX_ATTEMPTS', '5'))
+TASKS_LEASE_SECONDS = int(os.environ.get('TASKS_LEASE_SECONDS', '60'))
+TASKS_POLL_INTERVAL = float(os.environ.get('TASKS_POLL_INTERVAL', '1'))
+TASKS_KEEP_DONE_SECONDS = int(os.environ.get('TASKS_KEEP_DONE_SECONDS', '86400'))
+
+# Notifications (notifications.inbox): a like or reply on a target whose
+# inbox entry is still unread and at most this old is folded into it.
+NOTIFICATIONS_COALESCE_SECONDS = int(os.environ.get('NOTIFICATIONS_COALESCE_SECONDS', '86400'))
+
+# Moderation (moderation.purge): seconds one purge task works before it
+# hands over to a fresh one, so a huge purge never holds a worker's lease.
+MODERATION_PURGE_TIME_LIMIT = float(os.environ.get('MODERATION_PURGE_TIME_LIMIT', '30'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'observability': {
+            'handlers': ['console'],
+            'level': os.environ.get('OBSERVABILITY_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -1,12 +1,22 @@
 """
 URL configuration for playto community feed project.
 """
+from django.apps import apps
 from django.contrib import admin
 from django.urls import include, path
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('posts.urls')),
     path('api/', include('comments.urls')),
     path('api/', include('karma.urls')),
+    path('api/', include('search.urls')),
+    path('api/', include('feed.urls')),
+    path('api/', include('accounts.urls')),
+    path('api/', include('moderation.urls')),
+    path('api/', include('notifications.urls')),
+    path('', include('observability.urls')),
 ]
+
+# Left out of INSTALLED_APPS when sharded (see settings).
+if apps.is_installed('django.contrib.admin'):
+    urlpatterns.append(path('admin/', admin.site.urls))
@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from posts.admin_pagination import EstimatedCountPaginator
+
+from .models import Follow, FollowerCount
+
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ['id', 'follower', 'followee', 'created_at']
+    list_select_related = ['follower', 'followee']
+    raw_id_fields = ['follower', 'followee']
+    search_fields = ['follower__username__exact', 'followee__username__exact']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(FollowerCount)
+class FollowerCountAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
@@ -0,0 +1,171 @@
+"""
+Home timelines built by fan-out on write, with fan-out on read for large
+accounts.
+
+When a post is created, one TimelineEntry is written for the author and
+each follower, so reading a timeline is a single range scan on
+(owner, created_at). Authors with more than FEED_FANOUT_MAX_FOLLOWERS
+followers are skipped at write time. Their posts are read on demand and
+merged into the page instead, which keeps a single post from turning into
+an unbounded insert.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from observability.metrics import FEED_FANOUT_ROWS
+from posts.models import Post
+from posts.sharding import gather
+
+from .models import Follow, FollowerCount, TimelineEntry
+
+FANOUT_BATCH_SIZE = 1000
+# Recent posts copied into a timeline when its owner follows someone.
+BACKFILL_POSTS = 50
+
+
+def max_fanout_followers():
+    return settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def follower_total(user_id):
+    return (
+        FollowerCount.objects.filter(user_id=user_id).values_list('total', flat=True).first()
+        or 0
+    )
+
+
+def _entries(owner_ids, posts):
+    return [
+        TimelineEntry(
+            owner_id=owner_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            created_at=post.created_at,
+        )
+        for owner_id in owner_ids
+        for post in posts
+    ]
+
+
+def fan_out_post(post):
+    """Write `post` into its author's timeline and, unless the author is large, their followers'."""
+    limit = max_fanout_followers()
+    follower_ids = list(
+        Follow.objects
+        .filter(followee_id=post.author_id)
+        .values_list('follower_id', flat=True)[:limit + 1]
+    )
+    if len(follower_ids) > limit:
+        follower_ids = []
+    rows = TimelineEntry.objects.bulk_create(
+        _entries([post.author_id, *follower_ids], [post]),
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    FEED_FANOUT_ROWS.observe(len(rows))
+
+
+def _backfill(owner_ids, author_id):
+    posts = gather(
+        Post.objects.visible()
+        .filter(author_id=author_id)
+        .only('id', 'author_id', 'created_at')
+        .order_by('-created_at', '-id'),
+        BACKFILL_POSTS,
+    )
+    TimelineEntry.objects.bulk_create(
+        _entries(owner_ids, posts), batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def follow(user, author):
+    """Returns True if a new follow was created."""
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(follower=user, followee=author)
+        if not created:
+            return False
+        FollowerCount.objects.get_or_create(user=author)
+        FollowerCount.objects.filter(user=author).update(total=F('total') + 1)
+        if follower_total(author.id) <= max_fanout_followers():
+            _backfill([user.id], author.id)
+    return True
+
+
+def unfollow(user, author):
+    """Returns True if a follow was removed."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower=user, followee=author).delete()
+        if not deleted:
+            return False
+        FollowerCount.objects.filter(user=author).update(total=F('total') - 1)
+        TimelineEntry.objects.filter(owner=user, author=author).delete()
+        if follower_total(author.id) == max_fanout_followers():
+            # The author just dropped back to fan-out on write; their recent
+            # posts were never written to their followers' timelines.
+            follower_ids = Follow.objects.filter(followee=author).values_list('follower_id', flat=True)
+            _backfill(list(follower_ids), author.id)
+    return True
+
+
+def drop_follows(follow_ids):
+    """
+    Delete the given follows in bulk, for account purges. Follower counts
+    and the backfill for authors dropping back to fan-out on write are kept
+    as in `unfollow`, but the followers' timelines are left to the caller.
+    """
+    pairs = list(Follow.objects.filter(id__in=follow_ids).values_list('follower_id', 'followee_id'))
+    Follow.objects.filter(id__in=follow_ids).delete()
+    lost = Counter(followee_id for _, followee_id in pairs)
+    limit = max_fanout_followers()
+    before = dict(FollowerCount.objects.filter(user_id__in=lost).values_list('user_id', 'total'))
+    for followee_id, count in lost.items():
+        FollowerCount.objects.filter(user_id=followee_id).update(total=F('total') - count)
+        if before.get(followee_id, 0) > limit >= before.get(followee_id, 0) - count:
+            follower_ids = Follow.objects.filter(followee_id=followee_id).values_list('follower_id', flat=True)
+            _backfill(list(follower_ids), followee_id)
+
+
+def _before(cursor, id_field):
+    if cursor is None:
+        return Q()
+    created_at, post_id = cursor
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, **{f'{id_field}__lt': post_id})
+
+
+def timeline_page(user, cursor, page_size):
+    """
+    `(post_id, created_at)` pairs for one page of `user`'s timeline, newest
+    first, plus whether there is a next page. `cursor` is the last pair of
+    the previous page, or None.
+    """
+    timeline = (
+        TimelineEntry.objects
+        .filter(_before(cursor, 'post_id'), owner=user)
+        .order_by('-created_at', '-post_id')
+        .values_list('post_id', 'created_at')[:page_size + 1]
+    )
+    rows = list(timeline)
+
+    large_authors = list(
+        Follow.objects
+        .filter(follower=user, followee__follower_count__total__gt=max_fanout_followers())
+        .values_list('followee_id', flat=True)
+    )
+    if large_authors:
+        on_read = [
+            (post.id, post.created_at)
+            for post in gather(
+                Post.objects.visible()
+                .filter(_before(cursor, 'id'), author_id__in=large_authors)
+                .only('id', 'created_at')
+                .order_by('-created_at', '-id'),
+                page_size + 1,
+            )
+        ]
+        # Posts from before the author grew large are in both; keep one.
+        rows = list({post_id: created_at for post_id, created_at in [*on_read, *rows]}.items())
+        rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+    return rows[:page_size], len(rows) > page_size
@@ -0,0 +1,17 @@
+from posts.models import Post
+from posts.sharding import shard_for
+from tasks.queue import task
+
+from .fanout import fan_out_post
+
+
+@task('feed.fan_out')
+def fan_out(post_id):
+    post = (
+        Post.objects.using(shard_for(post_id))
+        .filter(pk=post_id)
+        .only('id', 'author_id', 'created_at')
+        .first()
+    )
+    if post is not None:
+        fan_out_post(post)
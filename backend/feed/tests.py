@@ -0,0 +1,93 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from posts.pagination import encode_time_cursor
+
+from .models import FollowerCount, TimelineEntry
+
+User = get_user_model()
+
+
+class FeedApiTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='pass1234')
+        self.alice = User.objects.create_user(username='alice', password='pass1234')
+        self.bob = User.objects.create_user(username='bob', password='pass1234')
+        self.client.force_login(self.reader)
+
+    def _post(self, user, content):
+        self.client.force_login(user)
+        response = self.client.post('/api/posts/', {'content': content})
+        self.client.force_login(self.reader)
+        return response.json()['id']
+
+    def _feed(self, **params):
+        return self.client.get('/api/feed/', params).json()
+
+    def _ids(self, data):
+        return [post['id'] for post in data['results']]
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        old = self._post(self.alice, 'before follow')
+        self._post(self.bob, 'not followed')
+        response = self.client.post(f'/api/users/{self.alice.id}/follow/')
+        self.assertEqual(response.json()['follower_count'], 1)
+        new = self._post(self.alice, 'after follow')
+        mine = self._post(self.reader, 'my own')
+
+        self.assertEqual(self._ids(self._feed()), [mine, new, old])
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader).count(), 3)
+
+    def test_unfollow_removes_author_posts(self):
+        self.client.post(f'/api/users/{self.alice.id}/follow/')
+        self._post(self.alice, 'hello')
+        response = self.client.delete(f'/api/users/{self.alice.id}/follow/')
+        self.assertTrue(response.json()['deleted'])
+        self.assertEqual(self._feed()['results'], [])
+
+    def test_cursor_pages_through_timeline(self):
+        self.client.post(f'/api/users/{self.alice.id}/follow/')
+        ids = [self._post(self.alice, f'p{i}') for i in range(5)]
+        first = self._feed(page_size=2)
+        second = self.client.get(first['next']).json()
+        third = self.client.get(second['next']).json()
+        self.assertEqual(self._ids(first) + self._ids(second) + self._ids(third), ids[::-1])
+        self.assertIsNone(third['next'])
+
+    def test_rejects_cursor_without_utc_offset(self):
+        cursor = encode_time_cursor(datetime(2026, 1, 1), 1)
+        self.assertEqual(self.client.get('/api/feed/', {'cursor': cursor}).status_code, 400)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_large_authors_are_merged_on_read(self):
+        self.client.post(f'/api/users/{self.alice.id}/follow/')
+        self.client.force_login(self.bob)
+        self.client.post(f'/api/users/{self.alice.id}/follow/')
+        self.client.force_login(self.reader)
+        self.assertEqual(FollowerCount.objects.get(user=self.alice).total, 2)
+
+        post_id = self._post(self.alice, 'to many followers')
+        # Only the author's own entry was written.
+        owners = TimelineEntry.objects.filter(post_id=post_id).values_list('owner', flat=True)
+        self.assertEqual(list(owners), [self.alice.id])
+        self.assertEqual(self._ids(self._feed()), [post_id])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_dropping_below_threshold_backfills_followers(self):
+        self.client.post(f'/api/users/{self.alice.id}/follow/')
+        self.client.force_login(self.bob)
+        self.client.post(f'/api/users/{self.alice.id}/follow/')
+        post_id = self._post(self.alice, 'read on demand')
+        self.client.force_login(self.bob)
+        self.client.delete(f'/api/users/{self.alice.id}/follow/')
+        self.client.force_login(self.reader)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.reader, post_id=post_id).exists())
+        self.assertEqual(self._ids(self._feed()), [post_id])
+
+    def test_cannot_follow_self_and_feed_requires_login(self):
+        response = self.client.post(f'/api/users/{self.reader.id}/follow/')
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/feed/').status_code, 403)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import FeedView, FollowView
+
+urlpatterns = [
+    path('feed/', FeedView.as_view(), name='feed'),
+    path('users/<int:user_id>/follow/', FollowView.as_view(), name='follow'),
+]
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from posts.models import Post, PostLike
+from posts.pagination import decode_time_cursor, encode_time_cursor
+from posts.serializers import PostSerializer
+from posts.sharding import in_bulk, with_users
+
+from .fanout import follow, follower_total, timeline_page, unfollow
+
+User = get_user_model()
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class FeedView(APIView):
+    """
+    GET /api/feed/?cursor=...&page_size=20 returns the posts of the users
+    the caller follows (and their own), newest first, with a `next` link.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        page_size = self._page_size(request)
+        cursor = request.query_params.get('cursor')
+        rows, has_next = timeline_page(
+            request.user, decode_time_cursor(cursor) if cursor else None, page_size
+        )
+        user_liked_subquery = PostLike.objects.filter(user=request.user, post_id=OuterRef('pk'))
+        posts = in_bulk(
+            with_users(Post.objects.visible(), 'author')
+            .with_like_count()
+            .with_comment_count()
+            .annotate(is_liked_by_me=Exists(user_liked_subquery))
+            # The timeline rows already give the order; skip Post's default sort.
+            .order_by(),
+            [post_id for post_id, _ in rows],
+        )
+        ordered = [posts[post_id] for post_id, _ in rows if post_id in posts]
+        serializer = PostSerializer(ordered, many=True, context={'request': request})
+        next_link = None
+        if has_next:
+            last_id, last_created_at = rows[-1]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_time_cursor(last_created_at, last_id)
+            )
+        return Response({'next': next_link, 'results': serializer.data})
+
+    def _page_size(self, request):
+        raw = request.query_params.get('page_size', str(DEFAULT_PAGE_SIZE))
+        if not raw.isdigit() or int(raw) < 1:
+            raise ValidationError({'page_size': 'Expected a positive integer.'})
+        return min(int(raw), MAX_PAGE_SIZE)
+
+
+class FollowView(APIView):
+    """POST /api/users/<id>/follow/ follows a user; DELETE unfollows."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, user_id):
+        author = get_object_or_404(User, pk=user_id)
+        if author == request.user:
+            return Response(
+                {'detail': 'Users cannot follow themselves.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        created = follow(request.user, author)
+        return Response({
+            'following': True,
+            'created': created,
+            'user_id': author.id,
+            'follower_count': follower_total(author.id),
+        })
+
+    def delete(self, request, user_id):
+        author = get_object_or_404(User, pk=user_id)
+        deleted = unfollow(request.user, author)
+        return Response({
+            'following': False,
+            'deleted': deleted,
+            'user_id': author.id,
+            'follower_count': follower_total(author.id),
+        })
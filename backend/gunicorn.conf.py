@@ -0,0 +1,27 @@
+"""
+Gunicorn settings. Pick the worker model with WEB_WORKER_MODEL:
+
+- sync:    one request per process (the previous default)
+- gthread: WEB_THREADS requests per process
+- asgi:    uvicorn workers serving config.asgi, where the /api/async/
+           endpoints run as coroutines
+
+Run: gunicorn -c gunicorn.conf.py
+"""
+import os
+
+_model = os.environ.get('WEB_WORKER_MODEL', 'sync')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+
+if _model == 'asgi':
+    wsgi_app = 'config.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+elif _model in ('sync', 'gthread'):
+    wsgi_app = 'config.wsgi:application'
+    worker_class = _model
+    threads = int(os.environ.get('WEB_THREADS', '4')) if _model == 'gthread' else 1
+else:
+    raise RuntimeError(f'Unknown WEB_WORKER_MODEL {_model!r}; use sync, gthread or asgi.')
@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
 
+from posts.admin_pagination import EstimatedCountPaginator
+
+from .aggregates import remove_karma, revoke_karma
 from .models import KarmaEvent
 
 
@@ -7,4 +11,20 @@ from .models import KarmaEvent
 class KarmaEventAdmin(admin.ModelAdmin):
     list_display = ['id', 'recipient', 'actor', 'source_type', 'points', 'created_at']
     list_filter = ['source_type', 'created_at']
-    search_fields = ['recipient__username', 'actor__username']
+    list_select_related = ['recipient', 'actor']
+    raw_id_fields = ['recipient', 'actor', 'source_post_like', 'source_comment_like']
+    search_fields = ['recipient__username__exact', 'actor__username__exact']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # Events have no delete receiver (so cascades can delete them in one
+    # statement); an event deleted here takes its karma back explicitly.
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            revoke_karma([obj])
+            obj.delete()
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            remove_karma(queryset)
+            queryset.delete()
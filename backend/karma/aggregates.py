@@ -0,0 +1,264 @@
+"""
+Incrementally maintained karma aggregates.
+
+Every path that writes KarmaEvent rows calls `apply_karma` with them.
+Deletes are covered by a pre_delete receiver on users, posts, comments and
+likes (`revoke_cascaded_karma`): once per delete, it subtracts every event
+the cascade will reach with grouped UPDATEs, in the delete's transaction.
+KarmaEvent itself has no receiver, so cascades still delete its rows in one
+statement. Bulk purges delete with raw SQL instead, which sends no
+signals, and subtract with `remove_karma` first.
+KarmaTotal, KarmaDaily and KarmaItem therefore always equal a full scan of
+KarmaEvent, which the profile endpoint never has to do.
+"""
+import weakref
+from collections import defaultdict
+
+from django.db import connections, router
+from django.db.models import Count, Q, QuerySet, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from comments.models import Comment, CommentLike
+from posts.models import Post, PostLike
+from posts.sharding import in_bulk, is_sharded
+
+from .models import KarmaDaily, KarmaEvent, KarmaItem, KarmaTotal
+
+
+def _increment(model, deltas, defaults=None):
+    """
+    Add `{key: {field: delta}}` to the rows identified by each key (a dict
+    of lookups), creating missing rows first. Creation ignores conflicts, so
+    concurrent writers never collide on the insert.
+    """
+    defaults = defaults or {}
+    model.objects.bulk_create(
+        [model(**dict(key), **defaults.get(key, {})) for key in deltas],
+        ignore_conflicts=True,
+    )
+    _update(model, deltas)
+
+
+def _update(model, deltas):
+    """
+    Apply `{key: {field: delta}}` to existing rows. Keys with the same
+    fields share one prepared UPDATE run with executemany, so a bulk purge
+    touching thousands of rows does not compile thousands of ORM queries.
+    """
+    db = connections[router.db_for_write(model)]
+    statements = defaultdict(list)
+    for key, changes in deltas.items():
+        changes = {field: delta for field, delta in changes.items() if delta}
+        if changes:
+            lookups = dict(key)
+            params = [
+                model._meta.get_field(name).get_db_prep_value(value, db)
+                for name, value in lookups.items()
+            ]
+            statements[tuple(changes), tuple(lookups)].append([*changes.values(), *params])
+    quote = db.ops.quote_name
+    with db.cursor() as cursor:
+        for (fields, lookups), rows in statements.items():
+            assignments = ', '.join(f'{quote(field)} = {quote(field)} + %s' for field in fields)
+            conditions = ' AND '.join(
+                f'{quote(model._meta.get_field(name).column)} = %s' for name in lookups
+            )
+            cursor.executemany(
+                f'UPDATE {quote(model._meta.db_table)} SET {assignments} WHERE {conditions}',
+                rows,
+            )
+
+
+def _apply(events, sign):
+    totals = defaultdict(lambda: {'points': 0, 'events': 0})
+    daily = defaultdict(lambda: {'points': 0})
+    items = defaultdict(lambda: {'points': 0, 'likes': 0})
+    recipients = {}
+    for event in events:
+        points = sign * event.points
+        total = totals[(('user_id', event.recipient_id), ('source_type', event.source_type))]
+        total['points'] += points
+        total['events'] += sign
+        day = timezone.localdate(event.created_at)
+        daily[(('user_id', event.recipient_id), ('day', day))]['points'] += points
+        if event.source_post_like_id:
+            item = (('post_id', event.source_post_like.post_id),)
+        else:
+            item = (('comment_id', event.source_comment_like.comment_id),)
+        items[item]['points'] += points
+        items[item]['likes'] += sign
+        recipients[item] = {'recipient_id': event.recipient_id}
+    if totals:
+        _increment(KarmaTotal, totals)
+        _increment(KarmaDaily, daily)
+        _increment(KarmaItem, items, defaults=recipients)
+
+
+def apply_karma(events):
+    """Add newly created KarmaEvents (with their source like attached) to the aggregates."""
+    _apply(events, 1)
+
+
+def revoke_karma(events):
+    """Subtract KarmaEvents that are about to be deleted from the aggregates."""
+    events = list(events)
+    # Read the likes by id rather than through the relation: sharded, they
+    # are on the shards, where a join from `default` finds nothing.
+    # A like already attached (as by the sharded revoke tasks) is used as is.
+    for field, model in (('source_post_like', PostLike), ('source_comment_like', CommentLike)):
+        relation = KarmaEvent._meta.get_field(field)
+        missing = [
+            event for event in events
+            if getattr(event, relation.attname) is not None and not relation.is_cached(event)
+        ]
+        if not missing:
+            continue
+        likes = in_bulk(model.objects.all(), {getattr(event, relation.attname) for event in missing})
+        for event in missing:
+            setattr(event, field, likes[getattr(event, relation.attname)])
+    _apply(events, -1)
+
+
+def _subtract(model, rows, on, fields):
+    """
+    Subtract the grouped `rows` queryset from `model` in one UPDATE ... FROM,
+    joining `{model field: rows column}` pairs from `on` and subtracting each
+    `{model field: rows column}` pair in `fields`. Nothing is loaded into
+    Python, however many rows the group by produces.
+    """
+    db = connections[router.db_for_write(model)]
+    quote = db.ops.quote_name
+    table = quote(model._meta.db_table)
+
+    def column(name):
+        return f'{table}.{quote(model._meta.get_field(name).column)}'
+
+    assignments = ', '.join(
+        f'{quote(model._meta.get_field(name).column)} = {column(name)} - delta.{quote(source)}'
+        for name, source in fields.items()
+    )
+    conditions = ' AND '.join(
+        f'{column(name)} = delta.{quote(source)}' for name, source in on.items()
+    )
+    sql, params = rows.query.get_compiler(connection=db).as_sql()
+    with db.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {assignments} FROM ({sql}) AS delta WHERE {conditions}',
+            params,
+        )
+
+
+def remove_karma(events, items=True):
+    """
+    Subtract the KarmaEvents in the `events` queryset from the aggregates
+    with grouped UPDATEs rather than loading every event, for bulk
+    removals. With `items=False` the KarmaItems are left alone, for callers
+    that are deleting the posts and comments themselves.
+    """
+    events = events.order_by()
+    _subtract(
+        KarmaTotal,
+        events.values('recipient_id', 'source_type')
+        .annotate(points=Sum('points'), events=Count('id')),
+        on={'user': 'recipient_id', 'source_type': 'source_type'},
+        fields={'points': 'points', 'events': 'events'},
+    )
+    _subtract(
+        KarmaDaily,
+        events.values('recipient_id', day=TruncDate('created_at')).annotate(points=Sum('points')),
+        on={'user': 'recipient_id', 'day': 'day'},
+        fields={'points': 'points'},
+    )
+    if items and is_sharded():
+        _remove_item_karma(events)
+    elif items:
+        for field, source in (
+            ('post', 'source_post_like__post_id'),
+            ('comment', 'source_comment_like__comment_id'),
+        ):
+            _subtract(
+                KarmaItem,
+                events.filter(**{f'{source}__isnull': False})
+                .values(source)
+                .annotate(points=Sum('points'), likes=Count('id')),
+                on={field: source},
+                fields={'points': 'points', 'likes': 'likes'},
+            )
+
+
+def _remove_item_karma(events):
+    """
+    `remove_karma`'s KarmaItem part when sharded: the likes are on the
+    shards, where a join from `default` finds nothing, so their targets are
+    read by id. Bulk removals hand over one batch at a time, so the events
+    are few enough to group here.
+    """
+    rows = list(events.values_list('source_post_like_id', 'source_comment_like_id', 'points'))
+    deltas = defaultdict(lambda: {'points': 0, 'likes': 0})
+    for index, (field, model) in enumerate((('post_id', PostLike), ('comment_id', CommentLike))):
+        likes = in_bulk(model.objects.only(field), [row[index] for row in rows if row[index]])
+        for row in rows:
+            if row[index]:
+                delta = deltas[((field, getattr(likes[row[index]], field)),)]
+                delta['points'] -= row[2]
+                delta['likes'] -= 1
+    _update(KarmaItem, deltas)
+
+
+def _with_replies(comment_ids, using):
+    """`comment_ids` and every reply below them, one thread level per query."""
+    comments = Comment.objects.using(using)
+    ids = list(comment_ids)
+    level = ids
+    while level:
+        level = list(comments.filter(parent__in=level).values_list('id', flat=True))
+        ids.extend(level)
+    return ids
+
+
+def _cascaded_events(model, ids, using):
+    """The KarmaEvents that deleting the `model` rows `ids` cascades to."""
+    if model is PostLike:
+        return Q(source_post_like__in=ids)
+    if model is CommentLike:
+        return Q(source_comment_like__in=ids)
+    if model is Comment:
+        return Q(source_comment_like__comment__in=_with_replies(ids, using))
+    if model is Post:
+        return Q(source_post_like__post__in=ids) | Q(source_comment_like__comment__post__in=ids)
+    # A user's own likes and the likes they received are theirs; replies by
+    # others go with the user's posts and comments.
+    own_comments = Comment.objects.using(using).filter(author__in=ids).values_list('id', flat=True)
+    return (
+        Q(recipient__in=ids)
+        | Q(actor__in=ids)
+        | Q(source_comment_like__comment__post__author__in=ids)
+        | Q(source_comment_like__comment__in=_with_replies(own_comments, using))
+    )
+
+
+# Querysets whose delete has already been revoked; each instance they
+# delete is sent pre_delete, but the whole delete is revoked at the first.
+_revoked = weakref.WeakSet()
+
+
+def revoke_cascaded_karma(sender, instance, using, origin=None, **kwargs):
+    """
+    pre_delete receiver for users, posts, comments and likes. It acts once,
+    for the object or queryset the delete started from, and subtracts every
+    event the cascade reaches before the events are deleted.
+    """
+    if using != router.db_for_write(KarmaEvent):
+        # Rows on a shard have no events there; the revoke tasks cover them.
+        return
+    if isinstance(origin, QuerySet):
+        if origin.model is not sender or origin in _revoked:
+            return
+        _revoked.add(origin)
+        ids = list(origin.using(using).values_list('pk', flat=True))
+    elif origin is None or origin is instance:
+        ids = [instance.pk]
+    else:
+        return
+    remove_karma(KarmaEvent.objects.using(using).filter(_cascaded_events(sender, ids, using)))
@@ -1,7 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import pre_delete
 
 
 class KarmaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'karma'
     verbose_name = 'Karma'
+
+    def ready(self):
+        from .aggregates import revoke_cascaded_karma
+
+        for sender in (
+            settings.AUTH_USER_MODEL, 'posts.Post', 'comments.Comment',
+            'posts.PostLike', 'comments.CommentLike',
+        ):
+            pre_delete.connect(
+                revoke_cascaded_karma,
+                sender=sender,
+                dispatch_uid=f'karma.aggregates.revoke_cascaded_karma.{sender}',
+            )
@@ -0,0 +1,14 @@
+from django.http import HttpResponseNotAllowed
+
+from posts.async_views import render_json
+
+from .serializers import LeaderboardUserSerializer
+from .views import leaderboard_queryset
+
+
+async def leaderboard(request):
+    """Async variant of LeaderboardView for ASGI deployments."""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    users = [user async for user in leaderboard_queryset()]
+    return render_json(LeaderboardUserSerializer(users, many=True).data)
@@ -0,0 +1,134 @@
+# Generated manually: per-user karma aggregates, backfilled from KarmaEvent.
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_aggregates(apps, schema_editor):
+    KarmaEvent = apps.get_model('karma', 'KarmaEvent')
+    KarmaTotal = apps.get_model('karma', 'KarmaTotal')
+    KarmaDaily = apps.get_model('karma', 'KarmaDaily')
+    KarmaItem = apps.get_model('karma', 'KarmaItem')
+
+    totals = (
+        KarmaEvent.objects
+        .values('recipient_id', 'source_type')
+        .annotate(points=Sum('points'), events=Count('id'))
+        .order_by()
+    )
+    KarmaTotal.objects.bulk_create(
+        [
+            KarmaTotal(
+                user_id=row['recipient_id'],
+                source_type=row['source_type'],
+                points=row['points'],
+                events=row['events'],
+            )
+            for row in totals
+        ],
+        batch_size=500,
+    )
+
+    daily = (
+        KarmaEvent.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('recipient_id', 'day')
+        .annotate(points=Sum('points'))
+        .order_by()
+    )
+    KarmaDaily.objects.bulk_create(
+        [KarmaDaily(user_id=row['recipient_id'], day=row['day'], points=row['points']) for row in daily],
+        batch_size=500,
+    )
+
+    for source in ('post', 'comment'):
+        item = f'source_{source}_like__{source}_id'
+        rows = (
+            KarmaEvent.objects
+            .filter(**{f'source_{source}_like__isnull': False})
+            .values('recipient_id', item)
+            .annotate(points=Sum('points'), likes=Count('id'))
+            .order_by()
+        )
+        KarmaItem.objects.bulk_create(
+            [
+                KarmaItem(
+                    recipient_id=row['recipient_id'],
+                    likes=row['likes'],
+                    points=row['points'],
+                    **{f'{source}_id': row[item]},
+                )
+                for row in rows
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0001_initial'),
+        ('karma', '0001_initial'),
+        ('posts', '0002_ranking_scores'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KarmaTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_type', models.CharField(choices=[('post_like', 'Post Like'), ('comment_like', 'Comment Like')], max_length=20)),
+                ('points', models.PositiveIntegerField(default=0)),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='karma_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('user', 'source_type'), name='unique_karma_total'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='KarmaDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('points', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='karma_daily', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('user', 'day'), name='unique_karma_daily'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='KarmaItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('points', models.PositiveIntegerField(default=0)),
+                ('comment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='karma_item', to='comments.comment')),
+                ('post', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='karma_item', to='posts.post')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='karma_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['recipient', '-likes'], name='karma_item_top_idx'),
+                ],
+                'constraints': [
+                    models.CheckConstraint(
+                        condition=(
+                            models.Q(('post__isnull', False), ('comment__isnull', True))
+                            | models.Q(('post__isnull', True), ('comment__isnull', False))
+                        ),
+                        name='karma_item_one_source',
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated manually: break ties on id so the profile's top items come
+# straight from the index instead of a sort.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('karma', '0002_karma_aggregates'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='karmaitem',
+            name='karma_item_top_idx',
+        ),
+        migrations.AddIndex(
+            model_name='karmaitem',
+            index=models.Index(fields=['recipient', '-likes', '-id'], name='karma_item_top_idx'),
+        ),
+    ]
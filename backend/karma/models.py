@@ -2,12 +2,15 @@ from django.conf import settings
 from django.db import models
 from django.db.models import Q
 
-from comments.models import CommentLike
-from posts.models import PostLike
+from comments.models import Comment, CommentLike
+from posts.models import Post, PostLike
 
 SOURCE_POST_LIKE = 'post_like'
 SOURCE_COMMENT_LIKE = 'comment_like'
 
+POST_LIKE_KARMA_POINTS = 5
+COMMENT_LIKE_KARMA_POINTS = 1
+
 
 class KarmaEvent(models.Model):
     SOURCE_POST_LIKE = SOURCE_POST_LIKE
@@ -65,3 +68,85 @@ class KarmaEvent(models.Model):
 
     def __str__(self):
         return f"{self.recipient_id} +{self.points} from {self.source_type}"
+
+
+# Aggregates below are maintained by karma.aggregates in the same
+# transaction that writes or removes each KarmaEvent.
+
+class KarmaTotal(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='karma_totals',
+    )
+    source_type = models.CharField(max_length=20, choices=KarmaEvent.SOURCE_CHOICES)
+    points = models.PositiveIntegerField(default=0)
+    events = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'source_type'], name='unique_karma_total'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.source_type}: {self.points}"
+
+
+class KarmaDaily(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='karma_daily',
+    )
+    day = models.DateField()
+    points = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_karma_daily'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day}: {self.points}"
+
+
+class KarmaItem(models.Model):
+    """Likes and karma received by one post or comment."""
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='karma_items',
+    )
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='karma_item',
+    )
+    comment = models.OneToOneField(
+        Comment,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='karma_item',
+    )
+    likes = models.PositiveIntegerField(default=0)
+    points = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-likes', '-id'], name='karma_item_top_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    (Q(post__isnull=False) & Q(comment__isnull=True))
+                    | (Q(post__isnull=True) & Q(comment__isnull=False))
+                ),
+                name='karma_item_one_source',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id or self.comment_id}: {self.likes} likes"
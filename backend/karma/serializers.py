@@ -1,12 +1,27 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
+from observability.timing import TimedSerializerMixin
+
 User = get_user_model()
 
 
-class LeaderboardUserSerializer(serializers.ModelSerializer):
+class LeaderboardUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     karma_24h = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
         fields = ['id', 'username', 'karma_24h']
+
+
+class KarmaPostSerializer(TimedSerializerMixin, serializers.Serializer):
+    id = serializers.IntegerField(source='post_id')
+    content = serializers.CharField(source='post.content')
+    like_count = serializers.IntegerField(source='likes')
+    karma = serializers.IntegerField(source='points')
+
+
+class KarmaCommentSerializer(KarmaPostSerializer):
+    id = serializers.IntegerField(source='comment_id')
+    post = serializers.IntegerField(source='comment.post_id')
+    content = serializers.CharField(source='comment.content')
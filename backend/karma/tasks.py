@@ -0,0 +1,99 @@
+"""
+Deferred karma awards. A like is written by the request; the KarmaEvent and
+the aggregate rollups follow from the task queue. Both tasks are idempotent:
+the event is one-to-one with its like, and a like removed before the task
+ran simply awards nothing.
+
+Sharded, an unlike cannot delete the like's events in the same transaction
+(they are in `default`), so it queues a revoke on the like's shard instead.
+"""
+from comments.models import CommentLike
+from observability.metrics import KARMA_EVENTS, KARMA_POINTS
+from posts.models import PostLike
+from posts.sharding import shard_for
+from tasks.models import Task
+from tasks.queue import task
+
+from .aggregates import apply_karma, revoke_karma
+from .models import (
+    COMMENT_LIKE_KARMA_POINTS,
+    POST_LIKE_KARMA_POINTS,
+    SOURCE_COMMENT_LIKE,
+    SOURCE_POST_LIKE,
+    KarmaEvent,
+)
+
+
+class AwardPending(Exception):
+    """The award of a removed like has not run yet; the revoke retries after it."""
+
+
+def _award(like, recipient_id, source_type, points, source_field):
+    event, created = KarmaEvent.objects.get_or_create(
+        **{source_field: like},
+        defaults={
+            'recipient_id': recipient_id,
+            'actor_id': like.user_id,
+            'source_type': source_type,
+            'points': points,
+        },
+    )
+    if created:
+        apply_karma([event])
+        KARMA_EVENTS.inc(source_type=source_type)
+        KARMA_POINTS.inc(points, source_type=source_type)
+
+
+@task('karma.award_post_like')
+def award_post_like(like_id):
+    like = PostLike.objects.using(shard_for(like_id)).select_related('post').filter(pk=like_id).first()
+    if like is not None:
+        _award(
+            like, like.post.author_id, SOURCE_POST_LIKE, POST_LIKE_KARMA_POINTS,
+            'source_post_like',
+        )
+
+
+@task('karma.award_comment_like')
+def award_comment_like(like_id):
+    like = (
+        CommentLike.objects.using(shard_for(like_id))
+        .select_related('comment')
+        .filter(pk=like_id)
+        .first()
+    )
+    if like is not None:
+        _award(
+            like, like.comment.author_id, SOURCE_COMMENT_LIKE, COMMENT_LIKE_KARMA_POINTS,
+            'source_comment_like',
+        )
+
+
+def _revoke(like, source_field, award_key):
+    events = list(KarmaEvent.objects.filter(**{f'{source_field}_id': like.pk}))
+    if not events:
+        # An award still queued (or running) finds the like gone and does
+        # nothing, but one already past that check may yet create the event.
+        awards = Task.objects.using(shard_for(like.pk)).filter(
+            idempotency_key=award_key, status__in=[Task.STATUS_PENDING, Task.STATUS_RUNNING]
+        )
+        if awards.exists():
+            raise AwardPending(award_key)
+    for event in events:
+        # The like is deleted by now; the stub carries what the aggregates need.
+        setattr(event, source_field, like)
+    revoke_karma(events)
+    KarmaEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+
+
+@task('karma.revoke_post_like', max_attempts=10)
+def revoke_post_like(like_id, post_id):
+    _revoke(PostLike(pk=like_id, post_id=post_id), 'source_post_like', f'karma:post_like:{like_id}')
+
+
+@task('karma.revoke_comment_like', max_attempts=10)
+def revoke_comment_like(like_id, comment_id):
+    _revoke(
+        CommentLike(pk=like_id, comment_id=comment_id), 'source_comment_like',
+        f'karma:comment_like:{like_id}',
+    )
@@ -79,3 +79,81 @@ class LeaderboardApiTests(TestCase):
             ['user1', 'user2', 'user3', 'user4', 'user5'],
         )
         self.assertEqual([row['karma_24h'] for row in data], [11, 10, 6, 5, 1])
+
+
+class KarmaProfileApiTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='pass1234') for i in range(3)]
+        self.posts = [Post.objects.create(author=self.author, content=f'post {i}') for i in range(2)]
+        self.comment = Comment.objects.create(author=self.author, post=self.posts[0], content='c')
+
+    def _profile(self, **params):
+        return self.client.get(reverse('karma-profile', args=[self.author.id]), params).json()
+
+    def test_profile_tracks_likes_and_unlikes(self):
+        for fan in self.fans:
+            self.client.force_login(fan)
+            self.client.post(f'/api/posts/{self.posts[1].id}/like/')
+        self.client.post(f'/api/posts/{self.posts[0].id}/like/')
+        self.client.post(f'/api/comments/{self.comment.id}/like/')
+        self.client.delete(f'/api/posts/{self.posts[1].id}/like/')
+
+        data = self._profile(days=7)
+        self.assertEqual(data['by_source'], {SOURCE_POST_LIKE: 15, SOURCE_COMMENT_LIKE: 1})
+        self.assertEqual(data['total_karma'], 16)
+        self.assertEqual(
+            [(row['id'], row['like_count'], row['karma']) for row in data['top_posts']],
+            [(self.posts[1].id, 2, 10), (self.posts[0].id, 1, 5)],
+        )
+        self.assertEqual(data['top_comments'][0]['post'], self.posts[0].id)
+        self.assertEqual(len(data['series']), 7)
+        self.assertEqual(data['series'][-1]['points'], 16)
+
+    def test_batch_writes_update_aggregates(self):
+        self.client.force_login(self.fans[0])
+        self.client.post(f'/api/comments/{self.comment.id}/like/')
+        self.client.post(
+            '/api/batch/',
+            {'operations': [
+                {'op': 'like_post', 'id': self.posts[0].id},
+                {'op': 'unlike_comment', 'id': self.comment.id},
+            ]},
+            content_type='application/json',
+        )
+        data = self._profile()
+        self.assertEqual(data['by_source'], {SOURCE_POST_LIKE: 5, SOURCE_COMMENT_LIKE: 0})
+        self.assertEqual(data['top_comments'], [])
+
+    def test_cascade_deletes_take_back_karma(self):
+        for fan in self.fans[:2]:
+            self.client.force_login(fan)
+            self.client.post(f'/api/posts/{self.posts[1].id}/like/')
+            self.client.post(f'/api/comments/{self.comment.id}/like/')
+        self.client.post(f'/api/posts/{self.posts[0].id}/like/')
+
+        # A user deleted in the admin takes their likes and events with them,
+        # in a number of queries that does not grow with their likes.
+        with self.assertNumQueries(30):
+            self.fans[0].delete()
+        data = self._profile()
+        self.assertEqual(data['by_source'], {SOURCE_POST_LIKE: 10, SOURCE_COMMENT_LIKE: 1})
+        self.assertEqual(
+            sorted((row['id'], row['like_count'], row['karma']) for row in data['top_posts']),
+            [(self.posts[0].id, 1, 5), (self.posts[1].id, 1, 5)],
+        )
+
+        with self.assertNumQueries(22):
+            self.posts[0].delete()
+        data = self._profile()
+        self.assertEqual(data['by_source'], {SOURCE_POST_LIKE: 5, SOURCE_COMMENT_LIKE: 0})
+        self.assertEqual(data['total_karma'], 5)
+        self.assertEqual(data['top_comments'], [])
+
+    def test_profile_does_not_scan_karma_events(self):
+        with self.assertNumQueries(5):
+            self._profile()
+
+    def test_rejects_bad_days(self):
+        response = self.client.get(reverse('karma-profile', args=[self.author.id]), {'days': '0'})
+        self.assertEqual(response.status_code, 400)
@@ -1,7 +1,10 @@
 from django.urls import path
 
-from .views import LeaderboardView
+from . import async_views
+from .views import KarmaProfileView, LeaderboardView
 
 urlpatterns = [
     path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
+    path('async/leaderboard/', async_views.leaderboard, name='async-leaderboard'),
+    path('users/<int:user_id>/karma/', KarmaProfileView.as_view(), name='karma-profile'),
 ]
@@ -3,31 +3,127 @@ from datetime import timedelta
 from django.contrib.auth import get_user_model
 from django.db.models import Q, Sum, Value
 from django.db.models.functions import Coalesce
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .serializers import LeaderboardUserSerializer
+from comments.models import Comment
+from posts.models import Post
+from posts.responses import LISTS, cached_response
+from posts.sharding import in_bulk, is_sharded
+
+from .models import KarmaDaily, KarmaEvent, KarmaItem, KarmaTotal
+from .serializers import KarmaCommentSerializer, KarmaPostSerializer, LeaderboardUserSerializer
 
 User = get_user_model()
 
+PROFILE_TOP_ITEMS = 5
+PROFILE_DEFAULT_DAYS = 30
+PROFILE_MAX_DAYS = 365
+
+
+def leaderboard_queryset():
+    """Top five users by karma received in the last 24 hours."""
+    window_start = timezone.now() - timedelta(hours=24)
+    return (
+        User.objects
+        .annotate(
+            karma_24h=Coalesce(
+                Sum(
+                    'karma_events_received__points',
+                    filter=Q(karma_events_received__created_at__gte=window_start),
+                ),
+                Value(0),
+            ),
+        )
+        .filter(karma_24h__gt=0)
+        .order_by('-karma_24h', 'id')[:5]
+    )
+
 
 class LeaderboardView(generics.ListAPIView):
     serializer_class = LeaderboardUserSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        window_start = timezone.now() - timedelta(hours=24)
-        return (
-            User.objects
-            .annotate(
-                karma_24h=Coalesce(
-                    Sum(
-                        'karma_events_received__points',
-                        filter=Q(karma_events_received__created_at__gte=window_start),
-                    ),
-                    Value(0),
-                ),
-            )
-            .filter(karma_24h__gt=0)
-            .order_by('-karma_24h', 'id')[:5]
+        return leaderboard_queryset()
+
+    def list(self, request, *args, **kwargs):
+        # The same five users for everyone, so signed-in users share the cached body too.
+        return cached_response(
+            request, LISTS, lambda: self.get_serializer(self.get_queryset(), many=True).data
+        )
+
+
+class KarmaProfileView(APIView):
+    """
+    GET /api/users/<id>/karma/?days=30 returns total karma, karma by source,
+    the user's most-liked posts and comments, and daily karma for the last
+    `days` days. Everything is read from the karma aggregates.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, user_id):
+        user = get_object_or_404(User, pk=user_id)
+        days = self._days(request)
+
+        by_source = dict(KarmaTotal.objects.filter(user=user).values_list('source_type', 'points'))
+        by_source = {source: by_source.get(source, 0) for source, _ in KarmaEvent.SOURCE_CHOICES}
+        items = KarmaItem.objects.filter(recipient=user, likes__gt=0).order_by('-likes', '-id')
+        top_posts = self._top_items(items, 'post', Post)
+        top_comments = self._top_items(items, 'comment', Comment)
+
+        start = timezone.localdate() - timedelta(days=days - 1)
+        daily = dict(
+            KarmaDaily.objects.filter(user=user, day__gte=start).values_list('day', 'points')
         )
+        series = [
+            {'date': day, 'points': daily.get(day, 0)}
+            for day in (start + timedelta(days=offset) for offset in range(days))
+        ]
+        return Response({
+            'id': user.id,
+            'username': user.username,
+            'total_karma': sum(by_source.values()),
+            'by_source': by_source,
+            'top_posts': KarmaPostSerializer(top_posts, many=True).data,
+            'top_comments': KarmaCommentSerializer(top_comments, many=True).data,
+            'series': series,
+        })
+
+    def _top_items(self, items, field, model):
+        """The first PROFILE_TOP_ITEMS of `items` about a `field` row that is not hidden."""
+        items = items.filter(**{f'{field}__isnull': False})
+        if not is_sharded():
+            return list(
+                items.filter(**{f'{field}__hidden_at__isnull': True})
+                .select_related(field)[:PROFILE_TOP_ITEMS]
+            )
+        # The rows are on the shards, so they are looked up by id rather than
+        # joined, a page of candidates at a time until enough are visible.
+        top = []
+        offset = 0
+        while len(top) < PROFILE_TOP_ITEMS:
+            page = list(items[offset:offset + PROFILE_TOP_ITEMS * 2])
+            if not page:
+                break
+            offset += len(page)
+            rows = in_bulk(
+                model.objects.filter(hidden_at__isnull=True),
+                [getattr(item, f'{field}_id') for item in page],
+            )
+            for item in page:
+                row = rows.get(getattr(item, f'{field}_id'))
+                if row is not None:
+                    setattr(item, field, row)
+                    top.append(item)
+        return top[:PROFILE_TOP_ITEMS]
+
+    def _days(self, request):
+        raw = request.query_params.get('days', str(PROFILE_DEFAULT_DAYS))
+        if not raw.isdigit() or not 1 <= int(raw) <= PROFILE_MAX_DAYS:
+            raise ValidationError({'days': f'Expected an integer from 1 to {PROFILE_MAX_DAYS}.'})
+        return int(raw)
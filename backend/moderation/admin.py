@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import UserPurge
+
+
+@admin.register(UserPurge)
+class UserPurgeAdmin(admin.ModelAdmin):
+    list_display = ['user', 'requested_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
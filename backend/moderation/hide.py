@@ -0,0 +1,96 @@
+"""
+Soft removal. Hiding is a few UPDATEs, so moderation takes effect at once:
+hidden rows drop out of every read path through `.visible()`. The purge
+task (moderation.purge) then deletes them in the background.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.authentication import token_cache
+from accounts.models import ApiToken
+from comments.models import Comment
+from posts.hotness import invalidate_post
+from posts.responses import invalidate_responses
+from posts.models import Post
+from posts.sharding import all_shards, atomic, shard_for
+from posts.state import invalidate_comment_state, invalidate_post_state
+
+from .models import UserPurge
+from .tasks import purge_hidden_content
+
+
+def _hide_replies(parents, hidden_at, alias):
+    """Hide every reply below `parents` on shard `alias`, one thread level per UPDATE."""
+    comments = Comment.objects.using(alias)
+    level = parents
+    while True:
+        ids = list(
+            comments.filter(parent__in=level, hidden_at__isnull=True).values_list('id', flat=True)
+        )
+        if not ids:
+            return
+        comments.filter(id__in=ids).update(hidden_at=hidden_at)
+        level = ids
+
+
+def _invalidate_posts(post_ids):
+    for post_id in post_ids:
+        invalidate_post(post_id)
+        invalidate_post_state(post_id)
+    invalidate_responses(post_ids)
+
+
+def hide_post(post):
+    shard = shard_for(post.pk)
+    with atomic(shard):
+        Post.objects.using(shard).filter(pk=post.pk, hidden_at__isnull=True).update(
+            hidden_at=timezone.now()
+        )
+        purge_hidden_content.enqueue(using=shard)
+    _invalidate_posts([post.pk])
+
+
+def hide_comment(comment):
+    """Hide a comment together with its whole reply thread."""
+    hidden_at = timezone.now()
+    shard = shard_for(comment.post_id)
+    with atomic(shard):
+        Comment.objects.using(shard).filter(pk=comment.pk, hidden_at__isnull=True).update(
+            hidden_at=hidden_at
+        )
+        _hide_replies([comment.pk], hidden_at, shard)
+        purge_hidden_content.enqueue(using=shard)
+    _invalidate_posts([comment.post_id])
+    if comment.parent_id:
+        invalidate_comment_state(comment.parent_id)
+
+
+def ban_user(user):
+    """
+    Deactivate `user`, revoke their tokens and hide everything they wrote.
+    Once their content is gone the purge removes their likes and follows
+    and deletes the account.
+    """
+    hidden_at = timezone.now()
+    post_ids = set()
+    with transaction.atomic():
+        type(user).objects.filter(pk=user.pk).update(is_active=False)
+        UserPurge.objects.get_or_create(user=user)
+        tokens = ApiToken.objects.filter(user=user)
+        key_hashes = list(tokens.values_list('key_hash', flat=True))
+        tokens.delete()
+        # Sharded, each shard commits its part before `default` commits the
+        # ban, so the purge never sees the ban without the hidden content.
+        for alias in all_shards():
+            with transaction.atomic(using=alias):
+                posts = Post.objects.using(alias).filter(author_id=user.pk)
+                posts.filter(hidden_at__isnull=True).update(hidden_at=hidden_at)
+                comments = Comment.objects.using(alias).filter(author_id=user.pk)
+                comments.filter(hidden_at__isnull=True).update(hidden_at=hidden_at)
+                _hide_replies(comments, hidden_at, alias)
+                post_ids.update(posts.values_list('id', flat=True))
+                post_ids.update(comments.values_list('post_id', flat=True).distinct())
+        purge_hidden_content.enqueue()
+    for key_hash in key_hashes:
+        token_cache.discard(key_hash)
+    _invalidate_posts(post_ids)
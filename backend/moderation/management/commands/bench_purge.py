@@ -0,0 +1,149 @@
+"""
+Time the batched purge against Django's cascading Model.delete() on a post
+with a large thread.
+Run: python manage.py bench_purge --comments 50000 --comment-likes 40000 --post-likes 2000
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from comments.models import Comment, CommentLike
+from karma.aggregates import apply_karma
+from karma.models import (
+    COMMENT_LIKE_KARMA_POINTS,
+    POST_LIKE_KARMA_POINTS,
+    SOURCE_COMMENT_LIKE,
+    SOURCE_POST_LIKE,
+    KarmaEvent,
+)
+from moderation.purge import PURGE_BATCH_SIZE, purge_hidden
+from posts.models import Post, PostLike
+from posts.sharding import is_sharded
+
+User = get_user_model()
+
+USERNAME_PREFIX = "bench_purge_"
+BULK_BATCH_SIZE = 2000
+
+
+def build_thread(users, num_comments, num_comment_likes, num_post_likes):
+    """One post with half its comments as replies, plus likes and their karma."""
+    author = users[0]
+    post = Post.objects.create(author=author, content="benchmark thread")
+    roots = Comment.objects.bulk_create(
+        [
+            Comment(author=users[i % len(users)], post=post, content=f"root {i}")
+            for i in range(num_comments - num_comments // 2)
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    replies = Comment.objects.bulk_create(
+        [
+            Comment(
+                author=users[i % len(users)], post=post, parent=roots[i % len(roots)],
+                content=f"reply {i}",
+            )
+            for i in range(num_comments // 2)
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    comments = roots + replies
+    post_likes = PostLike.objects.bulk_create(
+        [PostLike(user=users[i + 1], post=post) for i in range(num_post_likes)],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    comment_likes = CommentLike.objects.bulk_create(
+        [
+            CommentLike(user=users[i % len(users)], comment=comments[i % len(comments)])
+            for i in range(num_comment_likes)
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    events = [
+        KarmaEvent(
+            recipient=author, actor_id=like.user_id, source_type=SOURCE_POST_LIKE,
+            points=POST_LIKE_KARMA_POINTS, source_post_like=like,
+        )
+        for like in post_likes
+    ] + [
+        KarmaEvent(
+            recipient_id=like.comment.author_id, actor_id=like.user_id,
+            source_type=SOURCE_COMMENT_LIKE, points=COMMENT_LIKE_KARMA_POINTS,
+            source_comment_like=like,
+        )
+        for like in comment_likes
+    ]
+    for start in range(0, len(events), BULK_BATCH_SIZE):
+        with transaction.atomic():
+            apply_karma(KarmaEvent.objects.bulk_create(events[start:start + BULK_BATCH_SIZE]))
+    return post, len(comments) + len(post_likes) + len(comment_likes) + len(events)
+
+
+@contextmanager
+def measure(trace_memory):
+    result = {}
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - started
+        if trace_memory:
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = "Benchmark moderation.purge against Model.delete() on one large post"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=50000)
+        parser.add_argument("--comment-likes", type=int, default=40000)
+        parser.add_argument("--post-likes", type=int, default=2000)
+        parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="Also report peak Python memory (tracemalloc slows both runs down).",
+        )
+
+    def handle(self, *args, **options):
+        if is_sharded():
+            raise CommandError("The benchmark writes only `default`; unset SHARD_COUNT to run it.")
+        num_users = max(options["post_likes"] + 1, 100)
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        users = User.objects.bulk_create(
+            [User(username=f"{USERNAME_PREFIX}{i}") for i in range(num_users)],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        sizes = (options["comments"], options["comment_likes"], options["post_likes"])
+
+        results = {}
+        try:
+            post, rows = build_thread(users, *sizes)
+            self.stdout.write(f"Thread rows (comments, likes, karma events): {rows}")
+            with measure(options["memory"]) as results["Model.delete()"]:
+                Post.objects.get(pk=post.pk).delete()
+
+            post, _ = build_thread(users, *sizes)
+            with measure(options["memory"]) as results["hide + purge"]:
+                # Hide as hide_post does, but purge here rather than on the task queue.
+                Post.objects.filter(pk=post.pk).update(hidden_at=timezone.now())
+                purged, _ = purge_hidden(batch_size=options["batch_size"])
+            self.stdout.write(f"Purged {purged} rows in batches of {options['batch_size']}")
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+        for name, result in results.items():
+            line = f"  {name:<16} {result['seconds']:8.2f}s"
+            if "peak_mb" in result:
+                line += f"  peak {result['peak_mb']:.1f} MiB"
+            self.stdout.write(line)
+        speedup = results["Model.delete()"]["seconds"] / results["hide + purge"]["seconds"]
+        self.stdout.write(self.style.SUCCESS(f"Batched purge is {speedup:.1f}x faster"))
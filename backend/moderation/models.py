@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db import models
+
+
+class UserPurge(models.Model):
+    """A banned user whose account is deleted once their content is purged."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='purge',
+    )
+    requested_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Purge of user {self.user_id}"
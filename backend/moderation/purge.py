@@ -0,0 +1,312 @@
+"""
+Batched purge of moderated content.
+
+`moderation.hide` only marks rows hidden. This module deletes them and
+everything hanging off them, walking a fixed list of steps. Each step
+removes at most `batch_size` rows in one short transaction and fixes the
+derived state for exactly those rows with grouped UPDATEs: karma
+aggregates, post ranking scores, follower counts and the hot/state caches.
+Leaves go first, so every committed batch is consistent on its own:
+
+  likes (with their karma) -> notifications -> comments, newest first
+  -> timeline rows -> posts -> the banned users' own likes, follows and
+  notifications -> the users
+
+`Model.delete()` would instead load the whole cascade into memory and
+delete it inside a single transaction, holding SQLite's write lock for
+the entire time.
+
+Every step re-reads what is left from the database, so a purge can stop
+at any point and a later run carries on where it stopped.
+
+Sharded (posts.sharding), the post, comment and like steps run once per
+shard. Their batches commit `default` first, then the shard, so a crash in
+between leaves rows whose karma and notifications are already gone, which
+the next run deletes. Rows in `default` that point at hidden rows on a
+shard are matched by id, one chunk of the shard's hidden ids at a time.
+"""
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from comments.models import Comment, CommentLike
+from feed.fanout import drop_follows
+from feed.models import Follow, TimelineEntry
+from karma.aggregates import remove_karma
+from karma.models import KarmaEvent, KarmaItem
+from notifications.inbox import recount_unread
+from notifications.models import Notification, NotificationActor
+from posts.hotness import invalidate_post, like_counter
+from posts.responses import invalidate_responses
+from posts.models import Post, PostLike
+from posts.ranking import bump_scores
+from posts.sharding import all_shards, is_sharded
+from posts.state import invalidate_comment_states, invalidate_post_state
+
+from .models import UserPurge
+
+User = get_user_model()
+
+PURGE_BATCH_SIZE = 1000
+
+
+def _batch(queryset, batch_size, *fields, order='id'):
+    """
+    Lock and return up to `batch_size` `(id, *fields)` rows of `queryset`.
+    `order=None` lets the database return rows in index order, which saves
+    sorting every matching row when the batches can come in any order.
+    """
+    queryset = queryset.select_for_update(skip_locked=True, of=('self',))
+    queryset = queryset.order_by(order) if order else queryset.order_by()
+    return list(queryset.values_list('id', *fields)[:batch_size])
+
+
+def _delete_rows(model, ids, field='id', using=DEFAULT_DB_ALIAS):
+    """
+    DELETE the rows whose `field` is in `ids` without Django's cascade
+    collector, which would load every row first. Only for rows whose
+    dependents are already gone; anything missed fails the foreign key
+    check at commit instead of being left behind.
+    """
+    if ids:
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        column = quote(model._meta.get_field(field).column)
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', ids)
+
+
+def _hidden_posts(alias=DEFAULT_DB_ALIAS):
+    return Post.objects.using(alias).filter(hidden_at__isnull=False)
+
+
+def _hidden_comments(alias=DEFAULT_DB_ALIAS):
+    return Comment.objects.using(alias).filter(hidden_at__isnull=False)
+
+
+def _banned_users():
+    return UserPurge.objects.values('user_id')
+
+
+def _doomed_comments(alias=DEFAULT_DB_ALIAS):
+    # Two separate querysets rather than an OR, so each can use its index.
+    return [
+        Comment.objects.using(alias).filter(post__in=_hidden_posts(alias)),
+        _hidden_comments(alias),
+    ]
+
+
+def _id_chunks(queryset, chunk_size):
+    """The ids of `queryset` in ascending chunks of at most `chunk_size`."""
+    last = 0
+    while True:
+        ids = list(
+            queryset.filter(id__gt=last).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _referencing(step, model, field, targets):
+    """
+    The step `step(queryset, batch_size)` over the `model` rows in `default`
+    whose `field` is one of the `targets` rows. Unsharded that is a join;
+    sharded, `targets` is on a shard, so the rows are matched one chunk of
+    target ids at a time, moving on when a chunk has none left.
+    """
+    if not is_sharded():
+        return lambda n: step(model.objects.filter(**{f'{field}__in': targets}), n)
+
+    def run(batch_size):
+        for ids in _id_chunks(targets, batch_size):
+            removed = step(model.objects.filter(**{f'{field}_id__in': ids}), batch_size)
+            if removed:
+                return removed
+        return 0
+    return run
+
+
+def _on_commit_invalidate(post_ids=(), comment_ids=()):
+    def invalidate():
+        for post_id in post_ids:
+            invalidate_post(post_id)
+            invalidate_post_state(post_id)
+        invalidate_comment_states(comment_ids)
+        invalidate_responses(post_ids)
+    transaction.on_commit(invalidate)
+
+
+def hide_orphaned_replies(batch_size, alias=DEFAULT_DB_ALIAS):
+    """Hide visible replies to hidden comments (written while the parent was being hidden)."""
+    comments = Comment.objects.using(alias)
+    rows = _batch(
+        comments.filter(hidden_at__isnull=True, parent__in=_hidden_comments(alias)), batch_size
+    )
+    ids = [comment_id for comment_id, in rows]
+    comments.filter(id__in=ids).update(hidden_at=timezone.now())
+    return len(ids)
+
+
+def purge_post_likes(likes, batch_size, rescore=False):
+    rows = _batch(likes, batch_size, 'post_id', order=None)
+    if not rows:
+        return 0
+    ids = [like_id for like_id, _ in rows]
+    remove_karma(KarmaEvent.objects.filter(source_post_like_id__in=ids), items=rescore)
+    _delete_rows(KarmaEvent, ids, field='source_post_like')
+    _delete_rows(PostLike, ids, using=likes.db)
+    if rescore:
+        per_post = Counter(post_id for _, post_id in rows)
+        for post_id, likes_removed in per_post.items():
+            bump_scores(post_id, likes=-likes_removed)
+
+        def adjust():
+            for post_id, likes_removed in per_post.items():
+                like_counter.adjust(post_id, -likes_removed)
+        transaction.on_commit(adjust)
+        _on_commit_invalidate(post_ids=per_post)
+    return len(rows)
+
+
+def purge_comment_likes(likes, batch_size, rescore=False):
+    rows = _batch(likes, batch_size, 'comment_id', order=None)
+    if not rows:
+        return 0
+    ids = [like_id for like_id, _ in rows]
+    remove_karma(KarmaEvent.objects.filter(source_comment_like_id__in=ids), items=rescore)
+    _delete_rows(KarmaEvent, ids, field='source_comment_like')
+    _delete_rows(CommentLike, ids, using=likes.db)
+    if rescore:
+        _on_commit_invalidate(comment_ids={comment_id for _, comment_id in rows})
+    return len(rows)
+
+
+def purge_notifications(notifications, batch_size):
+    rows = _batch(notifications, batch_size, 'recipient_id', order=None)
+    ids = [notification_id for notification_id, _ in rows]
+    _delete_rows(NotificationActor, ids, field='notification')
+    _delete_rows(Notification, ids)
+    recount_unread({recipient_id for _, recipient_id in rows})
+    return len(rows)
+
+
+def purge_comments(comments, batch_size):
+    # Newest first: a reply always has a larger id than its parent, so no
+    # batch deletes a comment whose replies are still there.
+    rows = _batch(comments, batch_size, 'post_id', 'parent_id', order='-id')
+    if not rows:
+        return 0
+    ids = [comment_id for comment_id, _, _ in rows]
+    _delete_rows(KarmaItem, ids, field='comment')
+    _delete_rows(Comment, ids, using=comments.db)
+    per_post = Counter(post_id for _, post_id, _ in rows)
+    for post_id, removed in per_post.items():
+        bump_scores(post_id, comments=-removed)
+    _on_commit_invalidate(
+        post_ids=per_post, comment_ids={parent_id for _, _, parent_id in rows if parent_id}
+    )
+    return len(rows)
+
+
+def purge_timeline_entries(entries, batch_size):
+    ids = [entry_id for entry_id, in _batch(entries, batch_size)]
+    TimelineEntry.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def purge_posts(batch_size, alias=DEFAULT_DB_ALIAS):
+    ids = [post_id for post_id, in _batch(_hidden_posts(alias), batch_size)]
+    # Only the posts' KarmaItems are left by now, in `default`.
+    _delete_rows(KarmaItem, ids, field='post')
+    Post.objects.using(alias).filter(id__in=ids).delete()
+    _on_commit_invalidate(post_ids=ids)
+    return len(ids)
+
+
+def purge_follows(follows, batch_size):
+    ids = [follow_id for follow_id, in _batch(follows, batch_size)]
+    drop_follows(ids)
+    return len(ids)
+
+
+def purge_users(batch_size):
+    banned = User.objects.filter(pk__in=_banned_users())
+    ids = [user_id for user_id, in _batch(banned, batch_size)]
+    User.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def _shard_steps(alias, banned):
+    """The steps for the posts, comments and likes on `alias`, as `(alias, step)`."""
+    posts_gone, comments_gone = _doomed_comments(alias)
+    comment_likes = CommentLike.objects.using(alias)
+    post_likes = PostLike.objects.using(alias)
+    steps = [
+        lambda n: hide_orphaned_replies(n, alias),
+        # Joins rather than `comment__in`, which would build the list of
+        # every doomed comment again for each batch.
+        lambda n: purge_comment_likes(
+            comment_likes.filter(comment__post__hidden_at__isnull=False), n
+        ),
+        lambda n: purge_comment_likes(comment_likes.filter(comment__hidden_at__isnull=False), n),
+        lambda n: purge_post_likes(post_likes.filter(post__in=_hidden_posts(alias)), n),
+        _referencing(purge_notifications, Notification, 'post', _hidden_posts(alias)),
+        _referencing(purge_notifications, Notification, 'comment', _hidden_comments(alias)),
+        lambda n: purge_comments(posts_gone, n),
+        lambda n: purge_comments(comments_gone, n),
+        _referencing(purge_timeline_entries, TimelineEntry, 'post', _hidden_posts(alias)),
+        lambda n: purge_posts(n, alias),
+        # Banned users' activity on content that stays up.
+        lambda n: purge_post_likes(post_likes.filter(user__in=banned), n, rescore=True),
+        lambda n: purge_comment_likes(comment_likes.filter(user__in=banned), n, rescore=True),
+    ]
+    return [(alias, step) for step in steps]
+
+
+def steps():
+    """The purge steps in order, each `(alias, step)`: a callable taking `batch_size`."""
+    # A list of ids rather than a subquery: on a shard, UserPurge is empty.
+    banned = list(_banned_users().values_list('user_id', flat=True))
+    shard_steps = [step for alias in all_shards() for step in _shard_steps(alias, banned)]
+    return shard_steps + [
+        (DEFAULT_DB_ALIAS, step) for step in [
+            lambda n: purge_follows(Follow.objects.filter(follower__in=banned), n),
+            lambda n: purge_follows(Follow.objects.filter(followee__in=banned), n),
+            lambda n: purge_timeline_entries(TimelineEntry.objects.filter(owner__in=banned), n),
+            lambda n: purge_notifications(Notification.objects.filter(actor__in=banned), n),
+            lambda n: purge_notifications(Notification.objects.filter(recipient__in=banned), n),
+            purge_users,
+        ]
+    ]
+
+
+def purge_hidden(batch_size=PURGE_BATCH_SIZE, time_limit=None):
+    """
+    Purge until nothing hidden is left or `time_limit` seconds have passed.
+    Returns `(rows_removed, finished)`.
+    """
+    started = time.monotonic()
+    total = 0
+    while True:
+        # Content hidden during a pass is picked up by the next one.
+        removed_in_pass = 0
+        for alias, step in steps():
+            while True:
+                # `default` commits first; see the module docstring.
+                with transaction.atomic(using=alias), transaction.atomic():
+                    removed = step(batch_size)
+                if not removed:
+                    break
+                removed_in_pass += removed
+                if time_limit is not None and time.monotonic() - started >= time_limit:
+                    return total + removed_in_pass, False
+        total += removed_in_pass
+        if not removed_in_pass:
+            return total, True
@@ -0,0 +1,13 @@
+from django.conf import settings
+
+from tasks.queue import task
+
+from .purge import purge_hidden
+
+
+@task('moderation.purge_hidden', atomic=False)
+def purge_hidden_content():
+    """Purge hidden content in short transactions, handing over to a fresh task when time runs out."""
+    _, finished = purge_hidden(time_limit=settings.MODERATION_PURGE_TIME_LIMIT)
+    if not finished:
+        purge_hidden_content.enqueue()
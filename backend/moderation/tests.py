@@ -0,0 +1,114 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from comments.models import Comment, CommentLike
+from feed.models import Follow, FollowerCount
+from karma.models import KarmaDaily, KarmaEvent, KarmaItem, KarmaTotal
+from notifications.models import Notification, NotificationInbox
+from posts.models import Post, PostLike
+
+from .models import UserPurge
+from .purge import purge_hidden
+
+User = get_user_model()
+
+
+class ModerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', password='pass1234', is_staff=True)
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='hello')
+
+    def _as(self, user, method, url, data=None):
+        self.client.force_login(user)
+        return getattr(self.client, method)(url, data)
+
+    def _comment(self, user, content, parent=None):
+        data = {'post': self.post.id, 'content': content}
+        if parent:
+            data['parent'] = parent
+        return self._as(user, 'post', '/api/comments/', data).json()['id']
+
+    def _moderate(self, url):
+        # The purge task commits its own transactions, so it runs on commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._as(self.admin, 'post', url)
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def _points(self, user):
+        return sum(KarmaTotal.objects.filter(user=user).values_list('points', flat=True))
+
+    def test_hide_post_purges_thread_and_karma(self):
+        comment = self._comment(self.fan, 'first')
+        self._comment(self.author, 'reply', parent=comment)
+        self._as(self.fan, 'post', f'/api/posts/{self.post.id}/like/')
+        self._as(self.author, 'post', f'/api/comments/{comment}/like/')
+        self.assertEqual(self._points(self.author), 5)
+        self.assertEqual(self._points(self.fan), 1)
+
+        self._moderate(f'/api/moderation/posts/{self.post.id}/hide/')
+        self.assertEqual(self._as(self.fan, 'get', f'/api/posts/{self.post.id}/').status_code, 404)
+        for model in (Post, Comment, PostLike, CommentLike, KarmaEvent, KarmaItem, Notification):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        self.assertEqual(NotificationInbox.objects.get(user=self.author).unread, 0)
+        self.assertEqual(self._points(self.author), 0)
+        self.assertEqual(self._points(self.fan), 0)
+        self.assertEqual(sum(KarmaDaily.objects.values_list('points', flat=True)), 0)
+
+    def test_hide_comment_purges_replies_and_rescores(self):
+        keep = self._comment(self.fan, 'keep')
+        spam = self._comment(self.fan, 'spam')
+        reply = self._comment(self.author, 'reply', parent=spam)
+        self._as(self.fan, 'post', f'/api/comments/{reply}/like/')
+        self.post.refresh_from_db()
+        top_score = self.post.top_score
+
+        self._moderate(f'/api/moderation/comments/{spam}/hide/')
+        self.assertEqual(list(Comment.objects.values_list('id', flat=True)), [keep])
+        self.assertFalse(CommentLike.objects.exists())
+        self.assertEqual(self._points(self.author), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.top_score, top_score - 4)
+        detail = self._as(self.fan, 'get', f'/api/posts/{self.post.id}/').json()
+        self.assertEqual(detail['comment_count'], 1)
+
+    def test_ban_user_removes_content_likes_and_follows(self):
+        spammer = User.objects.create_user(username='spammer', password='pass1234')
+        Post.objects.create(author=spammer, content='buy now')
+        self._comment(spammer, 'buy now')
+        self._as(spammer, 'post', f'/api/posts/{self.post.id}/like/')
+        self._as(spammer, 'post', f'/api/users/{self.author.id}/follow/')
+        self._as(self.fan, 'post', f'/api/posts/{self.post.id}/like/')
+
+        self._moderate(f'/api/moderation/users/{spammer.id}/ban/')
+        self.assertFalse(User.objects.filter(pk=spammer.pk).exists())
+        self.assertFalse(UserPurge.objects.exists())
+        self.assertEqual(list(Post.objects.values_list('id', flat=True)), [self.post.id])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(FollowerCount.objects.get(user=self.author).total, 0)
+        self.assertEqual(self._points(self.author), 5)
+        self.assertEqual(KarmaItem.objects.get(post=self.post).likes, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.top_score, 1)
+
+    def test_purge_resumes_after_time_limit(self):
+        for i in range(3):
+            self._comment(self.fan, f'c{i}')
+        Post.objects.update(hidden_at=self.post.created_at)
+        removed, finished = purge_hidden(batch_size=1, time_limit=0)
+        self.assertEqual((removed, finished), (1, False))
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(purge_hidden(batch_size=1), (3, True))
+        self.assertFalse(Post.objects.exists())
+
+    def test_staff_only(self):
+        response = self._as(self.fan, 'post', f'/api/moderation/posts/{self.post.id}/hide/')
+        self.assertEqual(response.status_code, 403)
+        response = self._as(self.admin, 'post', f'/api/moderation/users/{self.admin.id}/ban/')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Post.objects.visible().exists())
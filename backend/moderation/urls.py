@@ -0,0 +1,13 @@
+from django.urls import path
+
+from .views import BanUserView, HideCommentView, HidePostView
+
+urlpatterns = [
+    path('moderation/posts/<int:post_id>/hide/', HidePostView.as_view(), name='hide-post'),
+    path(
+        'moderation/comments/<int:comment_id>/hide/',
+        HideCommentView.as_view(),
+        name='hide-comment',
+    ),
+    path('moderation/users/<int:user_id>/ban/', BanUserView.as_view(), name='ban-user'),
+]
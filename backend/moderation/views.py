@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from comments.models import Comment
+from posts.models import Post
+from posts.sharding import shard_for
+
+from .hide import ban_user, hide_comment, hide_post
+
+User = get_user_model()
+
+
+class HidePostView(APIView):
+    """POST /api/moderation/posts/<id>/hide/ hides a post now and purges it in the background."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, post_id):
+        post = get_object_or_404(Post.objects.using(shard_for(post_id)).visible(), pk=post_id)
+        hide_post(post)
+        return Response({'post_id': post.id, 'hidden': True}, status=status.HTTP_202_ACCEPTED)
+
+
+class HideCommentView(APIView):
+    """POST /api/moderation/comments/<id>/hide/ hides a comment and its replies."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, comment_id):
+        comment = get_object_or_404(
+            Comment.objects.using(shard_for(comment_id)).visible(), pk=comment_id
+        )
+        hide_comment(comment)
+        return Response(
+            {'comment_id': comment.id, 'hidden': True}, status=status.HTTP_202_ACCEPTED
+        )
+
+
+class BanUserView(APIView):
+    """POST /api/moderation/users/<id>/ban/ deactivates a user and purges their content."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, user_id):
+        user = get_object_or_404(User, pk=user_id)
+        if user.is_staff:
+            return Response(
+                {'detail': 'Staff accounts cannot be banned.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        ban_user(user)
+        return Response({'user_id': user.id, 'banned': True}, status=status.HTTP_202_ACCEPTED)
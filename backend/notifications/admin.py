@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from posts.admin_pagination import EstimatedCountPaginator
+
+from .models import Notification, NotificationInbox
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'recipient', 'kind', 'actor', 'actor_count', 'updated_at']
+    list_select_related = ['recipient', 'actor']
+    raw_id_fields = ['recipient', 'actor', 'post', 'comment']
+    search_fields = ['recipient__username__exact']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(NotificationInbox)
+class NotificationInboxAdmin(admin.ModelAdmin):
+    list_display = ['user', 'unread', 'read_until']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
@@ -0,0 +1,137 @@
+"""
+Notification inboxes, written at action time (fan-out on write).
+
+A like or a reply adds one row to the recipient's inbox, from the task
+queue (notifications.tasks). Actions on the same target that arrive while
+its entry is still unread, and within NOTIFICATIONS_COALESCE_SECONDS of
+it, update that entry instead of adding one, so a burst of likes reads as
+"N people liked your post"; a person acting again is not counted twice.
+
+Reading is cheap on both ends. Each inbox keeps its unread count and its
+last-read cursor in a NotificationInbox row, so polling is one primary
+key lookup. A page of the inbox is a single range scan on
+(recipient, updated_at, id).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from observability.metrics import NOTIFICATIONS_WRITTEN
+
+from .models import Notification, NotificationActor, NotificationInbox
+
+
+def _locked_inbox(user_id):
+    NotificationInbox.objects.get_or_create(user_id=user_id)
+    # Serialises writers per recipient, so two actions on one target
+    # coalesce instead of both inserting an entry.
+    return NotificationInbox.objects.select_for_update().get(pk=user_id)
+
+
+def _unread_since(user_id, read_until):
+    entries = Notification.objects.filter(recipient_id=user_id)
+    if read_until is not None:
+        entries = entries.filter(updated_at__gt=read_until)
+    return entries
+
+
+def unread_count(user_id):
+    return (
+        NotificationInbox.objects.filter(pk=user_id).values_list('unread', flat=True).first()
+        or 0
+    )
+
+
+def notify(recipient_id, kind, actor_id, post_id, comment_id=None):
+    """Record one action in `recipient_id`'s inbox. Returns True if it added an entry."""
+    if recipient_id == actor_id:
+        return False
+    now = timezone.now()
+    with transaction.atomic():
+        inbox = _locked_inbox(recipient_id)
+        since = now - timedelta(seconds=settings.NOTIFICATIONS_COALESCE_SECONDS)
+        if inbox.read_until is not None:
+            since = max(since, inbox.read_until)
+        entry_id = (
+            Notification.objects
+            .filter(
+                recipient_id=recipient_id, post_id=post_id, comment_id=comment_id, kind=kind,
+                updated_at__gt=since,
+            )
+            .values_list('id', flat=True)
+            .first()
+        )
+        coalesced = entry_id is not None
+        if coalesced:
+            # Someone who acts again (a like, unlike and like) is still one person.
+            _, new_actor = NotificationActor.objects.get_or_create(
+                notification_id=entry_id, actor_id=actor_id
+            )
+            Notification.objects.filter(pk=entry_id).update(
+                actor_id=actor_id, actor_count=F('actor_count') + int(new_actor), updated_at=now,
+            )
+        else:
+            entry = Notification.objects.create(
+                recipient_id=recipient_id, kind=kind, actor_id=actor_id,
+                post_id=post_id, comment_id=comment_id, updated_at=now,
+            )
+            NotificationActor.objects.create(notification=entry, actor_id=actor_id)
+            NotificationInbox.objects.filter(pk=recipient_id).update(unread=F('unread') + 1)
+    NOTIFICATIONS_WRITTEN.inc(kind=kind, result='coalesced' if coalesced else 'new')
+    return not coalesced
+
+
+def mark_read(user_id, until=None):
+    """
+    Move the last-read cursor to `until` (default: the newest entry) and
+    return the inbox. The cursor never moves backwards, and never past the
+    newest entry: a cursor in the future would swallow actions that have
+    not happened yet and stop them from coalescing.
+    """
+    with transaction.atomic():
+        inbox = _locked_inbox(user_id)
+        newest = (
+            Notification.objects.filter(recipient_id=user_id)
+            .order_by('-updated_at', '-id')
+            .values_list('updated_at', flat=True)
+            .first()
+        )
+        if newest is None:
+            return inbox
+        until = newest if until is None else min(until, newest)
+        if inbox.read_until is not None and until <= inbox.read_until:
+            return inbox
+        inbox.read_until = until
+        inbox.unread = _unread_since(user_id, until).count()
+        inbox.save(update_fields=['read_until', 'unread'])
+    return inbox
+
+
+def recount_unread(user_ids):
+    """Recompute the unread counters of `user_ids` after entries were deleted."""
+    inboxes = NotificationInbox.objects.filter(pk__in=user_ids).values_list('pk', 'read_until')
+    for user_id, read_until in inboxes:
+        NotificationInbox.objects.filter(pk=user_id).update(
+            unread=_unread_since(user_id, read_until).count()
+        )
+
+
+def inbox_page(user_id, cursor, page_size):
+    """
+    One page of `user_id`'s inbox, most recently updated first, plus whether
+    there is a next page. `cursor` is the `(updated_at, id)` of the last
+    entry on the previous page, or None.
+    """
+    entries = Notification.objects.filter(recipient_id=user_id)
+    if cursor is not None:
+        updated_at, entry_id = cursor
+        entries = entries.filter(
+            Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=entry_id)
+        )
+    rows = list(
+        entries.select_related('actor').order_by('-updated_at', '-id')[:page_size + 1]
+    )
+    return rows[:page_size], len(rows) > page_size
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.db import models
+
+from comments.models import Comment
+from posts.models import Post
+
+KIND_POST_LIKE = 'post_like'
+KIND_COMMENT_LIKE = 'comment_like'
+KIND_REPLY = 'reply'
+
+
+class Notification(models.Model):
+    """
+    One entry in a user's inbox. A burst of activity on the same target is
+    coalesced into a single row: `actor` is the latest actor, `actor_count`
+    how many different people acted (NotificationActor), and `updated_at`
+    moves forward with each action so the row comes back to the top of the
+    inbox.
+
+    `post` is always set; `comment` is the liked comment for comment likes
+    and the comment replied to for replies.
+    """
+    KIND_CHOICES = [
+        (KIND_POST_LIKE, 'Post Like'),
+        (KIND_COMMENT_LIKE, 'Comment Like'),
+        (KIND_REPLY, 'Reply'),
+    ]
+
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    comment = models.ForeignKey(
+        Comment,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    actor_count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The inbox page and the unread recount.
+            models.Index(fields=['recipient', '-updated_at', '-id'], name='notification_inbox_idx'),
+            # The coalescing lookup for a new action on the same target.
+            models.Index(fields=['recipient', 'post', 'comment', 'kind'], name='notification_target_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} x{self.actor_count} for {self.recipient_id}"
+
+
+class NotificationActor(models.Model):
+    """One person behind a Notification, so repeat actions are not counted twice."""
+    notification = models.ForeignKey(
+        Notification,
+        on_delete=models.CASCADE,
+        related_name='actors',
+    )
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['notification', 'actor'], name='notification_actor_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.actor_id} on {self.notification_id}"
+
+
+class NotificationInbox(models.Model):
+    """
+    Per-user inbox state. `read_until` is the last-read cursor: entries
+    updated after it are unread, and `unread` counts them, so polling for
+    news is a primary key lookup.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_inbox',
+    )
+    unread = models.PositiveIntegerField(default=0)
+    read_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
@@ -0,0 +1,28 @@
+from rest_framework import serializers
+
+from .models import Notification
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    actor_username = serializers.CharField(source='actor.username', read_only=True)
+    unread = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = [
+            'id',
+            'kind',
+            'post',
+            'comment',
+            'actor',
+            'actor_username',
+            'actor_count',
+            'unread',
+            'created_at',
+            'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_unread(self, obj):
+        read_until = self.context.get('read_until')
+        return read_until is None or obj.updated_at > read_until
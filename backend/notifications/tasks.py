@@ -0,0 +1,46 @@
+"""
+Deferred inbox writes. The like or reply is committed by the request and
+its notification follows from the task queue; an action undone before the
+task ran notifies nobody.
+"""
+from comments.models import Comment, CommentLike
+from posts.models import PostLike
+from posts.sharding import shard_for
+from tasks.queue import task
+
+from .inbox import notify
+from .models import KIND_COMMENT_LIKE, KIND_POST_LIKE, KIND_REPLY
+
+
+@task('notifications.post_like')
+def notify_post_like(like_id):
+    like = PostLike.objects.using(shard_for(like_id)).select_related('post').filter(pk=like_id).first()
+    if like is not None:
+        notify(like.post.author_id, KIND_POST_LIKE, like.user_id, like.post_id)
+
+
+@task('notifications.comment_like')
+def notify_comment_like(like_id):
+    like = (
+        CommentLike.objects.using(shard_for(like_id))
+        .select_related('comment')
+        .filter(pk=like_id)
+        .first()
+    )
+    if like is not None:
+        notify(
+            like.comment.author_id, KIND_COMMENT_LIKE, like.user_id,
+            like.comment.post_id, like.comment_id,
+        )
+
+
+@task('notifications.reply')
+def notify_reply(comment_id):
+    reply = (
+        Comment.objects.using(shard_for(comment_id))
+        .select_related('parent')
+        .filter(pk=comment_id)
+        .first()
+    )
+    if reply is not None and reply.parent is not None:
+        notify(reply.parent.author_id, KIND_REPLY, reply.author_id, reply.post_id, reply.parent_id)
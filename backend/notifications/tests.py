@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from posts.models import Post
+from posts.pagination import encode_time_cursor
+
+from .models import KIND_POST_LIKE, KIND_REPLY, Notification, NotificationInbox
+
+User = get_user_model()
+
+
+class NotificationApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fans = [
+            User.objects.create_user(username=f'fan{i}', password='pass1234') for i in range(3)
+        ]
+        self.post = Post.objects.create(author=self.author, content='hello')
+
+    def _as(self, user, method, url, data=None):
+        self.client.force_login(user)
+        return getattr(self.client, method)(url, data)
+
+    def _inbox(self, **params):
+        return self._as(self.author, 'get', '/api/notifications/', params).json()
+
+    def _unread(self):
+        return self._as(self.author, 'get', '/api/notifications/unread/').json()['unread']
+
+    def test_likes_coalesce_into_one_entry(self):
+        for fan in self.fans:
+            self._as(fan, 'post', f'/api/posts/{self.post.id}/like/')
+        inbox = self._inbox()
+        self.assertEqual(inbox['unread'], 1)
+        [entry] = inbox['results']
+        self.assertEqual(entry['kind'], KIND_POST_LIKE)
+        self.assertEqual(entry['actor_count'], 3)
+        self.assertEqual(entry['actor_username'], 'fan2')
+        self.assertTrue(entry['unread'])
+
+    def test_repeat_actions_count_one_person(self):
+        url = f'/api/posts/{self.post.id}/'
+        self._as(self.fans[0], 'post', url + 'like/')
+        self._as(self.fans[1], 'post', url + 'like/')
+        self._as(self.fans[0], 'delete', url + 'like/')
+        self._as(self.fans[0], 'post', url + 'like/')
+        [entry] = self._inbox()['results']
+        self.assertEqual(entry['actor_count'], 2)
+        self.assertEqual(entry['actor_username'], 'fan0')
+
+    def test_read_cursor_starts_a_new_entry(self):
+        self._as(self.fans[0], 'post', f'/api/posts/{self.post.id}/like/')
+        response = self._as(self.author, 'post', '/api/notifications/read/')
+        self.assertEqual(response.json()['unread'], 0)
+        self.assertEqual(self._unread(), 0)
+
+        self._as(self.fans[1], 'post', f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(self._unread(), 1)
+        entries = self._inbox()['results']
+        self.assertEqual([e['actor_count'] for e in entries], [1, 1])
+        self.assertEqual([e['unread'] for e in entries], [True, False])
+
+    def test_read_until_keeps_newer_entries_unread(self):
+        comment = self._as(self.author, 'post', '/api/comments/', {
+            'post': self.post.id, 'content': 'mine',
+        }).json()['id']
+        self._as(self.fans[0], 'post', f'/api/posts/{self.post.id}/like/')
+        seen = self._inbox()['results'][0]['updated_at']
+        self._as(self.fans[1], 'post', '/api/comments/', {
+            'post': self.post.id, 'parent': comment, 'content': 'reply',
+        })
+        response = self._as(self.author, 'post', '/api/notifications/read/', {'until': seen})
+        self.assertEqual(response.json()['unread'], 1)
+        self.assertEqual(self._inbox()['results'][0]['kind'], KIND_REPLY)
+
+    def test_read_until_is_validated_and_clamped(self):
+        url = '/api/notifications/read/'
+        self.client.force_login(self.author)
+        response = self.client.post(url, {'until': 12}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # A cursor in the future stops at the newest entry, so later likes are unread.
+        self._as(self.fans[0], 'post', f'/api/posts/{self.post.id}/like/')
+        future = (timezone.now() + timedelta(days=1)).isoformat()
+        response = self._as(self.author, 'post', url, {'until': future}).json()
+        self.assertEqual(response['read_until'], self._inbox()['results'][0]['updated_at'])
+
+        self._as(self.fans[1], 'post', f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(self._unread(), 1)
+
+    def test_self_actions_and_top_level_comments_notify_nobody(self):
+        self._as(self.fans[0], 'post', '/api/comments/', {'post': self.post.id, 'content': 'hi'})
+        comment = self._as(self.author, 'post', '/api/comments/', {
+            'post': self.post.id, 'content': 'mine',
+        }).json()['id']
+        self._as(self.author, 'post', '/api/comments/', {
+            'post': self.post.id, 'parent': comment, 'content': 'me again',
+        })
+        self.assertFalse(Notification.objects.exists())
+
+    @override_settings(NOTIFICATIONS_COALESCE_SECONDS=60)
+    def test_old_entries_are_not_coalesced(self):
+        self._as(self.fans[0], 'post', f'/api/posts/{self.post.id}/like/')
+        Notification.objects.update(updated_at=self.post.created_at - timedelta(minutes=5))
+        self._as(self.fans[1], 'post', f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(NotificationInbox.objects.get(user=self.author).unread, 2)
+
+    def test_cursor_pages_through_inbox(self):
+        comments = [
+            self._as(self.author, 'post', '/api/comments/', {
+                'post': self.post.id, 'content': f'c{i}',
+            }).json()['id']
+            for i in range(3)
+        ]
+        for comment in comments:
+            self._as(self.fans[0], 'post', f'/api/comments/{comment}/like/')
+        first = self._inbox(page_size=2)
+        second = self.client.get(first['next']).json()
+        ids = [e['comment'] for e in first['results'] + second['results']]
+        self.assertEqual(ids, comments[::-1])
+        self.assertIsNone(second['next'])
+
+    def test_rejects_cursor_without_utc_offset(self):
+        cursor = encode_time_cursor(datetime(2026, 1, 1), 1)
+        response = self._as(self.author, 'get', '/api/notifications/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_likes_and_replies_notify(self):
+        comment = self._as(self.author, 'post', '/api/comments/', {
+            'post': self.post.id, 'content': 'mine',
+        }).json()['id']
+        self.client.force_login(self.fans[0])
+        response = self.client.post('/api/batch/', {'operations': [
+            {'op': 'like_post', 'id': self.post.id},
+            {'op': 'like_comment', 'id': comment},
+            {'op': 'create_comment', 'post': self.post.id, 'parent': comment, 'content': 'hi'},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._unread(), 3)
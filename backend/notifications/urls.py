@@ -0,0 +1,9 @@
+from django.urls import path
+
+from .views import NotificationListView, NotificationReadView, NotificationUnreadView
+
+urlpatterns = [
+    path('notifications/', NotificationListView.as_view(), name='notifications'),
+    path('notifications/unread/', NotificationUnreadView.as_view(), name='notifications-unread'),
+    path('notifications/read/', NotificationReadView.as_view(), name='notifications-read'),
+]
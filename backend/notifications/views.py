@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from posts.pagination import decode_time_cursor, encode_time_cursor
+
+from .inbox import inbox_page, mark_read, unread_count
+from .models import NotificationInbox
+from .serializers import NotificationSerializer
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _parse_datetime(value, field):
+    if not isinstance(value, str):
+        raise ValidationError({field: 'Expected an ISO 8601 timestamp.'})
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({field: 'Expected an ISO 8601 timestamp.'})
+    if parsed.tzinfo is None:
+        raise ValidationError({field: 'Expected a timestamp with a UTC offset.'})
+    return parsed
+
+
+class NotificationListView(APIView):
+    """
+    GET /api/notifications/?cursor=...&page_size=20 returns the caller's
+    inbox, most recently updated first, with the unread count and a `next`
+    link. Reading does not mark anything read.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        page_size = self._page_size(request)
+        cursor = request.query_params.get('cursor')
+        entries, has_next = inbox_page(
+            request.user.id, decode_time_cursor(cursor) if cursor else None, page_size
+        )
+        inbox = NotificationInbox.objects.filter(pk=request.user.id).first()
+        serializer = NotificationSerializer(
+            entries, many=True, context={'read_until': inbox.read_until if inbox else None}
+        )
+        next_link = None
+        if has_next:
+            last = entries[-1]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_time_cursor(last.updated_at, last.id)
+            )
+        return Response({
+            'unread': inbox.unread if inbox else 0,
+            'next': next_link,
+            'results': serializer.data,
+        })
+
+    def _page_size(self, request):
+        raw = request.query_params.get('page_size', str(DEFAULT_PAGE_SIZE))
+        if not raw.isdigit() or int(raw) < 1:
+            raise ValidationError({'page_size': 'Expected a positive integer.'})
+        return min(int(raw), MAX_PAGE_SIZE)
+
+
+class NotificationUnreadView(APIView):
+    """GET /api/notifications/unread/ returns the caller's unread count, for polling."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({'unread': unread_count(request.user.id)})
+
+
+class NotificationReadView(APIView):
+    """
+    POST /api/notifications/read/ marks the inbox read up to `until` (the
+    `updated_at` of the newest entry the client showed), or up to the
+    newest entry when `until` is left out.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        until = request.data.get('until')
+        inbox = mark_read(
+            request.user.id, None if until in (None, '') else _parse_datetime(until, 'until')
+        )
+        return Response({'unread': inbox.unread, 'read_until': inbox.read_until})
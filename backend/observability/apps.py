@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def _install_query_timer(sender, connection, **kwargs):
+    from .timing import record_query
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ObservabilityConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'observability'
+    verbose_name = 'Observability'
+
+    def ready(self):
+        connection_created.connect(_install_query_timer)
@@ -0,0 +1,276 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Every process keeps its own counters and histograms. When
+METRICS_MULTIPROC_DIR is set (gunicorn with several workers), each process
+also writes a snapshot of its values to `<dir>/metrics_<pid>.json` from a
+background thread, and a scrape merges all snapshots so it sees every
+worker, not only the one that served it.
+"""
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = None
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if self.registry is not None:
+            self.registry.ensure_process()
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def merge(self, total, value):
+        return (total or 0) + value
+
+    def samples(self, key, value):
+        yield self.name, key, value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if self.registry is not None:
+            self.registry.ensure_process()
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), then sum and count.
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def merge(self, total, value):
+        if total is None:
+            return self._copy(value)
+        return [
+            [a + b for a, b in zip(total[0], value[0])],
+            total[1] + value[1],
+            total[2] + value[2],
+        ]
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), value[0]):
+            cumulative += count
+            yield f'{self.name}_bucket', key + (('le', str(bound)),), cumulative
+        yield f'{self.name}_sum', key, value[1]
+        yield f'{self.name}_count', key, value[2]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        metric.registry = self
+        return metric
+
+    def ensure_process(self):
+        """Reset inherited values after a fork and start the snapshot writer."""
+        if self._pid == os.getpid() and (self._flusher or not _multiproc_dir()):
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                for metric in self.metrics.values():
+                    metric.reset()
+                self._pid = os.getpid()
+                self._flusher = None
+            if self._flusher is None and _multiproc_dir():
+                self._flusher = threading.Thread(
+                    target=self._flush_forever, name='metrics-flush', daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_forever(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except OSError:
+                continue
+
+    def dump(self):
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        directory = _multiproc_dir()
+        if not directory:
+            return
+        path = os.path.join(directory, f'metrics_{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(self.dump(), fh)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Values for every metric, summed over all worker snapshots."""
+        directory = _multiproc_dir()
+        if directory:
+            self.flush()
+            dumps = []
+            for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+                try:
+                    with open(path) as fh:
+                        dumps.append(json.load(fh))
+                except (OSError, ValueError):
+                    continue
+        else:
+            dumps = [self.dump()]
+
+        merged = {name: {} for name in self.metrics}
+        for dump in dumps:
+            for name, rows in dump.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in rows:
+                    key = tuple(key)
+                    merged[name][key] = metric.merge(merged[name].get(key), value)
+        return merged
+
+    def render(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type_name}')
+            for key, value in sorted(values.items()):
+                labels = tuple(zip(metric.labelnames, key))
+                for sample_name, sample_labels, sample_value in metric.samples(labels, value):
+                    lines.append(f'{sample_name}{_format_labels(sample_labels)} {sample_value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', '')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels
+    )
+    return '{' + body + '}'
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'playto_request_duration_seconds',
+    'API request latency by view action.',
+    ['view', 'action', 'method'],
+))
+LIKE_WRITES = REGISTRY.register(Counter(
+    'playto_like_writes_total',
+    'Like rows inserted (op="like") or deleted (op="unlike").',
+    ['target', 'op'],
+))
+LIKE_RACES = REGISTRY.register(Counter(
+    'playto_like_integrity_races_total',
+    'Like inserts that lost a race and hit the IntegrityError fallback.',
+    ['target'],
+))
+KARMA_EVENTS = REGISTRY.register(Counter(
+    'playto_karma_events_total',
+    'KarmaEvent rows written.',
+    ['source_type'],
+))
+KARMA_POINTS = REGISTRY.register(Counter(
+    'playto_karma_points_total',
+    'Karma points awarded.',
+    ['source_type'],
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'playto_cache_requests_total',
+    'Cache lookups by cache and result (hit or miss).',
+    ['cache', 'result'],
+))
+COMMENT_TREE_NODES = REGISTRY.register(Histogram(
+    'playto_comment_tree_nodes',
+    'Comments per served comment tree.',
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+))
+FEED_FANOUT_ROWS = REGISTRY.register(Histogram(
+    'playto_feed_fanout_rows',
+    'Timeline rows written per created post.',
+    buckets=(1, 2, 5, 10, 50, 100, 500, 1000, 5000, 10000),
+))
+NOTIFICATIONS_WRITTEN = REGISTRY.register(Counter(
+    'playto_notifications_written_total',
+    'Inbox writes: a new entry (result="new") or one folded into an unread entry.',
+    ['kind', 'result'],
+))
+THROTTLED_REQUESTS = REGISTRY.register(Counter(
+    'playto_throttled_requests_total',
+    'Write requests rejected by a token-bucket throttle.',
+    ['scope', 'kind'],
+))
+TASKS_RUN = REGISTRY.register(Counter(
+    'playto_tasks_run_total',
+    'Background task executions by outcome.',
+    ['name', 'result'],
+))
+
+
+def record_cache_lookup(cache, hit, count=1):
+    if count:
+        CACHE_REQUESTS.inc(count, cache=cache, result='hit' if hit else 'miss')
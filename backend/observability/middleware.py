@@ -0,0 +1,148 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import REQUEST_LATENCY
+from .timing import collect
+
+logger = logging.getLogger('observability.timing')
+
+
+class RequestTimingMiddleware:
+    """
+    Record query count, DB time, serializer time and render time for a
+    sample of requests. Sampled responses get a Server-Timing header and a
+    structured log line; requests over the query or time threshold are
+    logged as warnings together with their most expensive SQL. Works under
+    both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        started = time.perf_counter()
+        with collect() as timings:
+            request._timings = timings
+            response = self.get_response(request)
+        self._report(request, response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with collect() as timings:
+            request._timings = timings
+            response = await self.get_response(request)
+        self._report(request, response, timings, time.perf_counter() - started)
+        return response
+
+    def _sampled(self):
+        sample_rate = getattr(settings, 'REQUEST_TIMING_SAMPLE_RATE', 0)
+        return sample_rate and random.random() < sample_rate
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, '_timings', None)
+        if timings is not None:
+            render_started = time.perf_counter()
+
+            def rendered(rendered_response):
+                timings.sections['render'] += time.perf_counter() - render_started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _report(self, request, response, timings, total):
+        metrics = {
+            'db': timings.db_time,
+            'serialize': timings.sections.get('serialize', 0.0),
+            'render': timings.sections.get('render', 0.0),
+            'total': total,
+        }
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.2f}'
+            + (f';desc="{timings.queries} queries"' if name == 'db' else '')
+            for name, seconds in metrics.items()
+        )
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.queries,
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in metrics.items()},
+        }
+        slow_ms = getattr(settings, 'REQUEST_TIMING_SLOW_MS', 500)
+        slow_queries = getattr(settings, 'REQUEST_TIMING_SLOW_QUERIES', 50)
+        if record['total_ms'] >= slow_ms or timings.queries >= slow_queries:
+            record['top_sql'] = timings.top_sql(getattr(settings, 'REQUEST_TIMING_TOP_SQL', 3))
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+
+class MetricsMiddleware:
+    """
+    Observe the latency of every DRF view, labelled by view and action, and
+    of async views, labelled by function name.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, started)
+        return response
+
+    def _observe(self, request, started):
+        labels = getattr(request, '_metrics_labels', None)
+        if labels is not None:
+            REQUEST_LATENCY.observe(time.perf_counter() - started, **labels)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            if iscoroutinefunction(view_func):
+                request._metrics_labels = {
+                    'view': view_func.__name__,
+                    'action': request.method.lower(),
+                    'method': request.method,
+                }
+            return None
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            view = view_func.initkwargs.get('basename') or view_class.__name__
+            action = actions.get(method, method)
+        else:
+            view = view_class.__name__
+            action = method
+        request._metrics_labels = {'view': view, 'action': action, 'method': request.method}
+        return None
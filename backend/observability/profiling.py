@@ -0,0 +1,186 @@
+"""
+On-demand and background profiling.
+
+- Staff can add `?profile=1` (or the `X-Profile: 1` header) to any request
+  to get a cProfile report back instead of the normal response, or
+  `?profile=store` to keep the normal response and save a `.prof` file
+  under PROFILE_DIR (named in the X-Profile-Report header).
+- With PROFILE_SAMPLE_INTERVAL > 0 each process runs a sampler thread that
+  records the stacks of threads currently serving a request and writes
+  aggregated folded stacks (flamegraph.pl / speedscope input) to
+  `PROFILE_DIR/stacks_<pid>.folded`.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+REPORT_LINES = 60
+
+# Thread id -> requests in flight on it (several for an ASGI event loop).
+_active_requests = Counter()
+_sampler_pid = None
+_sampler_lock = threading.Lock()
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    # API clients authenticate inside DRF, after middleware; run the same
+    # authenticators here. Only reached when a profile was asked for.
+    drf_request = Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        return drf_request.user.is_staff
+    except APIException:
+        return False
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f'{module}.{getattr(code, "co_qualname", code.co_name)}'
+
+
+class StackSampler(threading.Thread):
+    """Periodically sample request threads and aggregate their stacks."""
+
+    def __init__(self, interval, flush_interval, directory):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.path = os.path.join(directory, f'stacks_{os.getpid()}.folded')
+        self.stacks = Counter()
+
+    def sample_once(self, thread_ids=None):
+        frames = sys._current_frames()
+        for thread_id in thread_ids if thread_ids is not None else list(_active_requests):
+            frame = frames.get(thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def flush(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(f'{stack} {count}\n')
+        os.replace(tmp_path, self.path)
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            self.sample_once()
+            if time.monotonic() - last_flush >= self.flush_interval:
+                last_flush = time.monotonic()
+                try:
+                    self.flush()
+                except OSError:
+                    continue
+
+
+def _ensure_sampler():
+    global _sampler_pid
+    interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0)
+    if not interval or _sampler_pid == os.getpid():
+        return
+    with _sampler_lock:
+        # Forked workers do not inherit the parent's thread; start their own.
+        if _sampler_pid != os.getpid():
+            StackSampler(
+                interval,
+                getattr(settings, 'PROFILE_FLUSH_INTERVAL', 30),
+                settings.PROFILE_DIR,
+            ).start()
+            _sampler_pid = os.getpid()
+
+
+@contextmanager
+def _serving():
+    thread_id = threading.get_ident()
+    _active_requests[thread_id] += 1
+    try:
+        yield
+    finally:
+        _active_requests[thread_id] -= 1
+        if not _active_requests[thread_id]:
+            del _active_requests[thread_id]
+
+
+class ProfilerMiddleware:
+    """
+    Per-request cProfile for staff, plus the low-rate background sampler.
+    Under ASGI the profile covers the event loop thread for the duration of
+    the request, so it can include other requests interleaved with it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _ensure_sampler()
+        mode = request.GET.get('profile') or request.headers.get('X-Profile')
+        if mode and _is_staff(request):
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+            return self._report(request, response, profiler, mode)
+
+        with _serving():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        _ensure_sampler()
+        mode = request.GET.get('profile') or request.headers.get('X-Profile')
+        if mode and await sync_to_async(_is_staff)(request):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+            return self._report(request, response, profiler, mode)
+
+        with _serving():
+            return await self.get_response(request)
+
+    def _report(self, request, response, profiler, mode):
+        if mode == 'store':
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.prof'
+            profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+            response['X-Profile-Report'] = name
+            return response
+
+        out = io.StringIO()
+        out.write(f'{request.method} {request.get_full_path()} -> {response.status_code}\n\n')
+        stats = pstats.Stats(profiler, stream=out).strip_dirs()
+        stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+        stats.print_callees(REPORT_LINES // 3)
+        return HttpResponse(out.getvalue(), content_type='text/plain; charset=utf-8')
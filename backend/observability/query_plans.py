@@ -0,0 +1,80 @@
+"""
+Query plan checks for the hot read paths.
+
+`capture_selects()` records the SELECTs a block of code runs and
+`plan_problems()` explains one of them and lists the steps that do not use
+an index: full table scans and sorts the database has to do itself.
+
+On SQLite this reads EXPLAIN QUERY PLAN, where a problem is a `SCAN` of a
+table without an index and `USE TEMP B-TREE` for ORDER BY, GROUP BY or
+DISTINCT. On PostgreSQL it reads EXPLAIN (FORMAT JSON) with sequential
+scans disabled, so that the planner's choice on a small test table does
+not hide a missing index; a `Seq Scan` or `Sort` node left in the plan is
+a problem.
+"""
+import json
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+@contextmanager
+def capture_selects(using='default'):
+    """Collect `(sql, params)` for every SELECT run on `using` inside the block."""
+    captured = []
+
+    def wrapper(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            captured.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connections[using].execute_wrapper(wrapper):
+        yield captured
+
+
+def _sqlite_problems(cursor, sql, params):
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    problems = []
+    for *_, detail in cursor.fetchall():
+        if detail.startswith('SCAN ') and ' USING ' not in detail:
+            # Virtual tables (FTS5) and constant rows have no index to use.
+            if 'VIRTUAL TABLE' not in detail and 'CONSTANT ROW' not in detail:
+                problems.append(detail)
+        elif 'TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+
+def _postgresql_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _postgresql_nodes(child)
+
+
+def _postgresql_problems(cursor, sql, params):
+    cursor.execute('SET enable_seqscan = off')
+    try:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.execute('RESET enable_seqscan')
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    problems = []
+    for node in _postgresql_nodes(plan[0]['Plan']):
+        if node['Node Type'] == 'Seq Scan':
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+        elif node['Node Type'] == 'Sort':
+            problems.append(f"Sort by {', '.join(node['Sort Key'])}")
+    return problems
+
+
+def plan_problems(sql, params, using='default'):
+    """The unindexed scans and sorts in the plan of one query (empty when it is clean)."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            return _sqlite_problems(cursor, sql, params)
+        if connection.vendor == 'postgresql':
+            return _postgresql_problems(cursor, sql, params)
+    raise NotImplementedError(f'No query plan check for {connection.vendor}.')
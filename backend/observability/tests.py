@@ -0,0 +1,184 @@
+import json
+import os
+import tempfile
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from comments.models import Comment
+from posts.models import Post
+
+from .metrics import REGISTRY, Counter, Registry
+from .profiling import StackSampler
+from .query_plans import capture_selects, plan_problems
+
+User = get_user_model()
+
+
+class RequestTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(username='author', password='pass1234')
+        post = Post.objects.create(author=author, content='hello')
+        Comment.objects.create(author=author, post=post, content='first')
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+    def test_sampled_request_gets_server_timing_header(self):
+        with self.assertLogs('observability.timing', level='INFO') as logs:
+            response = self.client.get('/api/posts/')
+        header = response['Server-Timing']
+        for name in ('db', 'serialize', 'render', 'total'):
+            self.assertIn(f'{name};dur=', header)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/api/posts/')
+        self.assertGreaterEqual(record['queries'], 1)
+        self.assertNotIn('top_sql', record)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request_is_untouched(self):
+        response = self.client.get('/api/posts/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1, REQUEST_TIMING_SLOW_QUERIES=1)
+    def test_request_over_threshold_logs_top_sql(self):
+        with self.assertLogs('observability.timing', level='WARNING') as logs:
+            self.client.get('/api/comments/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['top_sql'])
+        self.assertIn('comments_comment', record['top_sql'][0]['sql'])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        for metric in REGISTRY.metrics.values():
+            metric.reset()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='hello')
+        Comment.objects.create(author=self.author, post=self.post, content='first')
+
+    def test_metrics_endpoint_exports_hot_path_series(self):
+        self.client.get('/api/posts/')
+        self.client.get(f'/api/posts/{self.post.id}/comments/tree/')
+        self.client.force_login(self.fan)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.delete(f'/api/posts/{self.post.id}/like/')
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn(
+            'playto_request_duration_seconds_count{view="post",action="list",method="GET"} 1',
+            body,
+        )
+        self.assertIn(
+            'playto_request_duration_seconds_count{view="post",action="like",method="DELETE"} 1',
+            body,
+        )
+        self.assertIn('playto_like_writes_total{target="post",op="like"} 1', body)
+        self.assertIn('playto_like_writes_total{target="post",op="unlike"} 1', body)
+        self.assertIn('playto_karma_points_total{source_type="post_like"} 5', body)
+        self.assertIn('playto_comment_tree_nodes_bucket{le="1"} 1', body)
+
+    def test_multiprocess_snapshots_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_MULTIPROC_DIR=directory):
+            other_worker = Registry()
+            counter = other_worker.register(Counter('demo_total', 'Demo.', ['kind']))
+            counter.inc(kind='a')
+            with open(f'{directory}/metrics_1.json', 'w') as fh:
+                json.dump(other_worker.dump(), fh)
+            with open(f'{directory}/metrics_2.json', 'w') as fh:
+                json.dump(other_worker.dump(), fh)
+            self.assertEqual(other_worker.collect()['demo_total'][('a',)], 3)
+
+
+class ProfilerMiddlewareTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pass1234', is_staff=True)
+        self.member = User.objects.create_user(username='member', password='pass1234')
+        post = Post.objects.create(author=self.member, content='hello')
+        Comment.objects.create(author=self.member, post=post, content='first')
+        self.tree_url = f'/api/posts/{post.id}/comments/tree/'
+
+    def test_staff_gets_profile_report(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.tree_url, {'profile': '1'})
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn('function calls', response.content.decode())
+        self.assertIn('(comments_tree)', response.content.decode())
+
+    def test_staff_can_store_profile(self):
+        self.client.force_login(self.staff)
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            response = self.client.get(self.tree_url, HTTP_X_PROFILE='store')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(os.path.exists(os.path.join(directory, response['X-Profile-Report'])))
+
+    def test_profile_flag_is_ignored_for_non_staff(self):
+        self.client.force_login(self.member)
+        response = self.client.get(self.tree_url, {'profile': '1'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_sampler_writes_folded_stacks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sampler = StackSampler(0.01, 1, directory)
+            sampler.sample_once([threading.get_ident()])
+            sampler.flush()
+            with open(sampler.path) as fh:
+                stack, count = fh.read().splitlines()[0].rsplit(' ', 1)
+        self.assertEqual(count, '1')
+        # Sampling its own thread, the leaf frame is the sampler itself.
+        self.assertIn('ProfilerMiddlewareTests.test_sampler_writes_folded_stacks;', stack)
+        self.assertTrue(stack.endswith('StackSampler.sample_once'))
+
+
+class QueryPlanTests(TestCase):
+    # Sorts no index can serve, with the reason they are acceptable.
+    ALLOWED = {
+        # Ranks users by a sum over the last 24h of events; at most 5 rows come back.
+        '/api/leaderboard/': ['USE TEMP B-TREE FOR ORDER BY'],
+    }
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.reader = User.objects.create_user(username='reader', password='pass1234')
+        self.client.force_login(self.reader)
+        self.post = Post.objects.create(author=self.author, content='hello world')
+        self.client.post(f'/api/users/{self.author.id}/follow/')
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.comment = self.client.post(
+            '/api/comments/', {'post': self.post.id, 'content': 'first'}
+        ).json()['id']
+        self.client.post(f'/api/comments/{self.comment}/like/')
+
+    def test_hot_views_use_indexes(self):
+        urls = [
+            '/api/feed/',
+            '/api/posts/',
+            '/api/posts/?sort=hot',
+            '/api/posts/?sort=top&window=week',
+            f'/api/posts/{self.post.id}/',
+            f'/api/posts/{self.post.id}/comments/tree/',
+            f'/api/comments/?post={self.post.id}',
+            f'/api/state/?posts={self.post.id}&comments={self.comment}',
+            '/api/leaderboard/',
+            f'/api/users/{self.author.id}/karma/',
+            '/api/search/?q=hello',
+            '/api/notifications/',
+            '/api/notifications/unread/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                # Cold caches, so every query behind the view runs.
+                cache.clear()
+                with capture_selects() as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(queries)
+                allowed = self.ALLOWED.get(url, [])
+                for sql, params in queries:
+                    problems = [p for p in plan_problems(sql, params) if p not in allowed]
+                    self.assertEqual(problems, [], sql)
@@ -0,0 +1,89 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Per-request accumulator for DB queries and named code sections."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = defaultdict(float)
+        self.sql = defaultdict(lambda: [0, 0.0])  # sql -> [count, seconds]
+        self._active = set()
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        entry = self.sql[sql]
+        entry[0] += 1
+        entry[1] += duration
+
+    def top_sql(self, limit):
+        """The statements that cost the most DB time, with how often they ran."""
+        ranked = sorted(self.sql.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'sql': sql, 'count': count, 'ms': round(seconds * 1000, 2)}
+            for sql, (count, seconds) in ranked[:limit]
+        ]
+
+
+def current_timings():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every DB connection (see apps.py). The
+    collector is found through a ContextVar, so queries that async views
+    run in sync_to_async threads are attributed to their request too.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    query_started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.record_query(sql, time.perf_counter() - query_started)
+
+
+@contextmanager
+def collect():
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def track(name):
+    """
+    Add the wall time of the block to section `name` of the current request.
+    Nested blocks with the same name (recursive serializers) count once.
+    """
+    timings = _current.get()
+    if timings is None or name in timings._active:
+        yield
+        return
+    timings._active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.sections[name] += time.perf_counter() - started
+        timings._active.discard(name)
+
+
+class TimedSerializerMixin:
+    """Attribute serializer work to the `serialize` section of sampled requests."""
+
+    def to_representation(self, instance):
+        with track('serialize'):
+            return super().to_representation(instance)
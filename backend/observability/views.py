@@ -0,0 +1,8 @@
+from django.http import HttpResponse
+
+from .metrics import CONTENT_TYPE, REGISTRY
+
+
+def metrics(request):
+    """Prometheus scrape target."""
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
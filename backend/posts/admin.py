@@ -1,13 +1,35 @@
 from django.contrib import admin
 
+from moderation.hide import hide_post
+from search.admin import FullTextSearchMixin
+
+from .admin_pagination import EstimatedCountPaginator
 from .models import Post, PostLike
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'author', 'content_preview', 'created_at']
     list_filter = ['created_at']
-    search_fields = ['content', 'author__username']
+    list_select_related = ['author']
+    raw_id_fields = ['author']
+    search_fields = ['author__username__exact']
+    search_help_text = 'Words in the content, or an exact username.'
+    search_target = 'posts'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['hide_and_purge']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Its confirmation page loads the whole cascade; hide and purge instead.
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(description='Hide selected posts and purge them')
+    def hide_and_purge(self, request, queryset):
+        for post in queryset.visible():
+            hide_post(post)
 
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
@@ -17,3 +39,8 @@ class PostAdmin(admin.ModelAdmin):
 @admin.register(PostLike)
 class PostLikeAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'post', 'created_at']
+    list_select_related = ['user', 'post__author']
+    raw_id_fields = ['user', 'post']
+    search_fields = ['user__username__exact']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -1,7 +1,26 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.checks import register
+from django.db.models.signals import post_migrate, pre_save
 
 
 class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
     verbose_name = 'Posts'
+
+    def ready(self):
+        from .checks import check_sharding
+
+        register(check_sharding)
+        if not settings.SHARD_DATABASES:
+            return
+        from . import sharding
+
+        for label in sharding.SHARDED_MODELS:
+            pre_save.connect(
+                sharding.assign_shard_id,
+                sender=label,
+                dispatch_uid=f'posts.sharding.assign_shard_id:{label}',
+            )
+        post_migrate.connect(sharding.disable_foreign_keys, dispatch_uid='posts.sharding.fk')
@@ -0,0 +1,79 @@
+"""
+Async variants of the heaviest read endpoints, for ASGI deployments.
+
+They return the same payloads as `GET /api/posts/`, the comment tree
+action and the leaderboard, but await the async ORM. A slow query parks a
+coroutine instead of pinning a worker process or thread. Django runs the
+queries themselves on a thread pool, so throughput per process is bounded
+by the database (one SQLite writer), not by the number of workers.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from accounts.authentication import HashedTokenAuthentication
+
+from .models import Post
+from .serializers import PostSerializer
+from .sharding import gather, is_sharded, shard_for
+from .views import comment_tree_queryset, post_queryset, serialize_comment_tree
+
+
+async def request_user(request):
+    """
+    The session user, otherwise the token user, in the order DRF tries
+    them. A bad token raises AuthenticationFailed, as it does in DRF.
+    """
+    user = await request.auser()
+    if user.is_authenticated and user.is_active:
+        return user
+    result = await sync_to_async(HashedTokenAuthentication().authenticate)(request)
+    if result is not None:
+        return result[0]
+    return user
+
+
+def render_json(data, status=200):
+    # DRF's renderer, so dates and decimals match the sync endpoints byte for byte.
+    return HttpResponse(
+        JSONRenderer().render(data), content_type='application/json', status=status
+    )
+
+
+def authentication_failed(request, exc):
+    """The response DRF gives: 401 if the first authenticator names a scheme, else 403."""
+    header = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]().authenticate_header(request)
+    response = render_json({'detail': exc.detail}, status=401 if header else 403)
+    if header:
+        response['WWW-Authenticate'] = header
+    return response
+
+
+async def post_list(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        user = await request_user(request)
+    except AuthenticationFailed as exc:
+        return authentication_failed(request, exc)
+    if is_sharded():
+        # The newest posts are merged from every shard, as in the sync list.
+        posts = await sync_to_async(gather)(post_queryset(user))
+    else:
+        posts = [post async for post in post_queryset(user)]
+    return render_json(PostSerializer(posts, many=True, context={'request': request}).data)
+
+
+async def comment_tree(request, pk):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not await Post.objects.using(shard_for(pk)).visible().filter(pk=pk).aexists():
+        raise Http404('No Post matches the given query.')
+    try:
+        user = await request_user(request)
+    except AuthenticationFailed as exc:
+        return authentication_failed(request, exc)
+    comments = [comment async for comment in comment_tree_queryset(pk, user)]
+    return render_json(serialize_comment_tree(request, comments))
@@ -0,0 +1,423 @@
+"""
+Batched likes, unlikes and comments for offline-capable clients and
+importers.
+
+A batch is an ordered list of operations. All of them are validated up
+front; if any is invalid nothing is applied. Otherwise the operations are
+replayed in order against the user's current like state and only the net
+change is written, with bulk inserts, in a single transaction (one per
+database written when sharded, committed together; posts.sharding).
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError
+from rest_framework import serializers
+
+from comments.models import Comment, CommentLike
+from karma.aggregates import apply_karma
+from karma.tasks import award_comment_like, award_post_like, revoke_comment_like, revoke_post_like
+from karma.models import (
+    COMMENT_LIKE_KARMA_POINTS,
+    POST_LIKE_KARMA_POINTS,
+    SOURCE_COMMENT_LIKE,
+    SOURCE_POST_LIKE,
+    KarmaEvent,
+)
+from notifications.tasks import notify_comment_like, notify_post_like, notify_reply
+from observability.metrics import KARMA_EVENTS, KARMA_POINTS, LIKE_RACES, LIKE_WRITES
+
+from .hotness import invalidate_post, like_counter
+from .models import Post, PostLike
+from .responses import invalidate_responses
+from .sharding import assign_shard_ids, atomic, group_by_shard, in_bulk, is_sharded, shard_for
+from .state import (
+    invalidate_comment_state,
+    invalidate_post_state,
+    liked_comment_ids,
+    liked_post_ids,
+)
+from .tasks import bump_post_scores
+
+MAX_BATCH_OPERATIONS = 500
+# Ids past a signed 64-bit integer cannot name a row, and SQLite rejects them.
+MAX_ROW_ID = 2 ** 63 - 1
+MAX_ATTEMPTS = 3
+
+LIKE_POST = 'like_post'
+UNLIKE_POST = 'unlike_post'
+LIKE_COMMENT = 'like_comment'
+UNLIKE_COMMENT = 'unlike_comment'
+CREATE_COMMENT = 'create_comment'
+
+# Token-bucket scope (posts.throttling) charged for each operation.
+THROTTLE_SCOPES = {
+    LIKE_POST: 'like',
+    LIKE_COMMENT: 'like',
+    UNLIKE_POST: 'unlike',
+    UNLIKE_COMMENT: 'unlike',
+    CREATE_COMMENT: 'create',
+}
+
+POST_OPS = (LIKE_POST, UNLIKE_POST)
+COMMENT_OPS = (LIKE_COMMENT, UNLIKE_COMMENT)
+
+
+class BatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(
+        choices=[LIKE_POST, UNLIKE_POST, LIKE_COMMENT, UNLIKE_COMMENT, CREATE_COMMENT]
+    )
+    id = serializers.IntegerField(required=False, min_value=1, max_value=MAX_ROW_ID)
+    post = serializers.IntegerField(required=False, min_value=1, max_value=MAX_ROW_ID)
+    parent = serializers.IntegerField(
+        required=False, allow_null=True, min_value=1, max_value=MAX_ROW_ID
+    )
+    content = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == CREATE_COMMENT:
+            missing = [name for name in ('post', 'content') if name not in attrs]
+        else:
+            missing = [] if 'id' in attrs else ['id']
+        if missing:
+            raise serializers.ValidationError(
+                {name: 'This field is required.' for name in missing}
+            )
+        return attrs
+
+
+class BatchSerializer(serializers.Serializer):
+    operations = BatchOperationSerializer(
+        many=True, allow_empty=False, max_length=MAX_BATCH_OPERATIONS
+    )
+
+
+def throttle_costs(data):
+    """Tokens per throttle scope for a raw, not yet validated batch payload."""
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        return {}
+    costs = Counter(
+        THROTTLE_SCOPES.get(op.get('op'))
+        for op in operations
+        if isinstance(op, dict) and isinstance(op.get('op'), str)
+    )
+    costs.pop(None, None)
+    return dict(costs)
+
+
+def _validate_references(user, operations, posts, comments):
+    """Per-operation errors for missing targets, self-likes and bad parents."""
+    errors = [{} for _ in operations]
+    for index, op in enumerate(operations):
+        kind = op['op']
+        if kind in POST_OPS:
+            post = posts.get(op['id'])
+            if post is None:
+                errors[index] = {'id': 'Post not found.'}
+            elif kind == LIKE_POST and post.author_id == user.id:
+                errors[index] = {'detail': 'Users cannot like their own post.'}
+        elif kind in COMMENT_OPS:
+            comment = comments.get(op['id'])
+            if comment is None:
+                errors[index] = {'id': 'Comment not found.'}
+            elif kind == LIKE_COMMENT and comment.author_id == user.id:
+                errors[index] = {'detail': 'Users cannot like their own comment.'}
+        else:
+            parent_id = op.get('parent')
+            if op['post'] not in posts:
+                errors[index] = {'post': 'Post not found.'}
+            elif parent_id is not None:
+                parent = comments.get(parent_id)
+                if parent is None:
+                    errors[index] = {'parent': 'Comment not found.'}
+                elif parent.post_id != op['post']:
+                    errors[index] = {'parent': 'Parent comment belongs to a different post.'}
+    return errors
+
+
+def _by_shard(objs, shard_of):
+    groups = defaultdict(list)
+    for obj in objs:
+        groups[shard_of(obj)].append(obj)
+    return groups
+
+
+def _create(model, objs, shard_of):
+    """bulk_create `objs` on their shards."""
+    for alias, rows in _by_shard(objs, shard_of).items():
+        assign_shard_ids(rows, alias)
+        model.objects.using(alias).bulk_create(rows)
+    return objs
+
+
+def _delete_likes(model, field, revoke, kind, user, target_ids):
+    """Delete `user`'s likes of `target_ids`; returns `{target_id: like_id}`."""
+    deleted = {}
+    for alias, ids in group_by_shard(target_ids).items():
+        likes = model.objects.using(alias).filter(user=user, **{f'{field}__in': ids})
+        for like_id, target_id in likes.values_list('id', field):
+            deleted[target_id] = like_id
+            # Unsharded, the likes' cascade deletes their KarmaEvents, which takes
+            # back the karma; sharded, the events are in `default` and a task on
+            # the shard revokes them.
+            if is_sharded():
+                revoke.enqueue(
+                    like_id=like_id, key=f'karma:{kind}_unlike:{like_id}', using=alias,
+                    **{field: target_id},
+                )
+        likes.delete()
+    return deleted
+
+
+def _award_karma(user, post_likes, comment_likes, posts, comments):
+    if is_sharded():
+        # The awards follow from the queue on each like's shard, as for single likes.
+        for like in post_likes:
+            award_post_like.enqueue(
+                like_id=like.id, key=f'karma:post_like:{like.id}', using=shard_for(like.id)
+            )
+        for like in comment_likes:
+            award_comment_like.enqueue(
+                like_id=like.id, key=f'karma:comment_like:{like.id}', using=shard_for(like.id)
+            )
+        return
+    events = KarmaEvent.objects.bulk_create(
+        [
+            KarmaEvent(
+                recipient_id=posts[like.post_id].author_id,
+                actor=user,
+                source_type=SOURCE_POST_LIKE,
+                points=POST_LIKE_KARMA_POINTS,
+                source_post_like=like,
+            )
+            for like in post_likes
+        ]
+        + [
+            KarmaEvent(
+                recipient_id=comments[like.comment_id].author_id,
+                actor=user,
+                source_type=SOURCE_COMMENT_LIKE,
+                points=COMMENT_LIKE_KARMA_POINTS,
+                source_comment_like=like,
+            )
+            for like in comment_likes
+        ]
+    )
+    apply_karma(events)
+
+
+def _apply(user, operations, posts, comments):
+    post_ids = [op['id'] for op in operations if op['op'] in POST_OPS]
+    comment_ids = [op['id'] for op in operations if op['op'] in COMMENT_OPS]
+    liked_posts = liked_post_ids(user, post_ids)
+    liked_comments = liked_comment_ids(user, comment_ids)
+    initial_posts, initial_comments = set(liked_posts), set(liked_comments)
+
+    # Replay in order to get each operation's own result and the net state.
+    results, new_comments = [], []
+    for op in operations:
+        kind = op['op']
+        if kind in POST_OPS or kind in COMMENT_OPS:
+            liked = liked_posts if kind in POST_OPS else liked_comments
+            target_id = op['id']
+            result = {'op': kind, 'id': target_id}
+            if kind in (LIKE_POST, LIKE_COMMENT):
+                result.update(liked=True, created=target_id not in liked)
+                liked.add(target_id)
+            else:
+                result.update(liked=False, deleted=target_id in liked)
+                liked.discard(target_id)
+            results.append(result)
+        else:
+            comment = Comment(
+                author=user,
+                post_id=op['post'],
+                parent_id=op.get('parent'),
+                content=op['content'],
+            )
+            new_comments.append(comment)
+            results.append({'op': kind, 'comment': comment})
+
+    removed_posts = initial_posts - liked_posts
+    removed_comments = initial_comments - liked_comments
+    # A comment's id, like its post's, names the shard its likes are on.
+    touched = {
+        shard_for(target_id)
+        for target_id in (liked_posts ^ initial_posts) | (liked_comments ^ initial_comments)
+    }
+    touched.update(shard_for(comment.post_id) for comment in new_comments)
+    with atomic(*touched):
+        new_post_likes = _create(
+            PostLike,
+            [PostLike(user=user, post_id=post_id) for post_id in liked_posts - initial_posts],
+            lambda like: shard_for(like.post_id),
+        )
+        new_comment_likes = _create(
+            CommentLike,
+            [
+                CommentLike(user=user, comment_id=comment_id)
+                for comment_id in liked_comments - initial_comments
+            ],
+            lambda like: shard_for(like.comment_id),
+        )
+        _award_karma(user, new_post_likes, new_comment_likes, posts, comments)
+        deleted_post_likes = {}
+        if removed_posts:
+            deleted_post_likes = _delete_likes(
+                PostLike, 'post_id', revoke_post_like, 'post', user, removed_posts
+            )
+        if removed_comments:
+            _delete_likes(
+                CommentLike, 'comment_id', revoke_comment_like, 'comment', user, removed_comments
+            )
+        _create(Comment, new_comments, lambda comment: shard_for(comment.post_id))
+        _notify(new_post_likes, new_comment_likes, new_comments)
+        _bump_scores(new_post_likes, deleted_post_likes, new_comments)
+
+    return results, {
+        'post_likes': [like.post_id for like in new_post_likes],
+        'comment_likes': [like.comment_id for like in new_comment_likes],
+        'removed_posts': removed_posts,
+        'removed_comments': removed_comments,
+        'comments': new_comments,
+    }
+
+
+def _notify(post_likes, comment_likes, comments):
+    for like in post_likes:
+        notify_post_like.enqueue(
+            like_id=like.id, key=f'notify:post_like:{like.id}', using=shard_for(like.id)
+        )
+    for like in comment_likes:
+        notify_comment_like.enqueue(
+            like_id=like.id, key=f'notify:comment_like:{like.id}', using=shard_for(like.id)
+        )
+    for comment in comments:
+        if comment.parent_id:
+            notify_reply.enqueue(
+                comment_id=comment.id, key=f'notify:reply:{comment.id}',
+                using=shard_for(comment.id),
+            )
+
+
+def _bump_scores(post_likes, deleted_likes, comments):
+    """
+    One score bump per post, queued with the rows that move it. Its key
+    names the first of those rows, so a replayed batch cannot bump twice.
+    """
+    likes = Counter()
+    rows = {}
+    for like in post_likes:
+        likes[like.post_id] += 1
+        rows.setdefault(like.post_id, f'post_like:{like.id}')
+    for post_id, like_id in deleted_likes.items():
+        likes[post_id] -= 1
+        rows.setdefault(post_id, f'post_unlike:{like_id}')
+    new_comments = Counter()
+    for comment in comments:
+        new_comments[comment.post_id] += 1
+        rows.setdefault(comment.post_id, f'comment:{comment.id}')
+    for post_id, row in rows.items():
+        bump_post_scores.enqueue(
+            post_id=post_id, likes=likes[post_id], comments=new_comments[post_id],
+            key=f'score:batch:{row}', using=shard_for(post_id),
+        )
+
+
+def _after_commit(changes, comments):
+    for post_id in changes['post_likes']:
+        like_counter.adjust(post_id, 1)
+        invalidate_post_state(post_id)
+    for post_id in changes['removed_posts']:
+        like_counter.adjust(post_id, -1)
+        invalidate_post_state(post_id)
+    for comment_id in changes['comment_likes'] + list(changes['removed_comments']):
+        invalidate_comment_state(comment_id)
+    touched_posts = {comment.post_id for comment in changes['comments']}
+    touched_posts.update(
+        comments[comment_id].post_id
+        for comment_id in changes['comment_likes'] + list(changes['removed_comments'])
+    )
+    for post_id in touched_posts:
+        invalidate_post(post_id)
+        invalidate_post_state(post_id)
+    touched_posts.update(changes['post_likes'], changes['removed_posts'])
+    if touched_posts:
+        invalidate_responses(touched_posts)
+    for comment in changes['comments']:
+        if comment.parent_id:
+            invalidate_comment_state(comment.parent_id)
+
+    for target, created, removed, source_type, points in (
+        ('post', changes['post_likes'], changes['removed_posts'],
+         SOURCE_POST_LIKE, POST_LIKE_KARMA_POINTS),
+        ('comment', changes['comment_likes'], changes['removed_comments'],
+         SOURCE_COMMENT_LIKE, COMMENT_LIKE_KARMA_POINTS),
+    ):
+        if created:
+            LIKE_WRITES.inc(len(created), target=target, op='like')
+        # Sharded, the award tasks count their own events.
+        if created and not is_sharded():
+            KARMA_EVENTS.inc(len(created), source_type=source_type)
+            KARMA_POINTS.inc(len(created) * points, source_type=source_type)
+        if removed:
+            LIKE_WRITES.inc(len(removed), target=target, op='unlike')
+
+
+def _like_counts(model, ids):
+    counts = {}
+    for alias, shard_ids in group_by_shard(ids).items():
+        counts.update(
+            model.objects.using(alias).filter(id__in=shard_ids)
+            .with_like_count().values_list('id', 'like_count')
+        )
+    return counts
+
+
+def apply_batch(user, operations):
+    """
+    Validate and apply `operations` for `user`. Returns `(results, errors)`;
+    when `errors` is not None nothing was written.
+    """
+    post_ids = {op['id'] for op in operations if op['op'] in POST_OPS}
+    post_ids.update(op['post'] for op in operations if op['op'] == CREATE_COMMENT)
+    comment_ids = {op['id'] for op in operations if op['op'] in COMMENT_OPS}
+    comment_ids.update(
+        op['parent'] for op in operations
+        if op['op'] == CREATE_COMMENT and op.get('parent') is not None
+    )
+    posts = in_bulk(Post.objects.visible().only('id', 'author_id'), post_ids)
+    comments = in_bulk(Comment.objects.visible().only('id', 'author_id', 'post_id'), comment_ids)
+
+    errors = _validate_references(user, operations, posts, comments)
+    if any(errors):
+        return None, errors
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            results, changes = _apply(user, operations, posts, comments)
+            break
+        except IntegrityError:
+            # A concurrent single like won the race; re-read the state and replay.
+            LIKE_RACES.inc(target='batch')
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+    _after_commit(changes, comments)
+
+    post_counts = _like_counts(Post, {r['id'] for r in results if r['op'] in POST_OPS})
+    comment_counts = _like_counts(Comment, {r['id'] for r in results if r['op'] in COMMENT_OPS})
+    for result in results:
+        if result['op'] in POST_OPS:
+            result['like_count'] = post_counts[result['id']]
+        elif result['op'] in COMMENT_OPS:
+            result['like_count'] = comment_counts[result['id']]
+        else:
+            comment = result.pop('comment')
+            result.update({
+                'id': comment.id,
+                'post': comment.post_id,
+                'parent': comment.parent_id,
+                'created_at': comment.created_at,
+            })
+    return results, None
+
@@ -0,0 +1,24 @@
+"""System checks for the sharded mode (posts.sharding)."""
+from django.apps import apps
+from django.conf import settings
+from django.core.checks import Error, Warning
+
+
+def check_sharding(app_configs, **kwargs):
+    if not settings.SHARD_DATABASES:
+        return []
+    messages = []
+    if apps.is_installed('django.contrib.admin'):
+        messages.append(Error(
+            'The admin reads and writes only `default`, so it cannot run with sharding on.',
+            hint='Leave django.contrib.admin out of INSTALLED_APPS when SHARD_COUNT > 0.',
+            id='posts.E001',
+        ))
+    if settings.TASKS_EAGER:
+        messages.append(Warning(
+            'With TASKS_EAGER every like and reply also writes karma and '
+            'notifications to `default`, so they queue behind one lock again.',
+            hint='Set TASKS_EAGER=False and run `manage.py run_tasks` workers.',
+            id='posts.W001',
+        ))
+    return messages
@@ -0,0 +1,337 @@
+"""
+Streaming export and import of the community dataset as gzip-compressed
+NDJSON, for moving data between environments and rebuilding search or
+analytics stores.
+
+Each line is one row, `{"model": ..., "pk": ..., "fields": {...}}` as in
+Django's jsonl serializer, with the tables in dependency order (MODELS).
+Neither side holds a table in memory. The exporter walks each table in
+primary key order through `.iterator()`, which uses a server-side cursor on
+PostgreSQL. The importer inserts chunk by chunk with `bulk_create`.
+
+The export is a cut at the moment it starts: it records each table's
+largest id then and leaves out rows added later, even across a resume.
+Ids only grow and tables go out parents first, so every row in the dump
+finds its parents there (a parent deleted meanwhile takes its rows with
+it). A read transaction would give the same guarantee for one run only,
+and on SQLite it would stall every writer for the length of the export.
+
+Both sides keep a small JSON state file next to the dump and resume from it
+after an interruption:
+
+- The export writes every chunk as its own gzip member and records the last
+  id and the file size after it. A resumed export truncates a half-written
+  member and carries on after that id.
+- The import records how many lines it has loaded. Each chunk's rows and
+  their karma are committed in one transaction, and rows that already exist
+  are skipped, so replaying the last chunk is harmless.
+
+Primary keys are remapped so a dump can be loaded next to existing data.
+Every table gets an offset, its largest id when the import started, and a
+row's new id is its old id plus that offset. Foreign keys are remapped by
+the same arithmetic with no id map in memory. The exception is users whose
+username already exists, which are mapped to that account. Nothing else
+should write to these tables while an import runs.
+
+Imported users get an unusable password and no staff or superuser flag,
+so a dump cannot plant an admin or a known password in the target;
+`keep_credentials=True` copies them for a full migration between trusted
+environments.
+
+The importer drops the tables' secondary indexes (Meta.indexes) while it
+loads and builds them once at the end. Foreign keys are already checked at
+commit, once per chunk, because Django creates them deferrable. KarmaTotal,
+KarmaDaily and KarmaItem are not exported; the importer rebuilds them from
+the imported events through `apply_karma`.
+"""
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max
+
+from comments.models import Comment, CommentLike
+from karma.aggregates import apply_karma
+from karma.models import KarmaEvent
+
+from .models import Post, PostLike
+
+User = get_user_model()
+
+MODELS = [User, Post, Comment, PostLike, CommentLike, KarmaEvent]
+CHUNK_SIZE = 5000
+
+FORMAT_VERSION = 2
+
+
+class DatasetEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts datetimes to milliseconds, which could
+        # reorder rows that are paged by (created_at, id).
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _data_fields(model):
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _load_state(path):
+    try:
+        with open(path) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def _save_state(path, state):
+    # Write then rename, so a crash never leaves a truncated state file.
+    with open(f'{path}.tmp', 'w') as state_file:
+        json.dump(state, state_file)
+    os.replace(f'{path}.tmp', path)
+
+
+def export_state_path(path):
+    return f'{path}.export-state'
+
+
+def import_state_path(path):
+    return f'{path}.import-state'
+
+
+def export_rows(model, after=0, until=None, chunk_size=CHUNK_SIZE):
+    """`(pk, line)` for every row of `model` with a primary key in (`after`, `until`], in order."""
+    fields = _data_fields(model)
+    rows = (
+        model._default_manager
+        .filter(pk__gt=after, pk__lte=until or 0)
+        .order_by('pk')
+        .values_list('pk', *[field.attname for field in fields])
+    )
+    label = _label(model)
+    for pk, *values in rows.iterator(chunk_size=chunk_size):
+        record = {
+            'model': label,
+            'pk': pk,
+            'fields': {field.name: value for field, value in zip(fields, values)},
+        }
+        yield pk, json.dumps(record, cls=DatasetEncoder) + '\n'
+
+
+def export_dataset(path, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Write every table in MODELS to `path`, resuming an interrupted export of
+    the same path. `progress(label, rows_written)` is called after each chunk.
+    Returns the number of rows written by this run.
+    """
+    state_path = export_state_path(path)
+    state = _load_state(state_path)
+    labels = [_label(model) for model in MODELS]
+    if state is None or state.get('version') != FORMAT_VERSION:
+        until = {
+            _label(model): model._default_manager.aggregate(top=Max('pk'))['top']
+            for model in MODELS
+        }
+        state = {
+            'version': FORMAT_VERSION, 'model': labels[0], 'after': 0, 'size': 0, 'until': until,
+        }
+    written = 0
+    with open(path, 'r+b' if state['size'] else 'wb') as raw:
+        # Anything past the recorded size is a member cut off mid-write.
+        raw.truncate(state['size'])
+        raw.seek(state['size'])
+        for model in MODELS[labels.index(state['model']):]:
+            label = _label(model)
+            after = state['after'] if label == state['model'] else 0
+            count = 0
+            rows = export_rows(model, after, state['until'][label], chunk_size)
+            for chunk in _chunks(rows, chunk_size):
+                with gzip.GzipFile(fileobj=raw, mode='wb') as member:
+                    member.write(''.join(line for _, line in chunk).encode())
+                raw.flush()
+                os.fsync(raw.fileno())
+                state = {**state, 'model': label, 'after': chunk[-1][0], 'size': raw.tell()}
+                _save_state(state_path, state)
+                count += len(chunk)
+                if progress:
+                    progress(label, count)
+            written += count
+    os.remove(state_path)
+    return written
+
+
+def read_lines(path):
+    """Decode the dump line by line; a multi-member gzip file reads as one stream."""
+    with gzip.open(path, 'rt') as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+@contextmanager
+def deferred_indexes(models):
+    """
+    Drop the Meta.indexes of `models` for the duration of a bulk load and
+    build them once at the end. Indexes already missing (an earlier run was
+    interrupted) are simply created at the end.
+    """
+    with connection.cursor() as cursor:
+        existing = {
+            model: set(connection.introspection.get_constraints(cursor, model._meta.db_table))
+            for model in models
+        }
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                if index.name in existing[model]:
+                    editor.remove_index(model, index)
+    yield
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.add_index(model, index)
+
+
+@contextmanager
+def _keep_timestamps(model):
+    # bulk_create would otherwise stamp auto_now_add fields with the import time.
+    fields = [field for field in _data_fields(model) if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Importer:
+    """Loads a dump chunk by chunk, remapping keys as described in the module docstring."""
+
+    def __init__(self, state):
+        self.state = state
+        self.offsets = state['offsets']
+        # Source user id -> existing account with the same username.
+        self.merged_users = {int(source): target for source, target in state['merged_users'].items()}
+        self.keep_credentials = state.get('keep_credentials', False)
+
+    @classmethod
+    def start(cls, keep_credentials=False):
+        offsets = {
+            _label(model): model._default_manager.aggregate(top=Max('pk'))['top'] or 0
+            for model in MODELS
+        }
+        return cls({
+            'version': FORMAT_VERSION, 'offsets': offsets, 'merged_users': {}, 'lines': 0,
+            'keep_credentials': keep_credentials,
+        })
+
+    def new_pk(self, model, pk):
+        if model is User and pk in self.merged_users:
+            return self.merged_users[pk]
+        return pk + self.offsets[_label(model)]
+
+    def build(self, model, record):
+        values = {}
+        for field in _data_fields(model):
+            value = record['fields'].get(field.name)
+            if field.is_relation:
+                if value is not None:
+                    value = self.new_pk(field.related_model, value)
+                values[field.attname] = value
+            else:
+                values[field.attname] = field.to_python(value)
+        if model is User and not self.keep_credentials:
+            values.update(password=make_password(None), is_staff=False, is_superuser=False)
+        return model(pk=self.new_pk(model, record['pk']), **values)
+
+    def _merge_users(self, records):
+        """Map incoming users onto existing accounts with the same username."""
+        by_username = {record['fields']['username']: record['pk'] for record in records}
+        existing = User.objects.filter(username__in=by_username).values_list('username', 'pk')
+        for username, pk in existing:
+            source = by_username[username]
+            # A replayed chunk finds its own rows; those keep the arithmetic mapping.
+            if pk != source + self.offsets[_label(User)]:
+                self.merged_users[source] = pk
+                self.state['merged_users'][str(source)] = pk
+
+    def _attach_likes(self, events):
+        # apply_karma reads the liked post or comment from each event's like.
+        for field, model in (('source_post_like', PostLike), ('source_comment_like', CommentLike)):
+            ids = [getattr(event, field + '_id') for event in events if getattr(event, field + '_id')]
+            likes = model.objects.in_bulk(ids)
+            for event in events:
+                if getattr(event, field + '_id'):
+                    setattr(event, field, likes[getattr(event, field + '_id')])
+
+    def load_chunk(self, model, records):
+        """Insert one chunk of one table in a single transaction; returns the rows inserted."""
+        with transaction.atomic():
+            if model is User:
+                self._merge_users(records)
+            objs = [self.build(model, record) for record in records]
+            present = set(
+                model._default_manager.filter(pk__in=[obj.pk for obj in objs])
+                .values_list('pk', flat=True)
+            )
+            objs = [obj for obj in objs if obj.pk not in present]
+            with _keep_timestamps(model):
+                model._default_manager.bulk_create(objs)
+            if model is KarmaEvent and objs:
+                self._attach_likes(objs)
+                apply_karma(objs)
+        return len(objs)
+
+
+def import_dataset(path, chunk_size=CHUNK_SIZE, progress=None, keep_credentials=False):
+    """
+    Load the dump at `path`, resuming an interrupted import of the same path.
+    `progress(label, rows_read)` is called after each chunk. Returns the
+    number of rows inserted by this run. Users' passwords and staff flags
+    are reset unless `keep_credentials`; a resumed import keeps the choice
+    it started with.
+    """
+    state_path = import_state_path(path)
+    state = _load_state(state_path)
+    importer = Importer(state) if state else Importer.start(keep_credentials)
+    _save_state(state_path, importer.state)
+    models = {_label(model): model for model in MODELS}
+    inserted = 0
+    with deferred_indexes(MODELS):
+        records = islice(read_lines(path), importer.state['lines'], None)
+        for label, group in groupby(records, key=itemgetter('model')):
+            count = 0
+            for chunk in _chunks(group, chunk_size):
+                inserted += importer.load_chunk(models[label], chunk)
+                importer.state['lines'] += len(chunk)
+                _save_state(state_path, importer.state)
+                count += len(chunk)
+                if progress:
+                    progress(label, count)
+    if connection.vendor == 'postgresql':
+        # Explicit ids leave the sequences behind the data.
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), MODELS):
+                cursor.execute(sql)
+    os.remove(state_path)
+    return inserted
@@ -0,0 +1,169 @@
+"""
+Hot-post detection and the adaptive caching tier for viral posts.
+
+Reads and likes of each post are counted in a decaying count-min sketch.
+Posts whose estimate crosses HOT_POST_THRESHOLD are "hot": their detail and
+comment tree payloads are cached for a few seconds and their like counts
+come from an in-process counter that is reconciled with the database every
+HOT_LIKE_FLUSH_SECONDS. Cold posts keep the direct query path.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from comments.models import CommentLike
+from observability.metrics import record_cache_lookup
+
+from .models import PostLike
+from .sharding import shard_for
+
+
+class CountMinSketch:
+    """
+    Fixed-size frequency estimator. Estimates never undercount; collisions
+    can only overcount. All counters are multiplied by `decay` every
+    `decay_seconds`, so old traffic fades out.
+    """
+
+    def __init__(self, width=2048, depth=4, decay=0.5, decay_seconds=60):
+        self.width = width
+        self.depth = depth
+        self.decay = decay
+        self.decay_seconds = decay_seconds
+        self.rows = [[0.0] * width for _ in range(depth)]
+        self._decayed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _indexes(self, key):
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    def _maybe_decay(self):
+        now = time.monotonic()
+        periods = int((now - self._decayed_at) // self.decay_seconds)
+        if periods:
+            factor = self.decay ** periods
+            self.rows = [[count * factor for count in row] for row in self.rows]
+            self._decayed_at += periods * self.decay_seconds
+
+    def add(self, key, amount=1):
+        """Count `key` and return its new estimate."""
+        with self._lock:
+            self._maybe_decay()
+            estimate = None
+            for row, index in zip(self.rows, self._indexes(key)):
+                row[index] += amount
+                if estimate is None or row[index] < estimate:
+                    estimate = row[index]
+            return estimate
+
+    def estimate(self, key):
+        with self._lock:
+            self._maybe_decay()
+            return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+
+class HotPostTracker:
+    def __init__(self, sketch=None):
+        self.sketch = sketch or CountMinSketch(
+            decay_seconds=getattr(settings, 'HOT_POST_DECAY_SECONDS', 60),
+        )
+
+    def record(self, post_id):
+        """Count one read or like of the post and return whether it is hot."""
+        return self.sketch.add(int(post_id)) >= settings.HOT_POST_THRESHOLD
+
+    def is_hot(self, post_id):
+        return self.sketch.estimate(int(post_id)) >= settings.HOT_POST_THRESHOLD
+
+
+class LikeCounter:
+    """
+    In-process like counts for hot posts. Local likes and unlikes adjust the
+    count directly; the count is re-read from the database once it is older
+    than HOT_LIKE_FLUSH_SECONDS, which also picks up other workers' writes.
+    """
+
+    def __init__(self):
+        self._counts = {}  # post_id -> [count, loaded_at]
+        self._lock = threading.Lock()
+
+    def get(self, post_id):
+        post_id = int(post_id)
+        with self._lock:
+            entry = self._counts.get(post_id)
+            if entry and time.monotonic() - entry[1] < settings.HOT_LIKE_FLUSH_SECONDS:
+                return entry[0]
+        count = PostLike.objects.using(shard_for(post_id)).filter(post_id=post_id).count()
+        with self._lock:
+            self._counts[post_id] = [count, time.monotonic()]
+        return count
+
+    def adjust(self, post_id, delta):
+        with self._lock:
+            entry = self._counts.get(int(post_id))
+            if entry:
+                entry[0] += delta
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+hot_posts = HotPostTracker()
+like_counter = LikeCounter()
+
+
+def _detail_key(post_id):
+    return f'hot:post:{post_id}'
+
+
+def _tree_key(post_id):
+    return f'hot:tree:{post_id}'
+
+
+def cached_post_detail(post_id, request, build):
+    """Serialized post for a hot post; `build()` produces it on a miss."""
+    data = cache.get(_detail_key(post_id))
+    record_cache_lookup('hot_post_detail', data is not None)
+    if data is None:
+        data = build()
+        cache.set(_detail_key(post_id), data, settings.HOT_POST_CACHE_TTL)
+    data['like_count'] = like_counter.get(post_id)
+    data['is_liked_by_me'] = (
+        request.user.is_authenticated
+        and PostLike.objects.using(shard_for(post_id))
+        .filter(user=request.user, post_id=post_id)
+        .exists()
+    )
+    return data
+
+
+def cached_comment_tree(post_id, request, build):
+    """Serialized comment tree for a hot post with this user's like flags."""
+    data = cache.get(_tree_key(post_id))
+    record_cache_lookup('hot_comment_tree', data is not None)
+    if data is None:
+        data = build()
+        cache.set(_tree_key(post_id), data, settings.HOT_POST_CACHE_TTL)
+    liked = set()
+    if request.user.is_authenticated:
+        liked = set(
+            CommentLike.objects.using(shard_for(post_id))
+            .filter(user=request.user, comment__post_id=post_id)
+            .values_list('comment_id', flat=True)
+        )
+
+    def apply(nodes):
+        for node in nodes:
+            node['is_liked_by_me'] = node['id'] in liked
+            apply(node['replies'])
+
+    apply(data)
+    return data
+
+
+def invalidate_post(post_id):
+    """Drop cached payloads after a comment or comment like on the post."""
+    cache.delete_many([_detail_key(post_id), _tree_key(post_id)])
@@ -0,0 +1,99 @@
+"""
+Measure cold start: the time from launching the container command to the
+first 200 from /api/posts/, for the old start sequence and for `boot`.
+Each scenario runs the real commands and gunicorn in subprocesses against
+a database in a temporary directory.
+Run: python manage.py bench_boot --restarts 3
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+LEGACY_COMMANDS = [["migrate"], ["add_sample_users"], ["seed_sample_data"]]
+BOOT_COMMANDS = [["boot"]]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_healthy(url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"gunicorn exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.02)
+    raise CommandError(f"{url} was not healthy after {timeout}s")
+
+
+def cold_start(commands, env, timeout):
+    """Seconds from the first command to a healthy /api/posts/, as on a container start."""
+    port = free_port()
+    env = {**env, "PORT": str(port)}
+    started = time.perf_counter()
+    for command in commands:
+        subprocess.run(
+            [sys.executable, "manage.py", *command],
+            cwd=settings.BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL,
+        )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_healthy(f"http://127.0.0.1:{port}/api/posts/", server, timeout)
+        return time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+
+class Command(BaseCommand):
+    help = "Benchmark container cold start with the old start sequence and with `boot`"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restarts", type=int, default=3, help="Restarts timed per setup.")
+        parser.add_argument("--timeout", type=float, default=60)
+
+    def handle(self, *args, **options):
+        restarts, timeout = options["restarts"], options["timeout"]
+        with tempfile.TemporaryDirectory() as directory:
+            base_env = {
+                **os.environ, "THROTTLE_STORE_PATH": "", "WEB_CONCURRENCY": "1",
+                "BOOT_SNAPSHOT_PATH": "",
+            }
+            snapshot = os.path.join(directory, "snapshot.sqlite3")
+            rows = []
+            for name, commands, env in (
+                ("migrate + seed", LEGACY_COMMANDS, {
+                    "DB_PATH": os.path.join(directory, "legacy.sqlite3"),
+                }),
+                ("boot", BOOT_COMMANDS, {"DB_PATH": snapshot}),
+                ("boot --snapshot", BOOT_COMMANDS, {
+                    "DB_PATH": os.path.join(directory, "restored.sqlite3"),
+                    "BOOT_SNAPSHOT_PATH": snapshot,
+                }),
+            ):
+                env = {**base_env, **env}
+                # The first start builds the database; the rest are restarts on it.
+                times = [cold_start(commands, env, timeout) for _ in range(restarts + 1)]
+                rows.append((name, times[0], sum(times[1:]) / restarts if restarts else 0.0))
+
+            self.stdout.write(f"{'':<18}{'first start':>12}{'restart':>10}")
+            for name, first, restart in rows:
+                self.stdout.write(f"{name:<18}{first:>11.2f}s{restart:>9.2f}s")
@@ -0,0 +1,128 @@
+"""
+Prepare the database for serving, doing only the work that is needed:
+
+1. With --snapshot (or BOOT_SNAPSHOT_PATH) and no SQLite database yet,
+   copy in a prebuilt snapshot instead of building the schema from scratch.
+2. Run `migrate` only if a migration file on disk is missing from a
+   database's django_migrations table (every shard has one too).
+   Checking costs one query and a directory listing per app, where
+   `migrate` itself imports every migration and renders the whole
+   project state.
+3. Seed the sample data unless it is already there (--no-seed skips it;
+   sharded, it is always skipped).
+
+Safe to run on every container start.
+Run: python manage.py boot [--snapshot /app/snapshot.sqlite3] [--no-seed]
+"""
+import importlib.util
+import io
+import os
+import shutil
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+from posts.management.commands.seed_sample_data import is_seeded
+from posts.sharding import is_sharded
+
+
+def migration_names_on_disk():
+    """`(app_label, name)` for every migration file, found without importing them."""
+    names = set()
+    for app_config in apps.get_app_configs():
+        module, _ = MigrationLoader.migrations_module(app_config.label)
+        if module is None:
+            continue
+        try:
+            spec = importlib.util.find_spec(module)
+        except ModuleNotFoundError:
+            continue
+        if spec is None or not spec.submodule_search_locations:
+            continue
+        for directory in spec.submodule_search_locations:
+            for entry in os.scandir(directory):
+                name, ext = os.path.splitext(entry.name)
+                if ext == ".py" and name != "__init__" and not name.startswith("~"):
+                    names.add((app_config.label, name))
+    return names
+
+
+def has_unapplied_migrations(using=DEFAULT_DB_ALIAS):
+    recorder = MigrationRecorder(connections[using])
+    if not recorder.has_table():
+        return True
+    applied = set(recorder.migration_qs.values_list("app", "name"))
+    return not migration_names_on_disk() <= applied
+
+
+def restore_snapshot(snapshot, using=DEFAULT_DB_ALIAS):
+    """Copy `snapshot` into place if the SQLite database does not exist yet. Returns True if it did."""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        raise CommandError("Snapshots are only supported for SQLite databases.")
+    target = str(connection.settings_dict["NAME"])
+    if os.path.exists(target) and os.path.getsize(target):
+        return False
+    if not os.path.exists(snapshot):
+        raise CommandError(f"Snapshot {snapshot} does not exist.")
+    connection.close()
+    # Copy next to the target and rename, so a crash never leaves half a database.
+    shutil.copyfile(snapshot, f"{target}.restoring")
+    os.replace(f"{target}.restoring", target)
+    return True
+
+
+class Command(BaseCommand):
+    help = "Restore, migrate and seed the database only as far as needed (idempotent)"
+    # The checks cost more than everything else on a warm start.
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--snapshot",
+            default=settings.BOOT_SNAPSHOT_PATH,
+            help="SQLite file to start from when there is no database yet.",
+        )
+        parser.add_argument("--no-seed", action="store_true", help="Do not seed sample data.")
+
+    def _step(self, name, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(f"{name:<10} {result:<40} {time.perf_counter() - started:.2f}s")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options["snapshot"]:
+            self._step(
+                "snapshot",
+                lambda: "restored" if restore_snapshot(options["snapshot"]) else "database exists",
+            )
+        self._step("migrate", self._migrate)
+        if not options["no_seed"]:
+            self._step("seed", self._seed)
+        self.stdout.write(
+            self.style.SUCCESS(f"Boot finished in {time.perf_counter() - started:.2f}s")
+        )
+
+    def _migrate(self):
+        # With sharding on, every shard gets the full schema too.
+        pending = [alias for alias in connections if has_unapplied_migrations(alias)]
+        if not pending:
+            return "up to date"
+        for alias in pending:
+            call_command("migrate", database=alias, interactive=False, verbosity=0)
+        return "applied"
+
+    def _seed(self):
+        if is_sharded():
+            return "skipped (sample data is not sharded)"
+        if is_seeded():
+            return "already seeded"
+        call_command("seed_sample_data", stdout=io.StringIO())
+        return "seeded"
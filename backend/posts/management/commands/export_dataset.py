@@ -0,0 +1,49 @@
+"""
+Stream users, posts, comments, likes and karma events to a gzip-compressed
+NDJSON file (posts.dataset). Rerun the same command to resume an
+interrupted export.
+Run: python manage.py export_dataset community.ndjson.gz
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.admin_pagination import estimated_row_count
+from posts.dataset import CHUNK_SIZE, MODELS, export_dataset, export_state_path
+from posts.sharding import is_sharded
+
+
+def progress_printer(stdout, totals=None):
+    """One progress line per table, rewritten in place: `label: rows [/ ~estimated total]`."""
+    totals = totals or {}
+    current = []
+
+    def report(label, count):
+        if current and current[-1] != label:
+            stdout.write("")
+        current.append(label)
+        total = f" / ~{totals[label]}" if totals.get(label) else ""
+        stdout.write(f"\r  {label}: {count}{total}", ending="")
+        stdout.flush()
+    return report
+
+
+class Command(BaseCommand):
+    help = "Export the community dataset as gzip-compressed NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file, e.g. community.ndjson.gz")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if is_sharded():
+            raise CommandError("Exports read only `default`; unset SHARD_COUNT to export.")
+        path = options["path"]
+        if os.path.exists(export_state_path(path)):
+            self.stdout.write(f"Resuming the interrupted export to {path}")
+        totals = {model._meta.label_lower: estimated_row_count(model) for model in MODELS}
+        written = export_dataset(
+            path, chunk_size=options["chunk_size"], progress=progress_printer(self.stdout, totals)
+        )
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(f"Exported {written} rows to {path}"))
@@ -0,0 +1,46 @@
+"""
+Load a dump written by export_dataset, remapping ids so it can go into a
+database that already has data (posts.dataset). Rerun the same command to
+resume an interrupted import; the tables' secondary indexes stay dropped
+until it finishes. Imported users get an unusable password and lose their
+staff and superuser flags unless --keep-credentials is given.
+Run: python manage.py import_dataset community.ndjson.gz [--keep-credentials]
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.dataset import CHUNK_SIZE, import_dataset, import_state_path
+from posts.sharding import is_sharded
+
+from .export_dataset import progress_printer
+
+
+class Command(BaseCommand):
+    help = "Import a gzip-compressed NDJSON community dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File written by export_dataset")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            "--keep-credentials",
+            action="store_true",
+            help="Copy password hashes and staff/superuser flags instead of resetting them.",
+        )
+
+    def handle(self, *args, **options):
+        if is_sharded():
+            raise CommandError("Imports write only `default`; unset SHARD_COUNT to import.")
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        if os.path.exists(import_state_path(path)):
+            self.stdout.write(f"Resuming the interrupted import of {path}")
+        inserted = import_dataset(
+            path,
+            chunk_size=options["chunk_size"],
+            progress=progress_printer(self.stdout),
+            keep_credentials=options["keep_credentials"],
+        )
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(f"Imported {inserted} rows from {path}"))
@@ -0,0 +1,111 @@
+"""
+Drive concurrent GETs at a running server and report throughput per
+server process, to compare worker models (see gunicorn.conf.py).
+Run: python manage.py load_test --url http://127.0.0.1:8000 --concurrency 200 \
+         --path /api/async/posts/ --server-processes 2
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ["/api/posts/", "/api/leaderboard/"]
+
+
+async def fetch(host, port, path):
+    """One GET over a fresh connection; returns the status code."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def worker(host, port, paths, deadline, latencies, errors):
+    index = 0
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            status = await fetch(host, port, path)
+        except (OSError, ValueError, IndexError):
+            status = None
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(status)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Load-test read endpoints at high concurrency and report per-process throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server base URL")
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Path to request (repeatable); defaults to the sync feed and leaderboard",
+        )
+        parser.add_argument("--concurrency", type=int, default=100, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+        parser.add_argument(
+            "--server-processes",
+            type=int,
+            default=1,
+            help="Worker processes the server runs (WEB_CONCURRENCY), for the per-process figure",
+        )
+
+    def handle(self, *args, **options):
+        parts = urlsplit(options["url"])
+        if parts.scheme != "http" or not parts.hostname:
+            raise CommandError("--url must be a plain http:// URL")
+        host, port = parts.hostname, parts.port or 80
+        paths = options["paths"] or DEFAULT_PATHS
+        latencies, errors = [], []
+
+        async def run():
+            deadline = time.monotonic() + options["duration"]
+            await asyncio.gather(*(
+                worker(host, port, paths, deadline, latencies, errors)
+                for _ in range(options["concurrency"])
+            ))
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        throughput = len(latencies) / elapsed
+        self.stdout.write(f"Paths: {', '.join(paths)}")
+        self.stdout.write(
+            f"Concurrency {options['concurrency']} for {elapsed:.1f}s: "
+            f"{len(latencies)} ok, {len(errors)} failed"
+        )
+        self.stdout.write(
+            f"Throughput: {throughput:.1f} req/s total, "
+            f"{throughput / options['server_processes']:.1f} req/s per server process"
+        )
+        self.stdout.write(
+            "Latency ms: "
+            + ", ".join(
+                f"p{int(fraction * 100)}={percentile(latencies, fraction) * 1000:.1f}"
+                for fraction in (0.5, 0.95, 0.99)
+            )
+        )
+        if errors and not latencies:
+            raise CommandError("Every request failed; is the server running?")
@@ -1,19 +1,25 @@
 """
 Seed the database with sample users, posts, comments, likes, and karma.
+Does nothing if the sample data is already there; --force seeds again.
 Run: python manage.py seed_sample_data
 """
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.utils import timezone
 
 from comments.models import Comment, CommentLike
+from karma.aggregates import apply_karma
 from karma.models import KarmaEvent, SOURCE_POST_LIKE, SOURCE_COMMENT_LIKE
 from posts.management.commands.add_sample_users import SAMPLE_USERS, DEFAULT_PASSWORD
-from posts.models import Post, PostLike
+from posts.models import BootMarker, Post, PostLike
+from posts.ranking import recompute_scores
+from posts.sharding import is_sharded
 
 User = get_user_model()
 
+SAMPLE_DATA_MARKER = "sample_data"
+
 POST_LIKE_KARMA = 5
 COMMENT_LIKE_KARMA = 1
 
@@ -41,6 +47,11 @@ SAMPLE_COMMENTS = [
 ]
 
 
+def is_seeded():
+    """Whether a seed has committed: one primary key lookup, whatever happened to the posts since."""
+    return BootMarker.objects.filter(name=SAMPLE_DATA_MARKER).exists()
+
+
 def ensure_users(cmd):
     """Create sample users if they don't exist."""
     for data in SAMPLE_USERS:
@@ -58,7 +69,19 @@ def ensure_users(cmd):
 class Command(BaseCommand):
     help = "Seed users, posts, comments, likes, and karma for testing"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Seed again even if the sample data is already there.",
+        )
+
     def handle(self, *args, **options):
+        if is_sharded():
+            raise CommandError("The sample data is not sharded; unset SHARD_COUNT to seed it.")
+        if not options["force"] and is_seeded():
+            self.stdout.write("Sample data already seeded; skipping (use --force to add more).")
+            return
         with transaction.atomic():
             users = ensure_users(self)
             self.stdout.write("")
@@ -95,13 +118,14 @@ class Command(BaseCommand):
                     liker = users[liker_name]
                     pl, created = PostLike.objects.get_or_create(user=liker, post=post)
                     if created:
-                        KarmaEvent.objects.create(
+                        event = KarmaEvent.objects.create(
                             recipient=post.author,
                             actor=liker,
                             source_type=SOURCE_POST_LIKE,
                             points=POST_LIKE_KARMA,
                             source_post_like=pl,
                         )
+                        apply_karma([event])
                 self.stdout.write(f"Added post likes for post {post.id}")
 
             all_comments = list(Comment.objects.select_related("author").all())
@@ -114,15 +138,19 @@ class Command(BaseCommand):
                         user=liker, comment=comment
                     )
                     if created:
-                        KarmaEvent.objects.create(
+                        event = KarmaEvent.objects.create(
                             recipient=comment.author,
                             actor=liker,
                             source_type=SOURCE_COMMENT_LIKE,
                             points=COMMENT_LIKE_KARMA,
                             source_comment_like=cl,
                         )
+                        apply_karma([event])
                 self.stdout.write(f"Added comment likes for comment {comment.id}")
 
+            recompute_scores(posts)
+            BootMarker.objects.get_or_create(name=SAMPLE_DATA_MARKER)
+
         self.stdout.write(
             self.style.SUCCESS(
                 f"\nDone! Log in with any username and password: {DEFAULT_PASSWORD}"
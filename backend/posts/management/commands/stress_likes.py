@@ -0,0 +1,311 @@
+"""
+Hammer like/unlike on a few hot posts and comments from many threads and
+processes, then check the like and karma invariants.
+Run: python manage.py stress_likes --threads 8 --processes 2 --ops 200
+
+Sharded (SHARD_COUNT > 0), the hot posts spread over the shards. Run it
+with TASKS_EAGER=False there: eager tasks write karma to `default` inside
+every like, which puts the single write lock back on the path.
+"""
+import multiprocessing
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from comments.models import Comment, CommentLike
+from comments.views import CommentViewSet
+from karma.models import (
+    COMMENT_LIKE_KARMA_POINTS,
+    POST_LIKE_KARMA_POINTS,
+    KarmaEvent,
+    KarmaTotal,
+)
+from posts.models import Post, PostLike
+from posts.sharding import all_shards, shard_for
+from posts.views import PostViewSet
+from tasks.queue import run_pending
+
+User = get_user_model()
+
+USERNAME_PREFIX = "stress_user_"
+
+# Throttles are off: the harness exists to overload the like path.
+post_like_view = PostViewSet.as_view({"post": "like", "delete": "like"}, throttle_classes=[])
+comment_like_view = CommentViewSet.as_view(
+    {"post": "like", "delete": "like"}, throttle_classes=[]
+)
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+def create_fixtures(num_users, num_posts, num_comments):
+    """Create stress users plus hot posts and comments spread over their authors."""
+    User.objects.bulk_create(
+        [User(username=f"{USERNAME_PREFIX}{i}") for i in range(num_users)]
+    )
+    users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by("id"))
+    # save() rather than create(), so the database router picks each row's shard.
+    posts = [
+        Post(author=users[i % len(users)], content=f"stress post {i}")
+        for i in range(num_posts)
+    ]
+    comments = [
+        Comment(
+            author=users[(i + 1) % len(users)],
+            post=posts[i % len(posts)],
+            content=f"stress comment {i}",
+        )
+        for i in range(num_comments)
+    ]
+    for row in posts + comments:
+        row.save(force_insert=True)
+    return users, posts, comments
+
+
+def delete_fixtures():
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    user_ids = list(users.values_list("id", flat=True))
+    # Cascades to the karma events, which take their points back while the
+    # likes still exist; sharded, it does not reach the posts on the shards.
+    users.delete()
+    for alias in all_shards():
+        Post.objects.using(alias).filter(author_id__in=user_ids).delete()
+
+
+def run_worker(user_ids, post_ids, comment_ids, ops, like_ratio, max_retries, seed):
+    """Issue `ops` random like/unlike requests and return the tallies."""
+    rng = random.Random(seed)
+    factory = APIRequestFactory()
+    users = list(User.objects.filter(id__in=user_ids))
+    stats = Counter()
+    lock_wait = 0.0
+    try:
+        for _ in range(ops):
+            user = rng.choice(users)
+            use_post = not comment_ids or (post_ids and rng.random() < 0.5)
+            target_id = rng.choice(post_ids if use_post else comment_ids)
+            method = "post" if rng.random() < like_ratio else "delete"
+            kind = "post" if use_post else "comment"
+            path = f"/api/{kind}s/{target_id}/like/"
+            view = post_like_view if use_post else comment_like_view
+
+            for attempt in range(max_retries + 1):
+                request = getattr(factory, method)(path)
+                force_authenticate(request, user=user)
+                started = time.perf_counter()
+                try:
+                    response = view(request, pk=target_id)
+                except OperationalError as exc:
+                    if not is_lock_error(exc) or attempt == max_retries:
+                        stats["errors"] += 1
+                        break
+                    stats["retries"] += 1
+                    backoff = 0.001 * (2 ** attempt) * (1 + rng.random())
+                    time.sleep(backoff)
+                    lock_wait += time.perf_counter() - started
+                    continue
+
+                stats["requests"] += 1
+                if response.status_code == 400:
+                    stats["self_like_rejected"] += 1
+                elif response.status_code != 200:
+                    stats["errors"] += 1
+                elif method == "post":
+                    stats["created" if response.data["created"] else "already_liked"] += 1
+                else:
+                    stats["deleted" if response.data["deleted"] else "not_liked"] += 1
+                break
+    finally:
+        connection.close()
+    stats["lock_wait_ms"] = int(lock_wait * 1000)
+    return dict(stats)
+
+
+def run_threads(threads, ops, seed, **kwargs):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [
+            pool.submit(run_worker, ops=ops, seed=seed + i, **kwargs)
+            for i in range(threads)
+        ]
+        results = [future.result() for future in futures]
+    totals = Counter()
+    for result in results:
+        totals.update(result)
+    return dict(totals)
+
+
+def _run_process(args):
+    threads, ops, seed, kwargs = args
+    return run_threads(threads, ops, seed, **kwargs)
+
+
+def _like_rows(model, target, target_ids):
+    """`(id, user_id, target_id)` of the likes on `target_ids`, read from every shard."""
+    rows = []
+    for alias in all_shards():
+        rows.extend(
+            model.objects.using(alias)
+            .filter(**{f"{target}_id__in": target_ids})
+            .values_list("id", "user_id", f"{target}_id")
+        )
+    return rows
+
+
+def check_invariants(users, posts, comments):
+    """Return a list of human-readable invariant violations (empty when consistent)."""
+    errors = []
+    # Likes are on the shards and karma in `default`, so they are compared here
+    # rather than joined.
+    post_authors = {post.pk: post.author_id for post in posts}
+    comment_authors = {comment.pk: comment.author_id for comment in comments}
+    post_likes = _like_rows(PostLike, "post", list(post_authors))
+    comment_likes = _like_rows(CommentLike, "comment", list(comment_authors))
+    # {(kind, like id): (liker, recipient, points)}
+    likes = {}
+    for like_id, user_id, post_id in post_likes:
+        likes["post", like_id] = (user_id, post_authors[post_id], POST_LIKE_KARMA_POINTS)
+    for like_id, user_id, comment_id in comment_likes:
+        likes["comment", like_id] = (
+            user_id, comment_authors[comment_id], COMMENT_LIKE_KARMA_POINTS
+        )
+
+    # Every stress user's karma comes from stress likes, so no other event may remain.
+    events = {}
+    for event in KarmaEvent.objects.filter(recipient__in=users):
+        if event.source_post_like_id:
+            events[("post", event.source_post_like_id)] = event
+        else:
+            events[("comment", event.source_comment_like_id)] = event
+
+    missing = len(likes.keys() - events.keys())
+    if missing:
+        errors.append(f"{missing} likes have no KarmaEvent")
+    if len(events) != len(likes):
+        errors.append(f"{len(events)} KarmaEvents for {len(likes)} likes")
+
+    wrong_recipient = sum(
+        1 for key, event in events.items() if key in likes and event.recipient_id != likes[key][1]
+    )
+    if wrong_recipient:
+        errors.append(f"{wrong_recipient} KarmaEvents credit the wrong recipient")
+
+    self_likes = sum(1 for user_id, author_id, _ in likes.values() if user_id == author_id)
+    if self_likes:
+        errors.append(f"{self_likes} self-likes were stored")
+
+    like_counts = Counter(post_id for _, _, post_id in post_likes)
+    for post_id in post_authors:
+        post = Post.objects.using(shard_for(post_id)).with_like_count().get(pk=post_id)
+        if post.like_count != like_counts[post_id]:
+            errors.append(f"post {post_id} like_count annotation disagrees with rows")
+
+    received = Counter()
+    for event in events.values():
+        received[event.recipient_id] += event.points
+    expected = Counter()
+    for _, author_id, points in likes.values():
+        expected[author_id] += points
+    for user in users:
+        karma = received[user.pk]
+        if karma != expected[user.pk]:
+            errors.append(f"user {user.username} has {karma} karma, expected {expected[user.pk]}")
+        aggregated = sum(KarmaTotal.objects.filter(user=user).values_list("points", flat=True))
+        if aggregated != karma:
+            errors.append(f"user {user.username} karma totals say {aggregated}, events say {karma}")
+    return errors
+
+
+class Command(BaseCommand):
+    help = "Stress like/unlike under contention and verify like and karma invariants"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Threads per process")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=0,
+            help="Worker processes (0 runs the threads in this process)",
+        )
+        parser.add_argument("--ops", type=int, default=200, help="Requests per thread")
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=3, help="Hot posts to contend on")
+        parser.add_argument("--comments", type=int, default=3, help="Hot comments to contend on")
+        parser.add_argument("--like-ratio", type=float, default=0.7)
+        parser.add_argument("--max-retries", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the stress users, posts and likes after the run",
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            delete_fixtures()
+        users, posts, comments = create_fixtures(
+            options["users"], options["posts"], options["comments"]
+        )
+        worker_kwargs = {
+            "user_ids": [u.pk for u in users],
+            "post_ids": [p.pk for p in posts],
+            "comment_ids": [c.pk for c in comments],
+            "like_ratio": options["like_ratio"],
+            "max_retries": options["max_retries"],
+        }
+        threads, processes, ops = options["threads"], options["processes"], options["ops"]
+
+        started = time.perf_counter()
+        if processes:
+            # Children must not inherit the parent's open SQLite handle.
+            connections.close_all()
+            jobs = [
+                (threads, ops, options["seed"] + i * threads, worker_kwargs)
+                for i in range(processes)
+            ]
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                results = pool.map(_run_process, jobs)
+            stats = Counter()
+            for result in results:
+                stats.update(result)
+        else:
+            stats = Counter(run_threads(threads, ops, options["seed"], **worker_kwargs))
+        elapsed = time.perf_counter() - started
+
+        workers = threads * max(processes, 1)
+        self.stdout.write(f"Workers: {workers} ({max(processes, 1)} x {threads} threads)")
+        self.stdout.write(
+            f"Requests: {stats['requests']} in {elapsed:.2f}s "
+            f"({stats['requests'] / elapsed:.1f} req/s)"
+        )
+        for key in (
+            "created", "already_liked", "deleted", "not_liked",
+            "self_like_rejected", "retries", "lock_wait_ms", "errors",
+        ):
+            self.stdout.write(f"  {key}: {stats[key]}")
+
+        # With TASKS_EAGER off the karma awards are still queued; drain them first.
+        drain_started = time.perf_counter()
+        drained = run_pending()
+        if drained:
+            self.stdout.write(
+                f"  queued tasks run: {drained} in {time.perf_counter() - drain_started:.2f}s"
+            )
+        errors = check_invariants(users, posts, comments)
+        if not options["keep"]:
+            delete_fixtures()
+        if stats["errors"]:
+            self.stdout.write(
+                self.style.WARNING(f"{stats['errors']} requests failed after retries")
+            )
+        if errors:
+            raise CommandError("Invariant violations:\n" + "\n".join(errors))
+        self.stdout.write(self.style.SUCCESS("\nAll like and karma invariants hold."))
@@ -0,0 +1,63 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copies of posts.ranking's weights so later tuning does not change
+# what this migration computes.
+LIKE_WEIGHT = 1
+COMMENT_WEIGHT = 2
+NEW_POST_WEIGHT = 1.0
+HOT_HALF_LIFE_SECONDS = 12 * 60 * 60
+
+
+def backfill_scores(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostLike = apps.get_model('posts', 'PostLike')
+    Comment = apps.get_model('comments', 'Comment')
+    now = timezone.now()
+
+    def decay(created_at):
+        return 0.5 ** ((now - created_at).total_seconds() / HOT_HALF_LIFE_SECONDS)
+
+    hot, top = {}, {}
+    for post_id, created_at in Post.objects.values_list('id', 'created_at').iterator():
+        hot[post_id] = NEW_POST_WEIGHT * decay(created_at)
+        top[post_id] = 0
+    for model, weight in ((PostLike, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+        for post_id, created_at in model.objects.values_list('post_id', 'created_at').iterator():
+            top[post_id] += weight
+            hot[post_id] += weight * decay(created_at)
+    Post.objects.bulk_update(
+        [Post(pk=post_id, top_score=top[post_id], hot_score=hot[post_id]) for post_id in hot],
+        ['top_score', 'hot_score'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0001_initial'),
+        ('comments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='top_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='post_hot_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-top_score', '-id'], name='post_top_rank_idx'),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
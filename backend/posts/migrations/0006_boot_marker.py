@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:46
+
+from django.db import migrations, models
+
+# Frozen copies of seed_sample_data's marker name and first sample post,
+# which was how seeded databases were recognised before this migration.
+SAMPLE_DATA = 'sample_data'
+FIRST_AUTHOR = 'alice'
+FIRST_CONTENT = 'Just shipped a new feature! 🚀 Excited to share it with the community.'
+
+
+def mark_seeded_databases(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    BootMarker = apps.get_model('posts', 'BootMarker')
+    if Post.objects.filter(author__username=FIRST_AUTHOR, content=FIRST_CONTENT).exists():
+        BootMarker.objects.get_or_create(name=SAMPLE_DATA)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_shard_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BootMarker',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(mark_seeded_databases, migrations.RunPython.noop),
+    ]
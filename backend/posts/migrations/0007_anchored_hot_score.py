@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:51
+
+import math
+from datetime import datetime, timedelta, timezone
+
+import posts.models
+from django.db import migrations, models
+
+# Frozen copies of posts.ranking's weights and time anchor so later tuning
+# does not change what this migration computes.
+LIKE_WEIGHT = 1
+COMMENT_WEIGHT = 2
+NEW_POST_WEIGHT = 1.0
+HOT_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+HOT_HALF_LIFE = timedelta(hours=12)
+
+
+def anchor_hot_scores(apps, schema_editor):
+    """Replace the decayed-in-place scores with the anchored log2 sums."""
+    alias = schema_editor.connection.alias
+    Post = apps.get_model('posts', 'Post')
+    PostLike = apps.get_model('posts', 'PostLike')
+    Comment = apps.get_model('comments', 'Comment')
+    contributions = {
+        post_id: [(created_at, NEW_POST_WEIGHT)]
+        for post_id, created_at in Post.objects.using(alias).values_list('id', 'created_at').iterator()
+    }
+    for model, weight in ((PostLike, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+        rows = model.objects.using(alias).values_list('post_id', 'created_at')
+        for post_id, created_at in rows.iterator():
+            contributions[post_id].append((created_at, weight))
+
+    def score(rows):
+        anchored = [((created_at - HOT_EPOCH) / HOT_HALF_LIFE, weight) for created_at, weight in rows]
+        top = max(at for at, _ in anchored)
+        return top + math.log2(sum(weight * 2 ** (at - top) for at, weight in anchored))
+
+    Post.objects.using(alias).bulk_update(
+        [Post(pk=post_id, hot_score=score(rows)) for post_id, rows in contributions.items()],
+        ['hot_score'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_boot_marker'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=posts.models.new_post_hot_score),
+        ),
+        migrations.RunPython(anchor_hot_scores, migrations.RunPython.noop),
+    ]
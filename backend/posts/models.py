@@ -1,5 +1,52 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
 from django.db import models
+from django.db.models import F, Func, IntegerField, OuterRef, Q, Subquery
 from django.conf import settings
+from django.utils import timezone
+
+# Starting hot engagement, so new posts surface in the hot feed before decaying.
+NEW_POST_WEIGHT = 1.0
+# Hot scores count engagement in half-lives since HOT_EPOCH (posts.ranking).
+HOT_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+HOT_HALF_LIFE = timedelta(hours=12)
+
+
+def half_lives(moment):
+    return (moment - HOT_EPOCH) / HOT_HALF_LIFE
+
+
+def new_post_hot_score():
+    return half_lives(timezone.now()) + math.log2(NEW_POST_WEIGHT)
+
+
+def related_count(queryset, field):
+    """
+    The number of `queryset` rows whose `field` points at the outer row, as
+    a correlated subquery. Count() over a join would GROUP BY the whole
+    result first, so ORDER BY ... LIMIT could no longer walk an index.
+    """
+    counted = (
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .annotate(total=Func(F('pk'), function='COUNT'))
+        .values('total')
+    )
+    return Subquery(counted, output_field=IntegerField())
+
+
+class PostQuerySet(models.QuerySet):
+    def visible(self):
+        return self.filter(hidden_at__isnull=True)
+
+    def with_like_count(self):
+        return self.annotate(like_count=related_count(PostLike.objects.all(), 'post'))
+
+    def with_comment_count(self):
+        # Comment is looked up through the relation; comments.models imports this module.
+        comments = self.model.comments.field.model.objects.filter(hidden_at__isnull=True)
+        return self.annotate(comment_count=related_count(comments, 'post'))
 
 
 class Post(models.Model):
@@ -11,9 +58,25 @@ class Post(models.Model):
     )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Ranking scores maintained by posts.ranking; see that module.
+    hot_score = models.FloatField(default=new_post_hot_score)
+    top_score = models.IntegerField(default=0)
+    # Set when a moderator removes the post; the rows are purged later in
+    # background batches (moderation.purge).
+    hidden_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-hot_score', '-id'], name='post_hot_rank_idx'),
+            models.Index(fields=['-top_score', '-id'], name='post_top_rank_idx'),
+            models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+            models.Index(
+                fields=['hidden_at'], name='post_hidden_idx', condition=Q(hidden_at__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return f"Post by {self.author.username} at {self.created_at}"
@@ -40,3 +103,28 @@ class PostLike(models.Model):
 
     def __str__(self):
         return f"{self.user.username} likes post {self.post_id}"
+
+
+class ShardSequence(models.Model):
+    """
+    Per-shard id counter for one sharded model, used only when sharding is
+    on (posts.sharding). `value` is the last id handed out on this shard.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class BootMarker(models.Model):
+    """
+    A one-time setup step done on this database, such as seeding the
+    sample data (`manage.py boot`). Written in the step's own transaction,
+    so it exists exactly when the step committed.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
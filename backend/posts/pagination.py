@@ -0,0 +1,101 @@
+"""
+Keyset pagination for the ranked post feeds.
+
+Pages are ordered by `(score DESC, id DESC)` and the cursor is the last row
+of the previous page, so every page is an index range scan on the
+`post_*_rank_idx` indexes no matter how deep the client scrolls. Rows
+added or removed between requests do not shift the pages the way OFFSET
+would, and a row whose score stays put is listed exactly once. A post
+whose score changes while the client scrolls (a like, unlike or comment)
+can cross the cursor, though, and then shows up twice or not at all.
+Scores never change just because time passes: hot scores are anchored in
+time rather than decayed in place (posts.ranking).
+With sharding on (posts.sharding), the same range scan runs on every shard.
+
+`encode_time_cursor` and `decode_time_cursor` are the `(timestamp, id)`
+cursors of the timeline and notification inbox pages.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .sharding import gather
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class ScoreKeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, score_field):
+        self.score_field = score_field
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.score_field}', '-id')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            score, last_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f'{self.score_field}__lt': score})
+                | Q(**{self.score_field: score, 'id__lt': last_id})
+            )
+        rows = gather(queryset, self.page_size + 1)
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(getattr(last, self.score_field), last.id)
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_page_size(self, request):
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw is None:
+            return DEFAULT_PAGE_SIZE
+        if not raw.isdigit() or int(raw) < 1:
+            raise ValidationError({self.page_size_query_param: 'Expected a positive integer.'})
+        return min(int(raw), MAX_PAGE_SIZE)
+
+    def encode_cursor(self, score, last_id):
+        return base64.urlsafe_b64encode(f'{score!r}:{last_id}'.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            score, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+            return float(score), int(last_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+
+
+def encode_time_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{row_id}'.encode()).decode()
+
+
+def decode_time_cursor(cursor):
+    """`(timestamp, id)` from a cursor; the timestamp must carry its UTC offset."""
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp, row_id = datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    if timestamp.tzinfo is None:
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    return timestamp, row_id
@@ -0,0 +1,104 @@
+"""
+Precomputed feed ranking scores.
+
+`Post.top_score` is a plain engagement total (likes plus weighted comments)
+kept exact by incremental updates. `Post.hot_score` ranks the same
+engagement with exponential time decay, each like or comment losing half
+its weight every HOT_HALF_LIFE (posts.models). It is stored anchored in time instead of
+decayed in place: every contribution is scaled by 2 ** (half-lives from
+HOT_EPOCH to when it happened) and the score is the log2 of the sum. The
+decayed value at any moment is 2 ** (hot_score - half_lives(now)), the same
+shift for every post, so the order is the decayed order and a score only
+changes when its own post gets a like, unlike or comment. New posts start
+with NEW_POST_WEIGHT at their creation time. Both scores are indexed with
+the id so ranked pages are keyset scans.
+"""
+import math
+from datetime import timedelta
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Log, Power
+from django.utils import timezone
+
+from comments.models import Comment
+
+from .models import NEW_POST_WEIGHT, Post, PostLike, half_lives
+from .sharding import group_by_shard, shard_for
+
+LIKE_WEIGHT = 1
+COMMENT_WEIGHT = 2
+# Unlikes never take a post's hot engagement below this, keeping the log finite.
+HOT_SCORE_FLOOR = 1e-4
+
+SORT_FIELDS = {
+    'hot': 'hot_score',
+    'top': 'top_score',
+}
+
+TOP_WINDOWS = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=30),
+    'year': timedelta(days=365),
+    'all': None,
+}
+
+
+def bump_scores(post_id, likes=0, comments=0):
+    """Apply engagement deltas (negative for unlikes) to a post's scores."""
+    weight = likes * LIKE_WEIGHT + comments * COMMENT_WEIGHT
+    if not weight:
+        return
+    now = half_lives(timezone.now())
+    # log2(2 ** hot_score + weight * 2 ** now), computed relative to `now`
+    # so the powers stay near 1 instead of overflowing.
+    engagement = Power(Value(2.0), F('hot_score') - now) + float(weight)
+    Post.objects.using(shard_for(post_id)).filter(pk=post_id).update(
+        top_score=F('top_score') + weight,
+        hot_score=Log(Value(2.0), Greatest(engagement, Value(HOT_SCORE_FLOOR))) + now,
+    )
+
+
+def hot_score(contributions):
+    """The hot score of `(created_at, weight)` contributions, summed in log space."""
+    anchored = [(half_lives(created_at), weight) for created_at, weight in contributions]
+    top = max(at for at, _ in anchored)
+    return top + math.log2(sum(weight * 2 ** (at - top) for at, weight in anchored))
+
+
+def recompute_scores(posts):
+    """
+    Rebuild both scores from the like and comment rows, for backfills and
+    after bulk loads that bypass `bump_scores`.
+    """
+    for alias, post_ids in group_by_shard(post.pk for post in posts).items():
+        _recompute_scores(alias, post_ids)
+
+
+def _recompute_scores(alias, post_ids):
+    created = Post.objects.using(alias).filter(pk__in=post_ids).values_list('id', 'created_at')
+    hot = {post_id: [(created_at, NEW_POST_WEIGHT)] for post_id, created_at in created}
+    top = dict.fromkeys(hot, 0)
+    for model, weight in ((PostLike, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+        rows = (
+            model.objects.using(alias)
+            .filter(post_id__in=post_ids)
+            .values_list('post_id', 'created_at')
+        )
+        for post_id, created_at in rows.iterator():
+            top[post_id] += weight
+            hot[post_id].append((created_at, weight))
+    Post.objects.using(alias).bulk_update(
+        [
+            Post(pk=post_id, top_score=top[post_id], hot_score=hot_score(hot[post_id]))
+            for post_id in hot
+        ],
+        ['top_score', 'hot_score'],
+        batch_size=500,
+    )
+
+
+def window_start(window):
+    span = TOP_WINDOWS[window]
+    return timezone.now() - span if span else None
+
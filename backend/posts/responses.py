@@ -0,0 +1,121 @@
+"""
+Shared cache of rendered API responses, for the reads that are the same
+for every anonymous visitor: the post lists, post detail, comment trees
+and the leaderboard.
+
+An anonymous request is answered with the stored JSON body as is, for up
+to RESPONSE_CACHE_TTL seconds. An authenticated request reuses the same
+body and only patches in its own like flags (`personalize`), which costs
+one flag query instead of the whole view. Its misses are built as usual
+and never stored, so a cached body never carries one user's flags.
+
+Entries are not deleted on writes. Every key embeds a version token
+instead: one for all list responses, and one per post for its detail and
+comment tree. Like and comment writes replace the tokens they touch
+(`invalidate_responses`) and the next read misses. When many requests
+miss the same key at once, the first takes a short lock and builds the
+response; the others wait for its result instead of all querying the
+database (for at most WAIT_SECONDS).
+"""
+import json
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from observability.metrics import record_cache_lookup
+
+LISTS = 'lists'
+LOCK_SECONDS = 10
+WAIT_SECONDS = 2
+WAIT_STEP = 0.01
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def _version_key(scope):
+    return f'response:version:{scope}'
+
+
+def invalidate_responses(post_ids=()):
+    """Drop the cached lists, and the detail and comment tree of each post in `post_ids`."""
+    token = time.time_ns()
+    scopes = [LISTS, *(post_scope(post_id) for post_id in post_ids)]
+    cache.set_many({_version_key(scope): token for scope in scopes}, None)
+
+
+def _fill(key, render, ttl):
+    """Render and store `key`, with one renderer per key across concurrent misses."""
+    lock = f'{key}:lock'
+    deadline = time.monotonic() + WAIT_SECONDS
+    while not cache.add(lock, 1, LOCK_SECONDS):
+        time.sleep(WAIT_STEP)
+        body = cache.get(key)
+        if body is not None:
+            return body
+        if time.monotonic() >= deadline:
+            # The holder is slow or gone; render without caching rather than queue up.
+            return render()
+    try:
+        # The previous holder may have stored it between our get and our add.
+        body = cache.get(key)
+        if body is None:
+            body = render()
+            cache.set(key, body, ttl)
+        return body
+    finally:
+        cache.delete(lock)
+
+
+def _key(request, scope, version, params):
+    # Scheme and host are part of the key: paginated bodies carry absolute `next` links.
+    query = urlencode([
+        (name, value) for name in params for value in request.query_params.getlist(name)
+    ])
+    return (
+        f'response:{scope}:{version}:{request.accepted_media_type}:'
+        f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    )
+
+
+def cached_response(request, scope, build, personalize=None, params=()):
+    """
+    The response to `request`, from the cache or from `build()`, which
+    returns the view's serialized data for `request`. `personalize(data,
+    user)` sets an authenticated user's flags in a cached body; views
+    without per-user fields leave it out and everyone shares one body.
+    `params` are the query parameters the view reads. A request with any
+    other parameter is built without the cache, so made-up parameters can
+    neither fill the cache with entries nor end up in a cached link.
+    """
+    ttl = settings.RESPONSE_CACHE_TTL
+    if (
+        not ttl
+        or request.accepted_renderer.format != 'json'
+        or not set(request.query_params) <= set(params)
+    ):
+        return Response(build())
+    shared = personalize is None or not request.user.is_authenticated
+    key = _key(request, scope, cache.get(_version_key(scope), ''), params)
+    body = cache.get(key)
+    record_cache_lookup('response', body is not None)
+    if body is None:
+        if not shared:
+            return Response(build())
+
+        def render():
+            return request.accepted_renderer.render(
+                build(), request.accepted_media_type, {'request': request}
+            )
+
+        body = _fill(key, render, ttl)
+    if shared:
+        return HttpResponse(body, content_type=request.accepted_media_type)
+    data = json.loads(body)
+    personalize(data, request.user)
+    return Response(data)
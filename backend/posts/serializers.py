@@ -1,10 +1,12 @@
 from rest_framework import serializers
 from django.db.models import Count
 
+from observability.timing import TimedSerializerMixin
+
 from .models import Post
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     like_count = serializers.SerializerMethodField()
     comment_count = serializers.SerializerMethodField()
@@ -24,6 +26,12 @@ class PostSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['author', 'created_at']
 
+    def create(self, validated_data):
+        # save() lets the database router place the new post (posts.sharding).
+        post = Post(**validated_data)
+        post.save(force_insert=True)
+        return post
+
     def get_like_count(self, obj):
         # Prefer annotated value when queryset includes it.
         if hasattr(obj, 'like_count'):
@@ -0,0 +1,209 @@
+"""
+Optional horizontal sharding of the post tables.
+
+With SHARD_COUNT > 0 (see settings), Post, Comment, PostLike and
+CommentLike rows live in the databases `shard0` ... `shardN-1` instead of
+`default`. Users, karma, timelines and notifications stay in `default`.
+A post's comments and likes, and the likes on those comments, are kept on
+the post's shard, and so are the tasks a like or a reply queues (the
+karma, scores and notifications that follow from it; tasks.queue). A like
+or a reply therefore takes only its shard's write lock, so writes to posts
+on different shards no longer queue behind a single SQLite writer.
+
+Ids are handed out per shard from ShardSequence, so that `id % N` is the
+shard's index. Any id, and any foreign key to one of these rows, names its
+shard without a lookup (`shard_for`). ShardRouter routes model instances
+by that rule. Code that starts from a bare id picks the database itself
+with `.using(shard_for(id))`. Lists that span posts are read from every
+shard and merged (`gather`).
+
+Every database gets the full schema, so joins and cascade lookups on a
+shard find empty tables instead of failing. Relations across databases
+cannot be enforced, though:
+- Settings turn off SQLite's foreign key checks in sharded mode.
+- User foreign keys are prefetched from `default` instead of joined
+  (`with_users`).
+- Rows in `default` that point at a sharded row are deleted explicitly.
+
+Every API read and write path, search, moderation and its purge go
+through these helpers. The admin, which reads only `default`, is left out
+of INSTALLED_APPS when sharded (and refused by a system check, posts.E001);
+the sample data seed, the dataset commands and bench_purge refuse to run.
+Unsharded, every helper here falls back to `default` and leaves queries
+as they were.
+"""
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from itertools import count
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+
+SHARDED_MODELS = {'posts.post', 'posts.postlike', 'comments.comment', 'comments.commentlike'}
+
+_new_posts = count()
+
+
+def is_sharded():
+    return bool(settings.SHARD_DATABASES)
+
+
+def all_shards():
+    return settings.SHARD_DATABASES or [DEFAULT_DB_ALIAS]
+
+
+def shard_for(row_id):
+    """The database of the sharded row `row_id`, or of the rows pointing at it."""
+    aliases = settings.SHARD_DATABASES
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    return aliases[int(row_id) % len(aliases)]
+
+
+def _instance_shard(instance):
+    label = instance._meta.label_lower
+    if label == 'posts.post':
+        if instance.pk is None:
+            # New posts go round-robin; their replies and likes follow them.
+            aliases = settings.SHARD_DATABASES
+            return aliases[next(_new_posts) % len(aliases)]
+        return shard_for(instance.pk)
+    if label in ('posts.postlike', 'comments.comment'):
+        return shard_for(instance.post_id)
+    return shard_for(instance.comment_id)
+
+
+class ShardRouter:
+    """Sends the sharded models to their row's shard and everything else to `default`."""
+
+    def _db(self, model, hints):
+        if model._meta.label_lower not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._meta.label_lower in SHARDED_MODELS:
+            return _instance_shard(instance)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users and karma live in `default`; posts point at them from every shard.
+        return True
+
+
+def allocate_ids(model, alias, number):
+    """
+    The next `number` ids for `model` on shard `alias`, for rows saved with
+    bulk_create (which sends no pre_save): shard i hands out i + N, i + 2N, ...
+    """
+    aliases = settings.SHARD_DATABASES
+    step = len(aliases)
+    name = model._meta.label_lower
+    # Imported here: the router module is loaded with the settings, before the apps.
+    from .models import ShardSequence
+    sequences = ShardSequence.objects.using(alias).filter(name=name)
+    with transaction.atomic(using=alias):
+        # The UPDATE comes first so it takes the write lock before anything is read.
+        if not sequences.update(value=F('value') + number * step):
+            ShardSequence.objects.using(alias).bulk_create(
+                [ShardSequence(name=name, value=aliases.index(alias))], ignore_conflicts=True
+            )
+            sequences.update(value=F('value') + number * step)
+        last = sequences.values_list('value', flat=True).get()
+    return list(range(last - (number - 1) * step, last + 1, step))
+
+
+def allocate_id(model, alias):
+    """The next id for `model` on shard `alias`."""
+    return allocate_ids(model, alias, 1)[0]
+
+
+def assign_shard_ids(objs, alias):
+    """Give the unsaved `objs` of one model ids from shard `alias`'s sequence before a bulk_create."""
+    if alias in settings.SHARD_DATABASES and objs:
+        for obj, pk in zip(objs, allocate_ids(type(objs[0]), alias, len(objs))):
+            obj.pk = pk
+
+
+def assign_shard_id(sender, instance, raw, using, **kwargs):
+    """pre_save receiver giving new rows on a shard an id from that shard's sequence."""
+    if instance.pk is None and using in settings.SHARD_DATABASES:
+        instance.pk = allocate_id(sender, using)
+
+
+def disable_foreign_keys(using, **kwargs):
+    """post_migrate receiver: migrate turns SQLite's foreign key checks back on."""
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+@contextmanager
+def atomic(*aliases):
+    """
+    A transaction for writes to the shards `aliases` and the tasks they
+    queue there (`enqueue(using=alias)`), which touches no other database.
+    With TASKS_EAGER the tasks run inline and write `default` too, so it
+    gets a transaction as well, the outermost: the shards commit first.
+    """
+    shards = sorted(set(aliases) - {DEFAULT_DB_ALIAS})
+    if settings.TASKS_EAGER or DEFAULT_DB_ALIAS in aliases:
+        shards.insert(0, DEFAULT_DB_ALIAS)
+    with ExitStack() as stack:
+        for alias in shards:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def with_users(queryset, *fields):
+    """
+    `select_related(*fields)` for foreign keys to users. Sharded, they are
+    prefetched from `default` instead: a join on a shard finds no users.
+    """
+    if is_sharded():
+        return queryset.prefetch_related(*fields)
+    return queryset.select_related(*fields)
+
+
+def gather(queryset, limit=None):
+    """
+    Evaluate `queryset` on every shard and merge the rows in its own
+    ORDER BY, keeping the first `limit`. Each shard returns at most
+    `limit` rows, so a page costs N small range scans.
+    """
+    if not is_sharded():
+        return list(queryset if limit is None else queryset[:limit])
+    rows = []
+    for alias in settings.SHARD_DATABASES:
+        part = queryset.using(alias)
+        rows.extend(part if limit is None else part[:limit])
+    # Stable sorts from the last ordering field to the first.
+    for field in reversed(queryset.query.order_by):
+        rows.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+    return rows if limit is None else rows[:limit]
+
+
+def group_by_shard(ids):
+    """`{alias: ids}` for the sharded rows (or the rows pointing at them) in `ids`."""
+    groups = defaultdict(list)
+    for row_id in ids:
+        groups[shard_for(row_id)].append(row_id)
+    return groups
+
+
+def in_bulk(queryset, ids):
+    """`queryset.in_bulk(ids)` with each id looked up on its own shard."""
+    if not is_sharded():
+        return queryset.in_bulk(ids)
+    found = {}
+    for alias, shard_ids in group_by_shard(ids).items():
+        found.update(queryset.using(alias).in_bulk(shard_ids))
+    return found
+
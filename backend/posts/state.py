@@ -0,0 +1,114 @@
+"""
+Like/comment counts and per-user like flags for many posts and comments
+at once, for clients that refresh only what is on screen.
+
+Counts are cached per item (STATE_CACHE_TTL) and dropped on writes; the
+per-user flags are never cached. A request costs at most two count queries
+(cache misses only) and two flag queries, however many ids it asks for.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from comments.models import Comment, CommentLike
+from observability.metrics import record_cache_lookup
+
+from .models import Post, PostLike
+from .sharding import group_by_shard
+
+
+def _post_key(post_id):
+    return f'state:post:{post_id}'
+
+
+def _comment_key(comment_id):
+    return f'state:comment:{comment_id}'
+
+
+def _cached_counts(ids, key_func, load):
+    keys = {key_func(item_id): item_id for item_id in ids}
+    found = cache.get_many(keys)
+    counts = {keys[key]: value for key, value in found.items()}
+    missing = [item_id for item_id in ids if item_id not in counts]
+    record_cache_lookup('item_state', True, len(found))
+    record_cache_lookup('item_state', False, len(missing))
+    if missing:
+        loaded = load(missing)
+        # Unknown and hidden ids are cached as None so they are not looked up again.
+        cache.set_many(
+            {key_func(item_id): loaded.get(item_id) for item_id in missing},
+            settings.STATE_CACHE_TTL,
+        )
+        counts.update(loaded)
+    return {item_id: value for item_id, value in counts.items() if value is not None}
+
+
+def _load_counts(queryset, ids, *counts):
+    """`{id: {count: value}}` for the rows of `queryset` in `ids`, read on their shards."""
+    loaded = {}
+    for alias, shard_ids in group_by_shard(ids).items():
+        rows = queryset.using(alias).filter(id__in=shard_ids).values_list('id', *counts)
+        loaded.update({row[0]: dict(zip(counts, row[1:])) for row in rows})
+    return loaded
+
+
+def _load_post_counts(ids):
+    queryset = Post.objects.visible().with_like_count().with_comment_count()
+    return _load_counts(queryset, ids, 'like_count', 'comment_count')
+
+
+def _load_comment_counts(ids):
+    queryset = Comment.objects.visible().with_like_count().with_reply_count()
+    return _load_counts(queryset, ids, 'like_count', 'reply_count')
+
+
+def _liked(model, field, user, ids):
+    liked = set()
+    for alias, shard_ids in group_by_shard(ids).items():
+        liked.update(
+            model.objects.using(alias)
+            .filter(user=user, **{f'{field}__in': shard_ids})
+            .values_list(field, flat=True)
+        )
+    return liked
+
+
+def liked_post_ids(user, post_ids):
+    """The ids in `post_ids` that `user` likes: one query per shard involved."""
+    return _liked(PostLike, 'post_id', user, post_ids)
+
+
+def liked_comment_ids(user, comment_ids):
+    return _liked(CommentLike, 'comment_id', user, comment_ids)
+
+
+def item_state(user, post_ids, comment_ids):
+    posts = _cached_counts(post_ids, _post_key, _load_post_counts) if post_ids else {}
+    comments = _cached_counts(comment_ids, _comment_key, _load_comment_counts) if comment_ids else {}
+
+    liked_posts = liked_comments = set()
+    if user.is_authenticated:
+        liked_posts = liked_post_ids(user, posts)
+        liked_comments = liked_comment_ids(user, comments)
+
+    return {
+        'posts': {
+            str(post_id): {**counts, 'is_liked_by_me': post_id in liked_posts}
+            for post_id, counts in posts.items()
+        },
+        'comments': {
+            str(comment_id): {**counts, 'is_liked_by_me': comment_id in liked_comments}
+            for comment_id, counts in comments.items()
+        },
+    }
+
+
+def invalidate_post_state(post_id):
+    cache.delete(_post_key(post_id))
+
+
+def invalidate_comment_state(comment_id):
+    cache.delete(_comment_key(comment_id))
+
+
+def invalidate_comment_states(comment_ids):
+    cache.delete_many([_comment_key(comment_id) for comment_id in comment_ids])
@@ -0,0 +1,8 @@
+from tasks.queue import task
+
+from .ranking import bump_scores
+
+
+@task('posts.bump_scores')
+def bump_post_scores(post_id, likes=0, comments=0):
+    bump_scores(post_id, likes=likes, comments=comments)
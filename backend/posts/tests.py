@@ -0,0 +1,885 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from comments.models import Comment, CommentLike
+from karma.models import KarmaEvent, KarmaTotal
+from notifications.models import Notification
+from tasks.models import Task
+from tasks.queue import run_pending
+
+from . import admin_pagination, batch, responses, throttling
+from .dataset import export_dataset, import_dataset
+from .hotness import CountMinSketch, hot_posts, like_counter
+from .management.commands.boot import has_unapplied_migrations
+from .models import HOT_HALF_LIFE, NEW_POST_WEIGHT, Post, PostLike, half_lives
+from .ranking import recompute_scores
+from .checks import check_sharding
+from .sharding import shard_for
+
+User = get_user_model()
+
+
+class StressLikesCommandTests(TransactionTestCase):
+    def tearDown(self):
+        # The run makes its posts hot; don't leak that into other tests.
+        hot_posts.sketch = CountMinSketch()
+        like_counter.clear()
+
+    def test_concurrent_likes_keep_karma_invariants(self):
+        out = StringIO()
+        call_command(
+            'stress_likes',
+            threads=4,
+            ops=25,
+            users=6,
+            posts=2,
+            comments=2,
+            stdout=out,
+        )
+        self.assertIn('All like and karma invariants hold.', out.getvalue())
+        # Fixtures are removed after the run unless --keep is given.
+        self.assertFalse(User.objects.filter(username__startswith='stress_user_').exists())
+        self.assertFalse(KarmaEvent.objects.exists())
+
+
+class CountMinSketchTests(TestCase):
+    @mock.patch('posts.hotness.time.monotonic')
+    def test_estimates_never_undercount_and_decay(self, monotonic):
+        # A whole-number clock keeps the period boundaries exact.
+        monotonic.return_value = 1000.0
+        sketch = CountMinSketch(width=8, depth=3, decay=0.5, decay_seconds=60)
+        for key in range(20):
+            sketch.add(key, amount=key)
+        for key in range(20):
+            self.assertGreaterEqual(sketch.estimate(key), key)
+
+        before = sketch.estimate(19)
+        monotonic.return_value = 1119.0
+        self.assertEqual(sketch.estimate(19), before * 0.5)
+        # Exactly two periods in, the second decay applies.
+        monotonic.return_value = 1120.0
+        self.assertEqual(sketch.estimate(19), before * 0.25)
+
+
+@override_settings(HOT_POST_THRESHOLD=3, HOT_POST_CACHE_TTL=60, HOT_LIKE_FLUSH_SECONDS=60)
+class HotPostTierTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        like_counter.clear()
+        hot_posts.sketch = CountMinSketch()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='viral')
+        self.comment = Comment.objects.create(author=self.author, post=self.post, content='hi')
+
+    def test_hot_post_detail_is_served_from_cache(self):
+        url = f'/api/posts/{self.post.id}/'
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get(url)  # crosses the threshold and fills the cache
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['content'], 'viral')
+        self.assertFalse(response.json()['is_liked_by_me'])
+
+    def test_hot_post_like_count_comes_from_counter(self):
+        self.client.force_login(self.fan)
+        for _ in range(3):
+            self.client.get(f'/api/posts/{self.post.id}/')
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.json()['like_count'], 1)
+        detail = self.client.get(f'/api/posts/{self.post.id}/').json()
+        self.assertEqual(detail['like_count'], 1)
+        self.assertTrue(detail['is_liked_by_me'])
+        response = self.client.delete(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.json()['like_count'], 0)
+
+    def test_hot_comment_tree_patches_user_flags_and_invalidates(self):
+        url = f'/api/posts/{self.post.id}/comments/tree/'
+        for _ in range(3):
+            self.client.get(url)
+        CommentLike.objects.create(user=self.fan, comment=self.comment)
+        self.client.force_login(self.fan)
+        tree = self.client.get(url).json()
+        self.assertTrue(tree[0]['is_liked_by_me'])
+        self.assertEqual(tree[0]['like_count'], 0)  # cached before the like
+
+        self.client.post(
+            '/api/comments/',
+            {'post': self.post.id, 'content': 'reply', 'parent': self.comment.id},
+        )
+        tree = self.client.get(url).json()
+        self.assertEqual(tree[0]['like_count'], 1)
+        self.assertEqual(len(tree[0]['replies']), 1)
+
+
+@override_settings(RESPONSE_CACHE_TTL=60)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='hello')
+        self.comment = Comment.objects.create(author=self.author, post=self.post, content='hi')
+
+    def test_anonymous_reads_are_served_from_cache(self):
+        for url in (
+            '/api/posts/', '/api/posts/?sort=hot', f'/api/posts/{self.post.id}/',
+            f'/api/posts/{self.post.id}/comments/tree/', '/api/leaderboard/',
+        ):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(second.json(), first.json())
+
+    def test_key_covers_host_and_skips_unknown_params(self):
+        self.client.get('/api/posts/', {'sort': 'hot', 'page_size': 1}, HTTP_HOST='evil.example')
+        Post.objects.create(author=self.author, content='second')
+        data = self.client.get('/api/posts/', {'sort': 'hot', 'page_size': 1}).json()
+        self.assertTrue(data['next'].startswith('http://testserver/'))
+
+        self.client.get('/api/posts/', {'x': 'junk'})
+        with self.assertNumQueries(1):
+            self.client.get('/api/posts/', {'x': 'junk'})
+
+    def test_writes_invalidate_cached_responses(self):
+        self.client.get('/api/posts/')
+        self.client.get(f'/api/posts/{self.post.id}/comments/tree/')
+        self.client.force_login(self.fan)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.post(f'/api/comments/{self.comment.id}/like/')
+        self.client.logout()
+
+        self.assertEqual(self.client.get('/api/posts/').json()[0]['like_count'], 1)
+        tree = self.client.get(f'/api/posts/{self.post.id}/comments/tree/').json()
+        self.assertEqual(tree[0]['like_count'], 1)
+        self.assertFalse(tree[0]['is_liked_by_me'])
+        self.assertEqual(self.client.get('/api/leaderboard/').json()[0]['username'], 'author')
+
+    def test_signed_in_reads_patch_their_flags_into_the_cached_body(self):
+        PostLike.objects.create(user=self.fan, post=self.post)
+        CommentLike.objects.create(user=self.fan, comment=self.comment)
+        detail = f'/api/posts/{self.post.id}/'
+        tree = f'/api/posts/{self.post.id}/comments/tree/'
+        self.client.get(detail)
+        self.client.get(tree)
+
+        self.client.force_login(self.fan)
+        # Session, user and the like flag; the post itself comes from the cache.
+        with self.assertNumQueries(3):
+            data = self.client.get(detail).json()
+        self.assertTrue(data['is_liked_by_me'])
+        self.assertTrue(self.client.get(tree).json()[0]['is_liked_by_me'])
+        self.client.logout()
+        self.assertFalse(self.client.get(detail).json()['is_liked_by_me'])
+
+    def test_concurrent_misses_render_once(self):
+        renders = []
+
+        def render():
+            renders.append(1)
+            time.sleep(0.2)
+            return b'[]'
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            bodies = list(pool.map(lambda _: responses._fill('response:test', render, 60), range(5)))
+        self.assertEqual(bodies, [b'[]'] * 5)
+        self.assertEqual(len(renders), 1)
+
+
+class ItemStateApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.posts = [Post.objects.create(author=self.author, content=f'p{i}') for i in range(3)]
+        self.comment = Comment.objects.create(author=self.author, post=self.posts[0], content='c')
+        Comment.objects.create(
+            author=self.fan, post=self.posts[0], parent=self.comment, content='reply'
+        )
+        PostLike.objects.create(user=self.fan, post=self.posts[0])
+        CommentLike.objects.create(user=self.fan, comment=self.comment)
+
+    def test_returns_counts_and_flags_in_constant_queries(self):
+        self.client.force_login(self.fan)
+        post_ids = ','.join(str(post.id) for post in self.posts)
+        params = {'posts': post_ids, 'comments': f'{self.comment.id},999999'}
+        # Session + user lookups, then two count queries and two flag queries.
+        with self.assertNumQueries(6):
+            data = self.client.get('/api/state/', params).json()
+        first = data['posts'][str(self.posts[0].id)]
+        self.assertEqual(first, {'like_count': 1, 'comment_count': 2, 'is_liked_by_me': True})
+        self.assertEqual(len(data['posts']), 3)
+        self.assertEqual(
+            data['comments'],
+            {str(self.comment.id): {'like_count': 1, 'reply_count': 1, 'is_liked_by_me': True}},
+        )
+        # Counts are now cached; only the session, user and flag queries remain.
+        with self.assertNumQueries(4):
+            self.client.get('/api/state/', params)
+
+    def test_hidden_items_are_left_out(self):
+        now = timezone.now()
+        Post.objects.filter(pk=self.posts[1].pk).update(hidden_at=now)
+        Post.objects.filter(pk=self.posts[0].pk).update(hidden_at=now)
+        params = {'posts': f'{self.posts[0].id},{self.posts[1].id}', 'comments': self.comment.id}
+        data = self.client.get('/api/state/', params).json()
+        self.assertEqual(data, {'posts': {}, 'comments': {}})
+
+    def test_like_invalidates_cached_counts(self):
+        url = f'/api/state/?posts={self.posts[1].id}'
+        self.assertEqual(self.client.get(url).json()['posts'][str(self.posts[1].id)]['like_count'], 0)
+        self.client.force_login(self.fan)
+        self.client.post(f'/api/posts/{self.posts[1].id}/like/')
+        state = self.client.get(url).json()['posts'][str(self.posts[1].id)]
+        self.assertEqual(state['like_count'], 1)
+        self.assertTrue(state['is_liked_by_me'])
+
+    def test_rejects_malformed_ids(self):
+        for posts in ('1,abc', '100000000000000000000000000', '-1'):
+            with self.subTest(posts=posts):
+                response = self.client.get('/api/state/', {'posts': posts})
+                self.assertEqual(response.status_code, 400)
+
+
+class BatchApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='p')
+        self.other_post = Post.objects.create(author=self.author, content='q')
+        self.comment = Comment.objects.create(author=self.author, post=self.post, content='c')
+        self.client.force_login(self.fan)
+
+    def _batch(self, operations):
+        return self.client.post('/api/batch/', {'operations': operations}, content_type='application/json')
+
+    def test_applies_operations_in_order_with_karma(self):
+        response = self._batch([
+            {'op': 'like_post', 'id': self.post.id},
+            {'op': 'like_post', 'id': self.post.id},
+            {'op': 'like_post', 'id': self.other_post.id},
+            {'op': 'unlike_post', 'id': self.other_post.id},
+            {'op': 'like_comment', 'id': self.comment.id},
+            {'op': 'create_comment', 'post': self.post.id, 'parent': self.comment.id, 'content': 'hi'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r.get('created') for r in results[:3]], [True, False, True])
+        self.assertTrue(results[3]['deleted'])
+        self.assertEqual(results[0]['like_count'], 1)
+        self.assertEqual(results[3]['like_count'], 0)
+        self.assertEqual(results[5]['parent'], self.comment.id)
+
+        self.assertEqual(PostLike.objects.filter(user=self.fan).count(), 1)
+        self.assertEqual(CommentLike.objects.filter(user=self.fan).count(), 1)
+        self.assertEqual(
+            sorted(KarmaEvent.objects.values_list('recipient__username', 'points')),
+            [('author', 1), ('author', 5)],
+        )
+        self.assertTrue(Comment.objects.filter(id=results[5]['id'], author=self.fan).exists())
+        # One net like and one comment on the first post; the second nets to zero.
+        self.post.refresh_from_db()
+        self.other_post.refresh_from_db()
+        self.assertEqual((self.post.top_score, self.other_post.top_score), (3, 0))
+
+    def test_invalid_operation_rejects_whole_batch(self):
+        own_post = Post.objects.create(author=self.fan, content='mine')
+        response = self._batch([
+            {'op': 'like_post', 'id': self.post.id},
+            {'op': 'like_post', 'id': own_post.id},
+            {'op': 'create_comment', 'post': self.other_post.id, 'parent': self.comment.id, 'content': 'x'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['operations']
+        self.assertEqual(errors[0], {})
+        self.assertIn('own post', errors[1]['detail'])
+        self.assertIn('parent', errors[2])
+        self.assertFalse(PostLike.objects.exists())
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        response = self._batch([{'op': 'like_post', 'id': self.post.id}])
+        self.assertEqual(response.status_code, 403)
+
+    def test_malformed_operations_are_rejected(self):
+        for operation in (
+            {'op': []},
+            {'op': 'like_post', 'id': 10 ** 30},
+            {'op': 'like_post', 'id': 0},
+        ):
+            with self.subTest(operation=operation):
+                self.assertEqual(self._batch([operation]).status_code, 400)
+
+    @override_settings(TASKS_EAGER=False)
+    def test_score_bumps_commit_with_the_batch(self):
+        apply = batch._apply
+
+        def apply_then_die(*args):
+            apply(*args)
+            raise SystemExit
+
+        with mock.patch('posts.batch._apply', apply_then_die), self.assertRaises(SystemExit):
+            self._batch([
+                {'op': 'like_post', 'id': self.post.id},
+                {'op': 'create_comment', 'post': self.post.id, 'content': 'hi'},
+            ])
+        run_pending()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.top_score, 3)
+
+
+class RankedFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fans = [
+            User.objects.create_user(username=f'fan{i}', password='pass1234') for i in range(3)
+        ]
+        self.posts = [Post.objects.create(author=self.author, content=f'p{i}') for i in range(5)]
+
+    def _like(self, fan, post):
+        self.client.force_login(fan)
+        return self.client.post(f'/api/posts/{post.id}/like/')
+
+    def _ids(self, data):
+        return [post['id'] for post in data['results']]
+
+    def test_likes_and_comments_bump_scores(self):
+        post = self.posts[0]
+        self._like(self.fans[0], post)
+        self.client.post('/api/comments/', {'post': post.id, 'content': 'nice'})
+        post.refresh_from_db()
+        self.assertEqual(post.top_score, 3)
+        # Engagement now, in the anchored log2 form.
+        decayed = 2 ** (post.hot_score - half_lives(timezone.now()))
+        self.assertAlmostEqual(decayed, NEW_POST_WEIGHT + 3, places=3)
+
+        self.client.delete(f'/api/posts/{post.id}/like/')
+        post.refresh_from_db()
+        self.assertEqual(post.top_score, 2)
+
+    def test_top_feed_orders_by_score_with_keyset_pages(self):
+        for count, post in zip([1, 3, 2], self.posts[1:4]):
+            for fan in self.fans[:count]:
+                self._like(fan, post)
+        first = self.client.get('/api/posts/', {'sort': 'top', 'page_size': 2}).json()
+        self.assertEqual(self._ids(first), [self.posts[2].id, self.posts[3].id])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self._ids(second), [self.posts[1].id, self.posts[4].id])
+        third = self.client.get(second['next']).json()
+        self.assertEqual(self._ids(third), [self.posts[0].id])
+        self.assertIsNone(third['next'])
+
+    def test_top_window_filters_old_posts(self):
+        old = self.posts[0]
+        Post.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=3))
+        data = self.client.get('/api/posts/', {'sort': 'top', 'window': 'day'}).json()
+        self.assertNotIn(old.id, self._ids(data))
+        self.assertEqual(len(data['results']), 4)
+
+    def test_hot_feed_decays_scores(self):
+        # Three likes two days ago weigh a sixteenth now; new posts outrank them.
+        old = self.posts[1]
+        days_ago = timezone.now() - 4 * HOT_HALF_LIFE
+        for fan in self.fans:
+            self._like(fan, old)
+        Post.objects.filter(pk=old.pk).update(created_at=days_ago)
+        PostLike.objects.filter(post=old).update(created_at=days_ago)
+        recompute_scores([old])
+        self._like(self.fans[0], self.posts[0])
+        data = self.client.get('/api/posts/', {'sort': 'hot'}).json()
+        self.assertEqual(self._ids(data)[0], self.posts[0].id)
+        self.assertEqual(self._ids(data)[-1], old.id)
+
+        old.refresh_from_db()
+        decayed = 2 ** (old.hot_score - half_lives(timezone.now()))
+        self.assertAlmostEqual(decayed, (NEW_POST_WEIGHT + 3) / 16, places=3)
+
+    def test_default_list_is_unpaginated(self):
+        data = self.client.get('/api/posts/').json()
+        self.assertEqual(len(data), 5)
+
+    def test_rejects_unknown_sort_and_bad_cursor(self):
+        self.assertEqual(self.client.get('/api/posts/', {'sort': 'best'}).status_code, 400)
+        response = self.client.get('/api/posts/', {'sort': 'hot', 'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+THROTTLE_RATES = {
+    'like_user': '2/min',
+    'like_ip': '100/min',
+    'unlike_user': '100/min',
+    'create_user': '1/min',
+}
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': THROTTLE_RATES,
+})
+class WriteThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.get_store().clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.posts = [Post.objects.create(author=self.author, content=f'p{i}') for i in range(4)]
+        self.client.force_login(self.fan)
+
+    def test_likes_are_throttled_per_user_before_any_write(self):
+        for post in self.posts[:2]:
+            self.assertEqual(self.client.post(f'/api/posts/{post.id}/like/').status_code, 200)
+        with self.assertNumQueries(2):
+            response = self.client.post(f'/api/posts/{self.posts[2].id}/like/')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(PostLike.objects.count(), 2)
+        # Unlikes have their own bucket.
+        self.assertEqual(self.client.delete(f'/api/posts/{self.posts[0].id}/like/').status_code, 200)
+
+        self.client.force_login(self.author)
+        response = self.client.post('/api/comments/', {'post': self.posts[0].id, 'content': 'hi'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_batch_operations_count_against_scopes(self):
+        response = self.client.post(
+            '/api/batch/',
+            {'operations': [{'op': 'like_post', 'id': post.id} for post in self.posts[:3]]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(PostLike.objects.exists())
+
+    @override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**THROTTLE_RATES, 'like_ip': '1/min'},
+    })
+    def test_rejected_request_is_not_charged(self):
+        url = '/api/posts/{}/like/'
+        self.assertEqual(self.client.post(url.format(self.posts[0].id)).status_code, 200)
+        # The IP bucket is empty; the user's token taken before it is put back.
+        self.assertEqual(self.client.post(url.format(self.posts[1].id)).status_code, 429)
+        response = self.client.post(url.format(self.posts[1].id), REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_sqlite_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'buckets.sqlite3')
+            first, second = throttling.SQLiteBucketStore(path), throttling.SQLiteBucketStore(path)
+            self.assertEqual(first.consume('k', 2, 60), (True, None))
+            self.assertEqual(second.consume('k', 2, 60), (True, None))
+            allowed, wait = first.consume('k', 2, 60)
+            self.assertFalse(allowed)
+            self.assertAlmostEqual(wait, 30, delta=1)
+            second.refund('k', 2, 1)
+            self.assertEqual(first.consume('k', 2, 60), (True, None))
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='hello')
+        root = Comment.objects.create(author=self.author, post=self.post, content='root')
+        Comment.objects.create(author=self.fan, post=self.post, parent=root, content='reply')
+        PostLike.objects.create(user=self.fan, post=self.post)
+        CommentLike.objects.create(user=self.fan, comment=root)
+
+    async def test_async_endpoints_match_sync_ones(self):
+        await self.async_client.aforce_login(self.fan)
+        for sync_url, async_url in (
+            ('/api/posts/', '/api/async/posts/'),
+            (f'/api/posts/{self.post.id}/comments/tree/',
+             f'/api/async/posts/{self.post.id}/comments/tree/'),
+            ('/api/leaderboard/', '/api/async/leaderboard/'),
+        ):
+            expected = (await self.async_client.get(sync_url)).json()
+            response = await self.async_client.get(async_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected)
+        posts = (await self.async_client.get('/api/async/posts/')).json()
+        self.assertTrue(posts[0]['is_liked_by_me'])
+
+    async def test_async_endpoints_reject_bad_tokens_like_sync_ones(self):
+        for sync_url, async_url in (
+            ('/api/posts/', '/api/async/posts/'),
+            (f'/api/posts/{self.post.id}/comments/tree/',
+             f'/api/async/posts/{self.post.id}/comments/tree/'),
+        ):
+            expected = await self.async_client.get(sync_url, headers={'Authorization': 'Token bad'})
+            response = await self.async_client.get(async_url, headers={'Authorization': 'Token bad'})
+            self.assertIn(response.status_code, (401, 403))
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+
+    async def test_async_tree_404s_for_unknown_post(self):
+        response = await self.async_client.get('/api/async/posts/999999/comments/tree/')
+        self.assertEqual(response.status_code, 404)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='pass1234')
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='a quiet harbour at dawn')
+        self.client.force_login(self.admin)
+
+    def _changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_like_changelist_queries_do_not_grow_with_rows(self):
+        url = '/admin/posts/postlike/'
+        PostLike.objects.create(user=self.admin, post=self.post)
+        baseline = len(self._changelist_queries(url))
+        for i in range(5):
+            fan = User.objects.create_user(username=f'fan{i}', password='pass1234')
+            PostLike.objects.create(user=fan, post=self.post)
+        self.assertEqual(len(self._changelist_queries(url)), baseline)
+
+    def test_large_tables_use_an_estimated_count(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        with mock.patch.object(admin_pagination, 'ESTIMATE_THRESHOLD', 0):
+            queries = self._changelist_queries('/admin/karma/karmaevent/')
+        self.assertFalse(any('COUNT(' in sql for sql in queries))
+        # Filtered lists keep their exact count.
+        with mock.patch.object(admin_pagination, 'ESTIMATE_THRESHOLD', 0):
+            queries = self._changelist_queries('/admin/karma/karmaevent/?source_type=post_like')
+        self.assertTrue(any('COUNT(' in sql for sql in queries))
+
+    def test_search_uses_full_text_index_and_exact_usernames(self):
+        Post.objects.create(author=self.admin, content='nothing to see')
+        response = self.client.get('/admin/posts/post/', {'q': 'harbour'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.post])
+        response = self.client.get('/admin/posts/post/', {'q': 'author'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.post])
+        queries = self._changelist_queries('/admin/posts/post/?q=harbour')
+        self.assertFalse(any("LIKE '%" in sql or 'LIKE %' in sql for sql in queries))
+
+
+class DatasetTransferTests(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='a quiet harbour at dawn')
+        self.client.force_login(self.fan)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        root = self.client.post('/api/comments/', {'post': self.post.id, 'content': 'root'}).json()
+        self.client.post(
+            '/api/comments/', {'post': self.post.id, 'content': 'reply', 'parent': root['id']}
+        )
+        self.client.force_login(self.author)
+        self.client.post(f'/api/comments/{root["id"]}/like/')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'dump.ndjson.gz')
+
+    def tearDown(self):
+        hot_posts.sketch = CountMinSketch()
+        like_counter.clear()
+
+    def _points(self):
+        return dict(KarmaTotal.objects.values('user__username').annotate(points=Sum('points'))
+                    .values_list('user__username', 'points'))
+
+    def _interrupt_after(self, chunks):
+        calls = []
+
+        def progress(label, count):
+            calls.append(label)
+            if len(calls) == chunks:
+                raise KeyboardInterrupt
+        return progress
+
+    def test_round_trip_remaps_ids_next_to_existing_rows(self):
+        points = self._points()
+        self.assertEqual(export_dataset(self.path, chunk_size=1), 9)
+        call_command('import_dataset', self.path, chunk_size=2, stdout=StringIO())
+
+        # Same usernames map onto the existing accounts; everything else is copied.
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 2)
+        copy = Post.objects.exclude(pk=self.post.pk).get()
+        self.assertEqual((copy.author, copy.created_at), (self.author, self.post.created_at))
+        reply = Comment.objects.get(post=copy, parent__isnull=False)
+        self.assertEqual(reply.parent.post, copy)
+        self.assertEqual(self._points(), {name: 2 * total for name, total in points.items()})
+        self.assertEqual(Post.objects.filter(content__contains='harbour').count(), 2)
+
+    def test_imported_users_lose_credentials_unless_kept(self):
+        User.objects.create_superuser(username='root', password='pass1234')
+        export_dataset(self.path)
+        User.objects.filter(username='root').delete()
+        import_dataset(self.path)
+        root = User.objects.get(username='root')
+        self.assertFalse(root.has_usable_password())
+        self.assertFalse(root.is_staff or root.is_superuser)
+
+        root.delete()
+        call_command('import_dataset', self.path, keep_credentials=True, stdout=StringIO())
+        root = User.objects.get(username='root')
+        self.assertTrue(root.check_password('pass1234'))
+        self.assertTrue(root.is_superuser)
+
+    def test_interrupted_export_and_import_resume(self):
+        with self.assertRaises(KeyboardInterrupt):
+            export_dataset(self.path, chunk_size=1, progress=self._interrupt_after(3))
+        # Rows added after the export started are left out, even by the resumed run.
+        late = Post.objects.create(author=self.author, content='late')
+        Comment.objects.create(author=self.fan, post=late, content='late reply')
+        self.assertEqual(export_dataset(self.path, chunk_size=1), 6)
+
+        with self.assertRaises(KeyboardInterrupt):
+            import_dataset(self.path, chunk_size=1, progress=self._interrupt_after(4))
+        self.assertEqual(import_dataset(self.path, chunk_size=1), 5)
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertEqual(KarmaEvent.objects.count(), 4)
+        self.assertEqual(self._points(), {'author': 10, 'fan': 2})
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Post._meta.db_table)
+        self.assertIn('post_hot_rank_idx', indexes)
+
+
+class BootCommandTests(TestCase):
+    def test_second_boot_skips_migrate_and_seed(self):
+        call_command('boot', stdout=StringIO())
+        counts = (Post.objects.count(), Comment.objects.count(), KarmaEvent.objects.count())
+        self.assertEqual(counts[0], 5)
+
+        out = StringIO()
+        call_command('boot', stdout=out)
+        self.assertIn('up to date', out.getvalue())
+        self.assertIn('already seeded', out.getvalue())
+        self.assertEqual(
+            (Post.objects.count(), Comment.objects.count(), KarmaEvent.objects.count()), counts
+        )
+
+    def test_moderating_sample_posts_does_not_reseed(self):
+        call_command('boot', stdout=StringIO())
+        Post.objects.all().delete()
+        out = StringIO()
+        call_command('boot', stdout=out)
+        self.assertIn('already seeded', out.getvalue())
+        self.assertFalse(Post.objects.exists())
+
+    def test_unrecorded_migration_is_detected(self):
+        self.assertFalse(has_unapplied_migrations())
+        MigrationRecorder.Migration.objects.filter(app='posts', name='0001_initial').delete()
+        self.assertTrue(has_unapplied_migrations())
+
+
+@skipUnless(settings.SHARD_DATABASES, 'Run with SHARD_COUNT set; see ShardedSuiteTests.')
+class ShardingTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        like_counter.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.fan = User.objects.create_user(username='fan', password='pass1234')
+        self.client.force_login(self.author)
+        self.post_ids = [
+            self.client.post('/api/posts/', {'content': f'p{i}'}).json()['id'] for i in range(4)
+        ]
+
+    def _on_shard(self, model, row_id):
+        return model.objects.using(shard_for(row_id)).filter(pk=row_id).exists()
+
+    def _karma(self):
+        return KarmaTotal.objects.filter(user=self.author).aggregate(total=Sum('points'))['total']
+
+    def test_posts_spread_over_shards_and_merge_in_lists(self):
+        self.assertEqual(
+            {shard_for(post_id) for post_id in self.post_ids}, set(settings.SHARD_DATABASES)
+        )
+        for post_id in self.post_ids:
+            self.assertTrue(self._on_shard(Post, post_id))
+        self.assertFalse(Post.objects.using('default').exists())
+
+        listed = [post['id'] for post in self.client.get('/api/posts/').json()]
+        self.assertEqual(listed, self.post_ids[::-1])
+        detail = self.client.get(f'/api/posts/{self.post_ids[1]}/').json()
+        self.assertEqual(detail['author_username'], 'author')
+
+        feed = self.client.get('/api/feed/').json()
+        self.assertEqual([post['id'] for post in feed['results']], self.post_ids[::-1])
+
+    def test_likes_and_comments_stay_on_the_post_shard(self):
+        post_id = self.post_ids[1]
+        comment_id = self.client.post('/api/comments/', {
+            'post': post_id, 'content': 'mine',
+        }).json()['id']
+        self.client.force_login(self.fan)
+        reply = self.client.post('/api/comments/', {
+            'post': post_id, 'parent': comment_id, 'content': 'reply',
+        })
+        self.assertEqual(reply.status_code, 201)
+        self.assertEqual(self.client.post(f'/api/posts/{post_id}/like/').json()['like_count'], 1)
+        self.client.post(f'/api/comments/{comment_id}/like/')
+
+        for model, row_id in ((Comment, comment_id), (Comment, reply.json()['id'])):
+            self.assertEqual(shard_for(row_id), shard_for(post_id))
+            self.assertTrue(self._on_shard(model, row_id))
+        self.assertTrue(PostLike.objects.using(shard_for(post_id)).filter(post_id=post_id).exists())
+        self.assertEqual(self._karma(), 6)
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 3)
+
+        tree = self.client.get(f'/api/posts/{post_id}/comments/tree/').json()
+        self.assertEqual(tree[0]['replies'][0]['content'], 'reply')
+        self.assertTrue(tree[0]['is_liked_by_me'])
+        comments = self.client.get('/api/comments/', {'post': post_id}).json()
+        self.assertEqual(len(comments), 2)
+
+        self.client.delete(f'/api/posts/{post_id}/like/')
+        self.assertEqual(self._karma(), 1)
+        self.assertFalse(KarmaEvent.objects.filter(source_type='post_like').exists())
+
+    @override_settings(TASKS_EAGER=False)
+    def test_queued_like_writes_only_its_shard(self):
+        post_id = self.post_ids[1]
+        shard = shard_for(post_id)
+        self.client.force_login(self.fan)
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.post(f'/api/posts/{post_id}/like/')
+        self.assertEqual([q['sql'] for q in queries if not q['sql'].startswith('SELECT')], [])
+        self.assertEqual(Task.objects.using(shard).count(), 3)
+        self.assertFalse(Task.objects.exists())
+
+        run_pending()
+        self.assertEqual(self._karma(), 5)
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 1)
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.delete(f'/api/posts/{post_id}/like/')
+        self.assertEqual([q['sql'] for q in queries if not q['sql'].startswith('SELECT')], [])
+        self.assertEqual(self._karma(), 5)
+        run_pending()
+        self.assertEqual(self._karma(), 0)
+        self.assertFalse(KarmaEvent.objects.exists())
+
+    @override_settings(TASKS_EAGER=False)
+    def test_revoke_waits_for_a_pending_award(self):
+        post_id = self.post_ids[2]
+        self.client.force_login(self.fan)
+        self.client.post(f'/api/posts/{post_id}/like/')
+        self.client.delete(f'/api/posts/{post_id}/like/')
+        awards = Task.objects.using(shard_for(post_id)).filter(name='karma.award_post_like')
+        awards.update(run_after=timezone.now() + timedelta(hours=1))
+
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            run_pending()
+        revoke = Task.objects.using(shard_for(post_id)).filter(name='karma.revoke_post_like')
+        self.assertEqual(list(revoke.values_list('status', 'attempts')), [(Task.STATUS_PENDING, 1)])
+        Task.objects.using(shard_for(post_id)).update(run_after=timezone.now())
+        run_pending()
+        self.assertEqual(list(revoke.values_list('status', flat=True)), [Task.STATUS_DONE])
+        self.assertFalse(KarmaEvent.objects.exists())
+
+    def test_ranked_pages_merge_across_shards(self):
+        self.client.force_login(self.fan)
+        for post_id in self.post_ids[:2]:
+            self.client.post(f'/api/posts/{post_id}/like/')
+        first = self.client.get('/api/posts/', {'sort': 'top', 'page_size': 3}).json()
+        second = self.client.get(first['next']).json()
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(ids, [self.post_ids[1], self.post_ids[0], self.post_ids[3], self.post_ids[2]])
+        self.assertIsNone(second['next'])
+
+    def test_reads_merge_state_search_and_karma_across_shards(self):
+        self.client.force_login(self.fan)
+        for post_id in self.post_ids:
+            self.client.post(f'/api/posts/{post_id}/like/')
+
+        state = self.client.get('/api/state/', {'posts': ','.join(map(str, self.post_ids))}).json()
+        self.assertEqual({row['like_count'] for row in state['posts'].values()}, {1})
+        self.assertTrue(all(row['is_liked_by_me'] for row in state['posts'].values()))
+        listed = self.client.get('/api/async/posts/').json()
+        self.assertEqual([post['id'] for post in listed], self.post_ids[::-1])
+
+        hits = self.client.get('/api/search/', {'q': 'p1'}).json()['results']
+        self.assertEqual([hit['id'] for hit in hits], [self.post_ids[1]])
+        profile = self.client.get(f'/api/users/{self.author.id}/karma/').json()
+        self.assertEqual(profile['total_karma'], 20)
+        self.assertEqual(len(profile['top_posts']), 4)
+
+    def test_batch_writes_each_operation_on_its_shard(self):
+        self.client.force_login(self.fan)
+        operations = [{'op': 'like_post', 'id': post_id} for post_id in self.post_ids]
+        operations.append({'op': 'create_comment', 'post': self.post_ids[3], 'content': 'hi'})
+        response = self.client.post(
+            '/api/batch/', {'operations': operations}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        for post_id in self.post_ids:
+            likes = PostLike.objects.using(shard_for(post_id)).filter(post_id=post_id)
+            self.assertEqual(likes.count(), 1)
+        self.assertTrue(Comment.objects.using(shard_for(self.post_ids[3])).exists())
+        self.assertEqual(self._karma(), 20)
+
+        operations = [{'op': 'unlike_post', 'id': post_id} for post_id in self.post_ids]
+        self.client.post('/api/batch/', {'operations': operations}, content_type='application/json')
+        self.assertEqual(self._karma(), 0)
+
+    def test_hide_and_ban_purge_every_shard(self):
+        admin = User.objects.create_user(username='admin', password='pass1234', is_staff=True)
+        self.client.force_login(self.fan)
+        comment_id = self.client.post('/api/comments/', {
+            'post': self.post_ids[0], 'content': 'spam',
+        }).json()['id']
+        self.client.post(f'/api/posts/{self.post_ids[1]}/like/')
+
+        self.client.force_login(admin)
+        response = self.client.post(f'/api/moderation/posts/{self.post_ids[1]}/hide/')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(self._on_shard(Post, self.post_ids[1]))
+        self.assertEqual(self._karma(), 0)
+
+        self.client.post(f'/api/moderation/users/{self.author.id}/ban/')
+        for post_id in self.post_ids:
+            self.assertFalse(self._on_shard(Post, post_id))
+        self.assertFalse(self._on_shard(Comment, comment_id))
+
+    def test_default_only_commands_refuse_to_run(self):
+        commands = [('seed_sample_data',), ('bench_purge',), ('export_dataset', 'out.ndjson')]
+        for args in commands:
+            with self.subTest(command=args[0]), self.assertRaises(CommandError):
+                call_command(*args, stdout=StringIO())
+        self.assertIn('posts.W001', [message.id for message in check_sharding(None)])
+
+
+@skipIf(settings.SHARD_DATABASES, 'Already running sharded.')
+class ShardedSuiteTests(SimpleTestCase):
+    def test_sharding_tests_pass_with_two_shards(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ, 'SHARD_COUNT': '2', 'SHARD_DB_DIR': directory,
+                'DB_PATH': os.path.join(directory, 'default.sqlite3'), 'THROTTLE_STORE_PATH': '',
+            }
+            result = subprocess.run(
+                [sys.executable, 'manage.py', 'test', 'posts.tests.ShardingTests', '--noinput'],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn('skipped', result.stderr)
@@ -0,0 +1,222 @@
+"""
+Token-bucket throttles for like, unlike and create requests.
+
+Each scope has a rate such as '120/min' per user and per client IP. That
+is a bucket of 120 tokens refilled at 2 per second. A request takes one
+token, and a batch takes one per operation. Throttles run in
+APIView.initial(), so a rejected request never reaches the database.
+A rejected request is not charged at all: tokens it already took from
+other scopes, in this throttle or an earlier one, are put back.
+
+Buckets live in a small SQLite file of their own, separate from the main
+database. One UPSERT ... RETURNING statement refills and takes tokens, so
+every gunicorn worker sees the same buckets and the update is atomic
+without a lock round trip. The file is written with synchronous=OFF
+because throttle state does not need to survive a crash.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from observability.metrics import THROTTLED_REQUESTS
+
+# (view action, HTTP method) -> throttle scope.
+WRITE_SCOPES = {
+    ('like', 'POST'): 'like',
+    ('like', 'DELETE'): 'unlike',
+    ('create', 'POST'): 'create',
+}
+
+# Rows idle this long have refilled completely and can be dropped.
+PRUNE_AFTER_SECONDS = 24 * 60 * 60
+PRUNE_EVERY = 1000
+
+
+class MemoryBucketStore:
+    """Per-process buckets, for tests and single-process development."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, period, cost=1):
+        rate = capacity / period
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return True, None
+            self._buckets[key] = (tokens, now)
+        return False, (cost - tokens) / rate
+
+    def refund(self, key, capacity, cost):
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(capacity, tokens + cost), updated)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """Buckets shared by every process that opens the same file."""
+
+    CONSUME_SQL = (
+        'INSERT INTO buckets (key, tokens, updated) VALUES (:key, :capacity - :cost, :now) '
+        'ON CONFLICT (key) DO UPDATE SET '
+        'tokens = min(:capacity, tokens + (:now - updated) * :rate) - :cost, updated = :now '
+        'WHERE min(:capacity, tokens + (:now - updated) * :rate) >= :cost '
+        'RETURNING tokens'
+    )
+    REFUND_SQL = 'UPDATE buckets SET tokens = min(:capacity, tokens + :cost) WHERE key = :key'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        # Connections must not cross a fork, so key them by pid too.
+        if getattr(local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            local.conn, local.pid, local.calls = conn, os.getpid(), 0
+        local.calls += 1
+        if local.calls % PRUNE_EVERY == 0:
+            local.conn.execute(
+                'DELETE FROM buckets WHERE updated < ?', [time.time() - PRUNE_AFTER_SECONDS]
+            )
+        return local.conn
+
+    def consume(self, key, capacity, period, cost=1):
+        rate = capacity / period
+        if cost > capacity:
+            return False, None
+        conn = self._connection()
+        now = time.time()
+        params = {'key': key, 'capacity': capacity, 'cost': cost, 'now': now, 'rate': rate}
+        if conn.execute(self.CONSUME_SQL, params).fetchone() is not None:
+            return True, None
+        row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', [key]).fetchone()
+        tokens = min(capacity, row[0] + (now - row[1]) * rate) if row else 0
+        return False, max(cost - tokens, 0) / rate
+
+    def refund(self, key, capacity, cost):
+        params = {'key': key, 'capacity': capacity, 'cost': cost}
+        self._connection().execute(self.REFUND_SQL, params)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM buckets')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = settings.THROTTLE_STORE_PATH
+                # Test databases live in memory; keep their buckets in memory
+                # too so test runs never share state through the file.
+                if not path or connections['default'].is_in_memory_db():
+                    _store = MemoryBucketStore()
+                else:
+                    _store = SQLiteBucketStore(path)
+    return _store
+
+
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting == 'THROTTLE_STORE_PATH':
+        _store = None
+
+
+setting_changed.connect(_reset_store)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Throttles the write scopes in WRITE_SCOPES. Rates come from
+    DEFAULT_THROTTLE_RATES as '<scope>_<kind>'; a missing rate means
+    unlimited. Views can define `get_throttle_costs(request)` returning
+    `{scope: tokens}` to charge one request against several scopes.
+    """
+    kind = None
+
+    def __init__(self):
+        self._wait = None
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def get_costs(self, request, view):
+        if hasattr(view, 'get_throttle_costs'):
+            return view.get_throttle_costs(request)
+        scope = WRITE_SCOPES.get((getattr(view, 'action', None), request.method))
+        return {scope: 1} if scope else {}
+
+    def allow_request(self, request, view):
+        self._wait = None
+        # What the request was charged so far, shared by the throttle
+        # classes; None once one of them has rejected it.
+        charges = getattr(request, '_throttle_charges', [])
+        if charges is None:
+            return True
+        request._throttle_charges = charges
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        store = get_store()
+        for scope, cost in self.get_costs(request, view).items():
+            rate = rates.get(f'{scope}_{self.kind}')
+            if not rate or not cost:
+                continue
+            capacity, period = self.parse_rate(rate)
+            key = f'throttle:{scope}_{self.kind}:{ident}'
+            allowed, wait = store.consume(key, capacity, period, cost)
+            if not allowed:
+                for charged in charges:
+                    store.refund(*charged)
+                request._throttle_charges = None
+                THROTTLED_REQUESTS.inc(scope=scope, kind=self.kind)
+                self._wait = wait
+                return False
+            charges.append((key, capacity, cost))
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class UserWriteThrottle(TokenBucketThrottle):
+    kind = 'user'
+
+    def get_ident_key(self, request):
+        return request.user.pk if request.user and request.user.is_authenticated else None
+
+
+class IPWriteThrottle(TokenBucketThrottle):
+    kind = 'ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
@@ -1,8 +1,19 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .views import PostViewSet
+from . import async_views
+from .views import BatchView, ItemStateView, PostViewSet
 
 router = DefaultRouter()
 router.register('posts', PostViewSet, basename='post')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('state/', ItemStateView.as_view(), name='item-state'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('async/posts/', async_views.post_list, name='async-post-list'),
+    path(
+        'async/posts/<int:pk>/comments/tree/',
+        async_views.comment_tree,
+        name='async-comment-tree',
+    ),
+] + router.urls
@@ -1,18 +1,97 @@
-from django.db import IntegrityError, transaction
-from django.db.models import Count, Exists, OuterRef, Value, BooleanField
+from django.db import IntegrityError
+from django.db.models import Exists, OuterRef, Value, BooleanField
 from rest_framework.decorators import action
 from rest_framework import mixins, permissions, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.views import APIView
 
 from comments.models import Comment, CommentLike
 from comments.serializers import CommentTreeSerializer
 from comments.utils import build_comment_tree
-from karma.models import KarmaEvent, SOURCE_POST_LIKE
+from feed.tasks import fan_out
+from karma.tasks import award_post_like, revoke_post_like
+from notifications.tasks import notify_post_like
+from observability.metrics import COMMENT_TREE_NODES, LIKE_RACES, LIKE_WRITES
+from .batch import MAX_ROW_ID, BatchSerializer, apply_batch, throttle_costs
+from .hotness import cached_comment_tree, cached_post_detail, hot_posts, like_counter
 from .models import Post, PostLike
+from .pagination import ScoreKeysetPagination
+from .ranking import SORT_FIELDS, TOP_WINDOWS, window_start
+from .responses import LISTS, cached_response, invalidate_responses, post_scope
 from .serializers import PostSerializer
+from .sharding import atomic, gather, is_sharded, shard_for, with_users
+from .tasks import bump_post_scores
+from .state import invalidate_post_state, item_state, liked_comment_ids, liked_post_ids
 
-POST_LIKE_KARMA_POINTS = 5
+STATE_MAX_IDS = 200
+# The query parameters the post list reads; the response cache keys on these alone.
+LIST_PARAMS = ('sort', 'window', 'cursor', 'page_size')
+
+
+def post_queryset(user):
+    """Posts with the counts and per-user flag PostSerializer expects."""
+    queryset = (
+        with_users(Post.objects.visible(), 'author')
+        .with_like_count()
+        .with_comment_count()
+        .order_by('-created_at', '-id')
+    )
+    if user.is_authenticated:
+        user_liked_subquery = PostLike.objects.filter(
+            user=user,
+            post_id=OuterRef('pk'),
+        )
+        return queryset.annotate(is_liked_by_me=Exists(user_liked_subquery))
+    return queryset.annotate(is_liked_by_me=Value(False, output_field=BooleanField()))
+
+
+def comment_tree_queryset(post_id, user):
+    """A post's comments, flat and oldest first, ready for build_comment_tree."""
+    queryset = (
+        with_users(Comment.objects.using(shard_for(post_id)), 'author')
+        .filter(post_id=post_id, hidden_at__isnull=True)
+        .select_related('parent')
+        .with_like_count()
+        .order_by('created_at')
+    )
+    if user.is_authenticated:
+        user_liked_subquery = CommentLike.objects.filter(
+            user=user,
+            comment_id=OuterRef('pk'),
+        )
+        return queryset.annotate(is_liked_by_me=Exists(user_liked_subquery))
+    return queryset.annotate(is_liked_by_me=Value(False, output_field=BooleanField()))
+
+
+def serialize_comment_tree(request, comments):
+    COMMENT_TREE_NODES.observe(len(comments))
+    roots = build_comment_tree(comments)
+    return CommentTreeSerializer(roots, many=True, context={'request': request}).data
+
+
+def personalize_posts(posts, user):
+    """Set `user`'s is_liked_by_me on serialized posts taken from the response cache."""
+    liked = liked_post_ids(user, [post['id'] for post in posts])
+    for post in posts:
+        post['is_liked_by_me'] = post['id'] in liked
+
+
+def personalize_post_list(data, user):
+    # Ranked lists are pages ({"next", "results"}); the newest-first list is bare.
+    personalize_posts(data['results'] if isinstance(data, dict) else data, user)
+
+
+def personalize_comment_tree(roots, user):
+    def walk(nodes):
+        for node in nodes:
+            yield node
+            yield from walk(node['replies'])
+
+    liked = liked_comment_ids(user, [node['id'] for node in walk(roots)])
+    for node in walk(roots):
+        node['is_liked_by_me'] = node['id'] in liked
 
 
 class PostViewSet(
@@ -21,70 +100,123 @@ class PostViewSet(
     mixins.CreateModelMixin,
     viewsets.GenericViewSet,
 ):
+    """
+    The list takes ?sort=new|hot|top (default new). The hot and top feeds
+    are keyset-paginated on the precomputed scores; top also takes
+    ?window=day|week|month|year|all (default all).
+    """
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    @property
+    def sort(self):
+        sort = self.request.query_params.get('sort', 'new')
+        if sort != 'new' and sort not in SORT_FIELDS:
+            raise ValidationError({'sort': 'Expected one of new, hot, top.'})
+        return sort
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            ranked = self.action == 'list' and self.sort in SORT_FIELDS
+            self._paginator = ScoreKeysetPagination(SORT_FIELDS[self.sort]) if ranked else None
+        return self._paginator
+
     def get_queryset(self):
-        queryset = (
-            Post.objects
-            .select_related('author')
-            .annotate(like_count=Count('likes', distinct=True))
-            .annotate(comment_count=Count('comments', distinct=True))
-            .order_by('-created_at')
-        )
-        if self.request.user.is_authenticated:
-            user_liked_subquery = PostLike.objects.filter(
-                user=self.request.user,
-                post_id=OuterRef('pk'),
-            )
-            queryset = queryset.annotate(is_liked_by_me=Exists(user_liked_subquery))
-        else:
-            queryset = queryset.annotate(is_liked_by_me=Value(False, output_field=BooleanField()))
+        queryset = post_queryset(self.request.user)
+        pk = self.kwargs.get(self.lookup_field)
+        if pk is not None and str(pk).isdigit():
+            queryset = queryset.using(shard_for(pk))
+        if self.action == 'list' and self.sort == 'top':
+            window = self.request.query_params.get('window', 'all')
+            if window not in TOP_WINDOWS:
+                raise ValidationError({'window': 'Expected one of day, week, month, year, all.'})
+            since = window_start(window)
+            if since is not None:
+                queryset = queryset.filter(created_at__gte=since)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            request, LISTS, self._list_data,
+            personalize=personalize_post_list, params=LIST_PARAMS,
+        )
+
+    def _list_data(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is None:
+            # Sharded, the newest posts are merged from every shard.
+            return self.get_serializer(gather(queryset), many=True).data
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data).data
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        fan_out.enqueue(post_id=post.id, key=f'fanout:{post.id}', using=post._state.db)
+        invalidate_responses()
+
+    def retrieve(self, request, *args, **kwargs):
+        post_id = kwargs[self.lookup_field]
+        if not post_id.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+
+        def build():
+            return self.get_serializer(self.get_object()).data
+
+        if hot_posts.record(post_id):
+            return Response(cached_post_detail(post_id, request, build))
+        return cached_response(
+            request, post_scope(post_id), build,
+            personalize=lambda data, user: personalize_posts([data], user),
+        )
 
     @action(detail=True, methods=['get'], url_path='comments/tree')
     def comments_tree(self, request, pk=None):
-        post = self.get_object()
-        comments_queryset = (
-            Comment.objects
-            .filter(post=post)
-            .select_related('author', 'parent')
-            .annotate(like_count=Count('likes', distinct=True))
-            .order_by('created_at')
-        )
-        if request.user.is_authenticated:
-            user_liked_subquery = CommentLike.objects.filter(
-                user=request.user,
-                comment_id=OuterRef('pk'),
-            )
-            comments_queryset = comments_queryset.annotate(is_liked_by_me=Exists(user_liked_subquery))
-        else:
-            comments_queryset = comments_queryset.annotate(
-                is_liked_by_me=Value(False, output_field=BooleanField())
-            )
-        comments = list(comments_queryset)
-        roots = build_comment_tree(comments)
-        serializer = CommentTreeSerializer(roots, many=True, context={'request': request})
-        return Response(serializer.data)
+        def build():
+            return self._comment_tree(request, self.get_object())
+
+        if not pk.isdigit():
+            return Response(build())
+        if hot_posts.record(pk):
+            return Response(cached_comment_tree(pk, request, build))
+        return cached_response(request, post_scope(pk), build, personalize=personalize_comment_tree)
+
+    def _comment_tree(self, request, post):
+        return serialize_comment_tree(request, list(comment_tree_queryset(post.pk, request.user)))
 
     @action(detail=True, methods=['post', 'delete'], url_path='like')
     def like(self, request, pk=None):
         post = self.get_object()
+        hot = hot_posts.record(post.pk)
+        shard = shard_for(post.pk)
+        likes = PostLike.objects.using(shard)
 
         if request.method == 'DELETE':
-            with transaction.atomic():
-                post_like = PostLike.objects.filter(
-                    user=request.user, post=post
-                ).first()
+            with atomic(shard):
+                post_like = likes.filter(user=request.user, post=post).first()
                 if post_like:
+                    # An award still queued finds the like gone and does nothing.
+                    # Unsharded, the like's cascade takes back its karma; sharded,
+                    # the events are in `default`, which a task on the shard revokes.
+                    if is_sharded():
+                        revoke_post_like.enqueue(
+                            like_id=post_like.id, post_id=post.id,
+                            key=f'karma:post_unlike:{post_like.id}', using=shard,
+                        )
+                    bump_post_scores.enqueue(
+                        post_id=post.id, likes=-1, key=f'score:post_unlike:{post_like.id}',
+                        using=shard,
+                    )
                     post_like.delete()
                     deleted = True
                 else:
                     deleted = False
-            like_count = PostLike.objects.filter(post=post).count()
+            if deleted:
+                LIKE_WRITES.inc(target='post', op='unlike')
+                like_counter.adjust(post.id, -1)
+                invalidate_post_state(post.id)
+                invalidate_responses([post.id])
+            like_count = like_counter.get(post.id) if hot else likes.filter(post=post).count()
             return Response({
                 'liked': False,
                 'deleted': deleted,
@@ -99,25 +231,83 @@ class PostViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
         try:
-            with transaction.atomic():
-                post_like, created = PostLike.objects.get_or_create(
-                    user=request.user, post=post
-                )
+            with atomic(shard):
+                post_like, created = likes.get_or_create(user=request.user, post=post)
                 if created:
-                    KarmaEvent.objects.create(
-                        recipient=post.author,
-                        actor=request.user,
-                        source_type=SOURCE_POST_LIKE,
-                        points=POST_LIKE_KARMA_POINTS,
-                        source_post_like=post_like,
+                    # Karma and ranking follow from the queue on the like's shard,
+                    # committed with the like.
+                    award_post_like.enqueue(
+                        like_id=post_like.id, key=f'karma:post_like:{post_like.id}', using=shard
+                    )
+                    bump_post_scores.enqueue(
+                        post_id=post.id, likes=1, key=f'score:post_like:{post_like.id}',
+                        using=shard,
+                    )
+                    notify_post_like.enqueue(
+                        like_id=post_like.id, key=f'notify:post_like:{post_like.id}', using=shard
                     )
         except IntegrityError:
             created = False
+            LIKE_RACES.inc(target='post')
+        if created:
+            LIKE_WRITES.inc(target='post', op='like')
+            like_counter.adjust(post.id, 1)
+            invalidate_post_state(post.id)
+            invalidate_responses([post.id])
 
-        like_count = PostLike.objects.filter(post=post).count()
+        like_count = like_counter.get(post.id) if hot else likes.filter(post=post).count()
         return Response({
             'liked': True,
             'created': created,
             'post_id': post.id,
             'like_count': like_count,
         })
+
+
+class ItemStateView(APIView):
+    """
+    GET /api/state/?posts=1,2&comments=3,4 returns like_count,
+    comment_count/reply_count and is_liked_by_me for every listed item
+    in a constant number of queries. Unknown ids are left out.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        post_ids = self._parse_ids(request, 'posts')
+        comment_ids = self._parse_ids(request, 'comments')
+        return Response(item_state(request.user, post_ids, comment_ids))
+
+    def _parse_ids(self, request, name):
+        raw = request.query_params.get(name, '')
+        try:
+            ids = list(dict.fromkeys(int(value) for value in raw.split(',') if value))
+        except ValueError:
+            raise ValidationError({name: 'Expected a comma-separated list of ids.'})
+        if any(not 1 <= value <= MAX_ROW_ID for value in ids):
+            raise ValidationError({name: f'Ids must be between 1 and {MAX_ROW_ID}.'})
+        if len(ids) > STATE_MAX_IDS:
+            raise ValidationError({name: f'At most {STATE_MAX_IDS} ids per request.'})
+        return ids
+
+
+class BatchView(APIView):
+    """
+    POST /api/batch/ with {"operations": [...]} applies many likes, unlikes
+    and comments in one transaction. Each operation is one of
+    {"op": "like_post"|"unlike_post"|"like_comment"|"unlike_comment", "id": ...}
+    or {"op": "create_comment", "post": ..., "parent": ..., "content": ...}.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_throttle_costs(self, request):
+        # Each operation counts against its own scope, so batching is not a
+        # way around the like and comment limits.
+        return throttle_costs(request.data)
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results, errors = apply_batch(request.user, serializer.validated_data['operations'])
+        if errors is not None:
+            return Response({'operations': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results})
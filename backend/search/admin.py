@@ -0,0 +1,19 @@
+from .backends import filter_matches, query_terms
+
+
+class FullTextSearchMixin:
+    """
+    ModelAdmin mixin whose search box also matches `content` through the
+    full-text index, instead of a `LIKE '%term%'` scan of the whole table.
+    `search_fields` should list only indexed exact lookups; a row matches if
+    either those or the content do.
+    """
+    search_target = None
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        if query_terms(search_term):
+            results |= filter_matches(queryset, self.search_target, search_term)
+        return results, may_have_duplicates
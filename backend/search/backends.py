@@ -0,0 +1,174 @@
+"""
+Ranked full-text search over posts and comments.
+
+Queries go straight to the index created by migration 0001: FTS5 on
+SQLite, a GIN tsvector index on PostgreSQL. A backend returns one ranked
+page of `(id, snippet, rank)`; `search()` then loads those rows with one
+ORM query and escapes the snippets, wrapping matches in <mark>.
+
+Sharded, every shard indexes its own rows. `search()` asks each shard for
+the first `offset + limit` hits and merges them by rank; ranks are scored
+against each shard's own statistics, which is close enough for ordering.
+"""
+import html
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+
+from comments.models import Comment
+from posts.models import Post
+from posts.sharding import all_shards, in_bulk, is_sharded, with_users
+
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+
+TARGETS = {
+    'posts': (Post, 'search_post_fts'),
+    'comments': (Comment, 'search_comment_fts'),
+}
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _visible_sql(target, alias):
+    """
+    `(joins, condition)` limiting rows of `target`, selected as `alias`, to
+    what readers may see, so hidden rows never take a place on a page.
+    """
+    if target == 'posts':
+        return '', f'{alias}.hidden_at IS NULL'
+    posts = Post._meta.db_table
+    return (
+        f'JOIN {posts} vp ON vp.id = {alias}.post_id',
+        f'{alias}.hidden_at IS NULL AND vp.hidden_at IS NULL',
+    )
+
+
+def query_terms(query):
+    return _TERM_RE.findall(query.lower())
+
+
+def highlight(snippet):
+    """Escape the snippet, then turn the match markers into <mark> tags."""
+    return (
+        html.escape(snippet)
+        .replace(SNIPPET_START, '<mark>')
+        .replace(SNIPPET_END, '</mark>')
+    )
+
+
+class SQLiteSearchBackend:
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def match_expression(self, terms):
+        # Quote every term so user input can never be read as FTS5 syntax;
+        # the last one is a prefix match for search-as-you-type.
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, target, terms, limit, offset):
+        model, fts = TARGETS[target]
+        joins, visible = _visible_sql(target, 't')
+        sql = (
+            f"SELECT {fts}.rowid, snippet({fts}, 0, %s, %s, '…', 16), {fts}.rank "
+            f'FROM {fts} JOIN {model._meta.db_table} t ON t.id = {fts}.rowid {joins} '
+            f'WHERE {fts} MATCH %s AND {visible} '
+            f'ORDER BY {fts}.rank LIMIT %s OFFSET %s'
+        )
+        params = [SNIPPET_START, SNIPPET_END, self.match_expression(terms), limit, offset]
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            # bm25 is lower-is-better; flip it so a higher rank is more relevant.
+            return [(row_id, snippet, -rank) for row_id, snippet, rank in cursor.fetchall()]
+
+    def matching_ids(self, target, terms):
+        _, fts = TARGETS[target]
+        return RawSQL(
+            f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [self.match_expression(terms)]
+        )
+
+
+class PostgresSearchBackend:
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def match_expression(self, terms):
+        return ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+
+    def search(self, target, terms, limit, offset):
+        model, _ = TARGETS[target]
+        table = model._meta.db_table
+        joins, visible = _visible_sql(target, 't')
+        sql = (
+            f'SELECT t.id, ts_headline(%s, t.content, q.query, %s), '
+            f"ts_rank(to_tsvector('english', t.content), q.query) AS rank "
+            f"FROM {table} t {joins} CROSS JOIN to_tsquery('english', %s) AS q(query) "
+            f"WHERE to_tsvector('english', t.content) @@ q.query AND {visible} "
+            f'ORDER BY rank DESC, t.id DESC LIMIT %s OFFSET %s'
+        )
+        options = f'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxFragments=2'
+        params = ['english', options, self.match_expression(terms), limit, offset]
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def matching_ids(self, target, terms):
+        model, _ = TARGETS[target]
+        return RawSQL(
+            f'SELECT id FROM {model._meta.db_table} '
+            f"WHERE to_tsvector('english', content) @@ to_tsquery('english', %s)",
+            [self.match_expression(terms)],
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    vendor = connections[using].vendor
+    backend = BACKENDS.get(vendor)
+    if backend is None:
+        raise NotImplementedError(f'Full-text search is not available on {vendor}.')
+    return backend(using)
+
+
+def search(target, query, limit, offset):
+    """
+    One page of ranked matches for `query` as `(objects, snippets, ranks)`;
+    fetches `limit` rows so callers can ask for one extra to detect a next page.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], {}, {}
+    if is_sharded():
+        hits = []
+        for alias in all_shards():
+            hits.extend(get_backend(alias).search(target, terms, offset + limit, 0))
+        hits.sort(key=lambda hit: (-hit[2], -hit[0]))
+        hits = hits[offset:offset + limit]
+    else:
+        hits = get_backend().search(target, terms, limit, offset)
+    model, _ = TARGETS[target]
+    # The hits already give the order; skip the model's default sort.
+    objects = in_bulk(
+        with_users(model.objects.visible(), 'author').order_by(),
+        [row_id for row_id, _, _ in hits],
+    )
+    ordered = [objects[row_id] for row_id, _, _ in hits if row_id in objects]
+    snippets = {row_id: highlight(snippet) for row_id, snippet, _ in hits}
+    ranks = {row_id: rank for row_id, _, rank in hits}
+    return ordered, snippets, ranks
+
+
+def filter_matches(queryset, target, query):
+    """Narrow `queryset` to rows whose content matches `query`, unranked."""
+    terms = query_terms(query)
+    if not terms:
+        return queryset
+    return queryset.filter(pk__in=get_backend(queryset.db).matching_ids(target, terms))
@@ -0,0 +1,79 @@
+# Full-text index over Post.content and Comment.content.
+#
+# SQLite: external-content FTS5 tables kept in sync by triggers.
+# PostgreSQL: GIN indexes on to_tsvector('english', content), which the
+# database maintains on every write.
+from django.db import migrations
+
+SOURCES = [
+    ('search_post_fts', 'posts_post'),
+    ('search_comment_fts', 'comments_comment'),
+]
+
+
+def sqlite_forward(fts, table):
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5("
+        f"content, content='{table}', content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF content ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def sqlite_backward(fts, table):
+    return [
+        f'DROP TRIGGER IF EXISTS {fts}_ai',
+        f'DROP TRIGGER IF EXISTS {fts}_ad',
+        f'DROP TRIGGER IF EXISTS {fts}_au',
+        f'DROP TABLE IF EXISTS {fts}',
+    ]
+
+
+def postgres_forward(fts, table):
+    return [
+        f"CREATE INDEX {fts}_tsv ON {table} USING GIN (to_tsvector('english', content))",
+    ]
+
+
+def postgres_backward(fts, table):
+    return [f'DROP INDEX IF EXISTS {fts}_tsv']
+
+
+STATEMENTS = {
+    'sqlite': (sqlite_forward, sqlite_backward),
+    'postgresql': (postgres_forward, postgres_backward),
+}
+
+
+def create_index(apps, schema_editor):
+    builders = STATEMENTS.get(schema_editor.connection.vendor)
+    if builders:
+        for fts, table in SOURCES:
+            for sql in builders[0](fts, table):
+                schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    builders = STATEMENTS.get(schema_editor.connection.vendor)
+    if builders:
+        for fts, table in SOURCES:
+            for sql in builders[1](fts, table):
+                schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0001_initial'),
+        ('comments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,39 @@
+from rest_framework import serializers
+
+from comments.models import Comment
+from observability.timing import TimedSerializerMixin
+from posts.models import Post
+
+
+class SearchHitMixin(TimedSerializerMixin, serializers.Serializer):
+    author_username = serializers.CharField(source='author.username', read_only=True)
+    highlight = serializers.SerializerMethodField()
+    rank = serializers.SerializerMethodField()
+
+    def get_highlight(self, obj):
+        return self.context['snippets'].get(obj.id, '')
+
+    def get_rank(self, obj):
+        return round(self.context['ranks'].get(obj.id, 0.0), 6)
+
+
+class PostSearchResultSerializer(SearchHitMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Post
+        fields = ['id', 'author', 'author_username', 'content', 'highlight', 'rank', 'created_at']
+
+
+class CommentSearchResultSerializer(SearchHitMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Comment
+        fields = [
+            'id',
+            'author',
+            'author_username',
+            'post',
+            'parent',
+            'content',
+            'highlight',
+            'rank',
+            'created_at',
+        ]
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from comments.models import Comment
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SearchApiTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass1234')
+        self.post = Post.objects.create(
+            author=self.alice, content='Shipping a Django <b>feature</b> today'
+        )
+        Post.objects.create(author=self.alice, content='Weekend hiking photos')
+        Post.objects.create(author=self.alice, content='Django Django Django release notes')
+        self.comment = Comment.objects.create(
+            author=self.alice, post=self.post, content='Which Django version?'
+        )
+
+    def _search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ranks_matches_and_escapes_highlights(self):
+        data = self._search(q='django')
+        contents = [row['content'] for row in data['results']]
+        self.assertEqual(contents, ['Django Django Django release notes', self.post.content])
+        hit = data['results'][1]
+        self.assertIn('<mark>Django</mark>', hit['highlight'])
+        self.assertIn('&lt;b&gt;', hit['highlight'])
+        self.assertEqual(hit['author_username'], 'alice')
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        self.assertEqual(self._search(q='kayak')['results'], [])
+        post = Post.objects.create(author=self.alice, content='New kayak')
+        self.assertEqual(len(self._search(q='kayak')['results']), 1)
+        Post.objects.filter(pk=post.pk).update(content='New canoe')
+        self.assertEqual(self._search(q='kayak')['results'], [])
+        post.delete()
+        self.assertEqual(self._search(q='canoe')['results'], [])
+
+    def test_searches_comments_with_prefix_and_pagination(self):
+        data = self._search(q='vers', type='comments')
+        self.assertEqual([row['id'] for row in data['results']], [self.comment.id])
+        self.assertEqual(data['results'][0]['post'], self.post.id)
+
+        first = self._search(q='django', page_size=1)
+        self.assertEqual(first['next'], 2)
+        second = self._search(q='django', page_size=1, page=2)
+        self.assertIsNone(second['next'])
+        self.assertNotEqual(first['results'][0]['id'], second['results'][0]['id'])
+
+    def test_fts_syntax_in_query_is_treated_as_text(self):
+        self.assertEqual(len(self._search(q='"django* (')['results']), 2)
+        self.assertEqual(self._search(q='***')['results'], [])
+
+    def test_hidden_rows_do_not_shorten_pages(self):
+        Post.objects.filter(content__startswith='Django Django').update(hidden_at=timezone.now())
+        first = self._search(q='django', page_size=1)
+        self.assertEqual([row['id'] for row in first['results']], [self.post.id])
+        self.assertIsNone(first['next'])
+
+        Post.objects.filter(pk=self.post.pk).update(hidden_at=timezone.now())
+        self.assertEqual(self._search(q='vers', type='comments')['results'], [])
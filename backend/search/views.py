@@ -0,0 +1,56 @@
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .backends import TARGETS, search
+from .serializers import CommentSearchResultSerializer, PostSearchResultSerializer
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+RESULT_SERIALIZERS = {
+    'posts': PostSearchResultSerializer,
+    'comments': CommentSearchResultSerializer,
+}
+
+
+class SearchView(APIView):
+    """
+    GET /api/search/?q=django+react&type=posts|comments&page=1&page_size=20
+
+    Results are ordered by relevance. Pages are fetched with one extra row
+    to decide `next`, so no COUNT over the whole match set is needed.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        target = request.query_params.get('type', 'posts')
+        if target not in TARGETS:
+            raise ValidationError({'type': f'Expected one of: {", ".join(TARGETS)}.'})
+        page = self._positive_int(request, 'page', 1)
+        page_size = min(self._positive_int(request, 'page_size', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+
+        objects, snippets, ranks = search(target, query, page_size + 1, (page - 1) * page_size)
+        serializer = RESULT_SERIALIZERS[target](
+            objects[:page_size],
+            many=True,
+            context={'request': request, 'snippets': snippets, 'ranks': ranks},
+        )
+        return Response({
+            'query': query,
+            'type': target,
+            'page': page,
+            'next': page + 1 if len(objects) > page_size else None,
+            'results': serializer.data,
+        })
+
+    def _positive_int(self, request, name, default):
+        try:
+            value = int(request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: 'Expected a positive integer.'})
+        if value < 1:
+            raise ValidationError({name: 'Expected a positive integer.'})
+        return value
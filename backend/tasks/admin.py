@@ -0,0 +1,22 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from posts.admin_pagination import EstimatedCountPaginator
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['idempotency_key__exact']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['retry_tasks']
+
+    @admin.action(description='Retry selected tasks now')
+    def retry_tasks(self, request, queryset):
+        queryset.exclude(status=Task.STATUS_RUNNING).update(
+            status=Task.STATUS_PENDING, attempts=0, run_after=timezone.now(), finished_at=None
+        )
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TasksConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tasks'
+    verbose_name = 'Tasks'
+
+    def ready(self):
+        # Each app registers its task functions in <app>/tasks.py.
+        autodiscover_modules('tasks')
@@ -0,0 +1,87 @@
+"""
+Worker for the background task queue (tasks.queue).
+Run: python manage.py run_tasks              (poll forever)
+     python manage.py run_tasks --processes 4
+     python manage.py run_tasks --once       (drain due tasks and exit)
+"""
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tasks.queue import prune_finished, run_next, run_pending
+
+PRUNE_INTERVAL = 300
+
+
+def work(poll_interval):
+    last_prune = 0.0
+    while True:
+        if time.monotonic() - last_prune > PRUNE_INTERVAL:
+            prune_finished()
+            last_prune = time.monotonic()
+        if not run_next():
+            time.sleep(poll_interval)
+
+
+def _run_process(poll_interval):
+    try:
+        work(poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run every task that is currently due, then exit.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Worker processes claiming tasks concurrently.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Seconds to sleep when the queue is empty (default TASKS_POLL_INTERVAL).",
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            count = run_pending()
+            self.stdout.write(f"Ran {count} tasks")
+            return
+
+        poll_interval = options["poll_interval"]
+        if poll_interval is None:
+            poll_interval = settings.TASKS_POLL_INTERVAL
+        processes = max(options["processes"], 1)
+        self.stdout.write(f"Running tasks with {processes} worker process(es)")
+        if processes == 1:
+            _run_process(poll_interval)
+            return
+
+        # Children must not inherit the parent's open SQLite handle.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=_run_process, args=(poll_interval,))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,239 @@
+"""
+A small durable task queue stored in the main database.
+
+Functions decorated with `@task(name)` are registered by name; calling
+`.enqueue(**kwargs)` inserts a Task row in the caller's transaction, so the
+work is only scheduled if the write that caused it commits (and is never
+lost when it does). Workers (`manage.py run_tasks`) claim due rows with a
+conditional UPDATE and a lease, then run the function and mark the row done
+in one transaction. Failures are retried with exponential backoff until
+`max_attempts`; a worker that dies mid-task leaves its lease to expire and
+another worker picks the row up again.
+
+Long jobs can opt out of the wrapping transaction with `atomic=False` and
+commit their own short transactions; they must then be safe to re-run
+after a partial run.
+
+With sharding on (posts.sharding), a write to a shard enqueues its
+follow-up work on that shard (`enqueue(using=...)`), so the request never
+takes `default`'s write lock; every shard has a Task table of its own and
+workers claim from all of them. Such a task runs in a transaction on its
+shard wrapped around one on `default`: its shard writes commit together
+with the row being marked done, and its `default` writes commit just
+before, so a crash in between only runs it again.
+
+With TASKS_EAGER (the default) `enqueue` runs the function inline instead,
+which keeps single-process development and the test suite synchronous.
+"""
+import logging
+import traceback
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from observability.metrics import TASKS_RUN
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = timedelta(seconds=2)
+RETRY_MAX_DELAY = timedelta(minutes=10)
+
+registry = {}
+
+
+class LeaseLost(Exception):
+    """The task's lease expired and another worker claimed it."""
+
+
+class TaskDefinition:
+    def __init__(self, name, func, max_attempts=None, atomic=True):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.atomic = atomic
+        self.__doc__ = func.__doc__
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, *, key=None, delay=None, using=DEFAULT_DB_ALIAS, **kwargs):
+        """
+        Schedule the task with JSON-serialisable keyword arguments. A `key`
+        makes the call idempotent: a second enqueue with the same key is a
+        no-op while the first row is kept. `using` is the database the Task
+        row goes to, which should be the one the caller's transaction writes.
+        """
+        if settings.TASKS_EAGER:
+            if self.atomic:
+                self.func(**kwargs)
+            else:
+                # It commits as it goes, so keep it out of the caller's transaction.
+                transaction.on_commit(lambda: self.func(**kwargs))
+            return
+        Task.objects.using(using).bulk_create(
+            [
+                Task(
+                    name=self.name,
+                    payload=kwargs,
+                    idempotency_key=key,
+                    max_attempts=self.max_attempts or settings.TASKS_MAX_ATTEMPTS,
+                    run_after=timezone.now() + (delay or timedelta()),
+                )
+            ],
+            ignore_conflicts=key is not None,
+        )
+
+
+def task(name, max_attempts=None, atomic=True):
+    """Register the decorated function as the task `name`."""
+    def decorator(func):
+        if name in registry:
+            raise ValueError(f'Task {name!r} is already registered.')
+        registry[name] = TaskDefinition(name, func, max_attempts, atomic)
+        return registry[name]
+    return decorator
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def queue_databases():
+    """Every database with a Task table that workers claim from."""
+    return [DEFAULT_DB_ALIAS, *settings.SHARD_DATABASES]
+
+
+def _due(now):
+    return (
+        Q(status=Task.STATUS_PENDING, run_after__lte=now)
+        | Q(status=Task.STATUS_RUNNING, locked_until__lt=now)
+    )
+
+
+def claim_next():
+    """Lease the oldest due task (on any queue database) to this worker, or return None."""
+    while True:
+        now = timezone.now()
+        due = []
+        for alias in queue_databases():
+            head = (
+                Task.objects.using(alias).filter(_due(now)).order_by('run_after', 'id')
+                .values_list('run_after', 'id').first()
+            )
+            if head is not None:
+                due.append((*head, alias))
+        if not due:
+            return None
+        _, task_id, alias = min(due)
+        tasks = Task.objects.using(alias)
+        lease = timedelta(seconds=settings.TASKS_LEASE_SECONDS)
+        claimed = tasks.filter(_due(now), pk=task_id).update(
+            status=Task.STATUS_RUNNING,
+            locked_until=now + lease,
+            attempts=F('attempts') + 1,
+        )
+        # Another worker got there first; look again.
+        if claimed:
+            return tasks.get(pk=task_id)
+
+
+def _finish(task, **fields):
+    # Only the worker holding the current lease may move the row on.
+    return Task.objects.using(task._state.db).filter(
+        pk=task.pk, status=Task.STATUS_RUNNING, attempts=task.attempts
+    ).update(locked_until=None, **fields)
+
+
+def _fail(task, error):
+    now = timezone.now()
+    if task.attempts >= task.max_attempts:
+        _finish(task, status=Task.STATUS_FAILED, last_error=error, finished_at=now)
+        TASKS_RUN.inc(name=task.name, result='failed')
+        logger.error('Task %s #%s failed after %s attempts', task.name, task.pk, task.attempts)
+    else:
+        _finish(
+            task,
+            status=Task.STATUS_PENDING,
+            last_error=error,
+            run_after=now + retry_delay(task.attempts),
+        )
+        TASKS_RUN.inc(name=task.name, result='retry')
+
+
+@contextmanager
+def _transaction(alias):
+    # `default` is the inner one, so it commits before the task is marked done.
+    with transaction.atomic(using=alias):
+        if alias == DEFAULT_DB_ALIAS:
+            yield
+        else:
+            with transaction.atomic():
+                yield
+
+
+def execute(task):
+    """Run a claimed task; returns True if it completed."""
+    definition = registry.get(task.name)
+    if definition is None:
+        _finish(
+            task,
+            status=Task.STATUS_FAILED,
+            last_error=f'Unknown task {task.name!r}.',
+            finished_at=timezone.now(),
+        )
+        TASKS_RUN.inc(name=task.name, result='failed')
+        return False
+    if task.attempts > task.max_attempts:
+        # The last attempt's worker died without recording the outcome.
+        _fail(task, 'Lease expired on the final attempt.')
+        return False
+    try:
+        with _transaction(task._state.db) if definition.atomic else nullcontext():
+            definition.func(**task.payload)
+            if not _finish(task, status=Task.STATUS_DONE, finished_at=timezone.now()):
+                raise LeaseLost
+    except LeaseLost:
+        # Atomic work was rolled back; whoever holds the lease now will redo it.
+        TASKS_RUN.inc(name=task.name, result='lease_lost')
+        return False
+    except Exception:
+        logger.exception('Task %s #%s raised', task.name, task.pk)
+        _fail(task, traceback.format_exc())
+        return False
+    TASKS_RUN.inc(name=task.name, result='done')
+    return True
+
+
+def run_next():
+    """Claim and run one due task. Returns False when the queue is empty."""
+    task = claim_next()
+    if task is None:
+        return False
+    execute(task)
+    return True
+
+
+def run_pending(limit=None):
+    """Run due tasks until none are left (or `limit` were run); returns the count."""
+    count = 0
+    while (limit is None or count < limit) and run_next():
+        count += 1
+    return count
+
+
+def prune_finished(keep=None):
+    """Delete completed tasks older than `keep` seconds. Failed ones are kept for inspection."""
+    keep = settings.TASKS_KEEP_DONE_SECONDS if keep is None else keep
+    cutoff = timezone.now() - timedelta(seconds=keep)
+    deleted = 0
+    for alias in queue_databases():
+        deleted += Task.objects.using(alias).filter(
+            status=Task.STATUS_DONE, finished_at__lt=cutoff
+        ).delete()[0]
+    return deleted
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from karma.models import KarmaEvent, KarmaTotal
+from posts.models import Post
+
+from .models import Task
+from .queue import claim_next, execute, run_pending, task
+
+User = get_user_model()
+
+calls = []
+
+
+@task('tests.flaky', max_attempts=2)
+def flaky(fail):
+    calls.append(fail)
+    if fail:
+        raise RuntimeError('boom')
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.author = User.objects.create_user(username='author', password='pass1234')
+        self.liker = User.objects.create_user(username='liker', password='pass1234')
+        self.post = Post.objects.create(author=self.author, content='hello')
+        self.client.force_login(self.liker)
+
+    def test_like_karma_is_awarded_by_the_worker(self):
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertTrue(response.json()['created'])
+        self.assertFalse(KarmaEvent.objects.exists())
+        # Karma, the ranking bump and the author's notification.
+        self.assertEqual(Task.objects.filter(status=Task.STATUS_PENDING).count(), 3)
+
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(KarmaEvent.objects.filter(recipient=self.author).count(), 1)
+        self.assertEqual(KarmaTotal.objects.get(user=self.author).points, 5)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.top_score, 1)
+
+    def test_unlike_before_award_leaves_no_karma(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.delete(f'/api/posts/{self.post.id}/like/')
+        run_pending()
+        self.assertFalse(KarmaEvent.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.top_score, 0)
+
+    def test_idempotency_key_deduplicates(self):
+        flaky.enqueue(fail=False, key='once')
+        flaky.enqueue(fail=False, key='once')
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [False])
+
+    def test_failures_retry_then_fail(self):
+        flaky.enqueue(fail=True)
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            run_pending()
+        failed = Task.objects.get()
+        self.assertEqual(failed.status, Task.STATUS_PENDING)
+        self.assertIn('boom', failed.last_error)
+        self.assertGreater(failed.run_after, timezone.now())
+
+        Task.objects.update(run_after=timezone.now())
+        with self.assertLogs('tasks.queue', 'ERROR') as logs:
+            run_pending()
+        self.assertIn('failed after 2 attempts', logs.output[-1])
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, Task.STATUS_FAILED)
+        self.assertEqual(failed.attempts, 2)
+        self.assertEqual(calls, [True, True])
+
+    def test_expired_lease_is_reclaimed(self):
+        flaky.enqueue(fail=False)
+        stale = claim_next()
+        self.assertIsNone(claim_next())
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        fresh = claim_next()
+        self.assertEqual(fresh.attempts, 2)
+        # The original worker's late result is discarded.
+        self.assertFalse(execute(stale))
+        self.assertTrue(execute(fresh))
+        self.assertEqual(calls, [False, False])
+        self.assertEqual(Task.objects.get().status, Task.STATUS_DONE)
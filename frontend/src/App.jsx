@@ -13,8 +13,8 @@ function buildHeaders(auth) {
   const headers = {
     "Content-Type": "application/json"
   };
-  if (auth.username && auth.password) {
-    headers.Authorization = `Basic ${btoa(`${auth.username}:${auth.password}`)}`;
+  if (auth.token) {
+    headers.Authorization = `Token ${auth.token}`;
   }
   return headers;
 }
@@ -39,6 +39,9 @@ async function apiRequest(path, options = {}, auth = {}) {
     }
     throw new Error(text || `Request failed: ${response.status}`);
   }
+  if (response.status === 204) {
+    return null;
+  }
   return response.json();
 }
 
@@ -113,7 +116,7 @@ function CommentNode({ comment, onLikeComment, onReply, canWrite }) {
 }
 
 export default function App() {
-  const [auth, setAuth] = useState({ username: "", password: "" });
+  const [auth, setAuth] = useState({ username: "", password: "", token: "" });
   const [posts, setPosts] = useState([]);
   const [leaderboard, setLeaderboard] = useState([]);
   const [commentsByPost, setCommentsByPost] = useState({});
@@ -124,7 +127,31 @@ export default function App() {
   const [loading, setLoading] = useState(true);
   const [authDropdownOpen, setAuthDropdownOpen] = useState(false);
 
-  const canWrite = useMemo(() => auth.username && auth.password, [auth]);
+  const canWrite = useMemo(() => Boolean(auth.token), [auth]);
+
+  async function logIn() {
+    setError("");
+    try {
+      const data = await apiRequest("/auth/token/", {
+        method: "POST",
+        body: JSON.stringify({ username: auth.username, password: auth.password })
+      });
+      // Keep only the token; the password is not needed after login.
+      setAuth({ username: data.username, password: "", token: data.token });
+      setAuthDropdownOpen(false);
+    } catch (err) {
+      setError(err.message);
+    }
+  }
+
+  async function logOut() {
+    try {
+      await apiRequest("/auth/token/", { method: "DELETE" }, auth);
+    } catch (err) {
+      setError(err.message);
+    }
+    setAuth({ username: "", password: "", token: "" });
+  }
 
   async function loadFeed() {
     setLoading(true);
@@ -145,8 +172,9 @@ export default function App() {
 
   useEffect(() => {
     loadFeed();
+    // Reload on login/logout so is_liked_by_me reflects the current user.
     // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, []);
+  }, [auth.token]);
 
   async function refreshPostComments(postId) {
     const tree = await apiRequest(`/posts/${postId}/comments/tree/`, {}, auth);
@@ -248,7 +276,9 @@ export default function App() {
             {authDropdownOpen && (
               <div className="absolute right-0 top-full mt-2 w-80 rounded-lg border border-white/10 bg-slate-800/95 p-4 shadow-xl backdrop-blur-md">
                 <p className="mb-3 text-xs text-slate-400">
-                  Add Basic Auth credentials to enable post/comment likes and post creation.
+                  {canWrite
+                    ? `Logged in as ${auth.username}.`
+                    : "Log in to enable post/comment likes and post creation."}
                 </p>
                 <div className="space-y-2">
                   <input
@@ -266,12 +296,9 @@ export default function App() {
                   />
                   <button
                     className="w-full rounded-md bg-indigo-600 px-3 py-2 text-sm text-white transition-all duration-300 hover:scale-[1.01] hover:bg-indigo-500"
-                    onClick={() => {
-                      loadFeed();
-                      setAuthDropdownOpen(false);
-                    }}
+                    onClick={canWrite ? logOut : logIn}
                   >
-                    Refresh Feed
+                    {canWrite ? "Log out" : "Log in"}
                   </button>
                 </div>
               </div>